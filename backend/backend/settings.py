@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
 from pathlib import Path
+from datetime import timedelta
 import os
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -53,7 +54,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    
+    'bio.middleware.CacheRenditionsMiddleware',
 ]
 
 ROOT_URLCONF = 'backend.urls'
@@ -140,10 +141,75 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticated',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'bio.authentication.JWTSansRequete',
     ),
 }
+# Autorisation à partir des claims du jeton, sans requête (bio.authentication)
+SIMPLE_JWT = {
+    'TOKEN_USER_CLASS': 'bio.authentication.UtilisateurJeton',
+    'TOKEN_REFRESH_SERIALIZER': 'bio.serializers.MyTokenRefreshSerializer',
+}
 AUTH_USER_MODEL = 'bio.Utilisateur'
 
 MEDIA_URL = '/photos/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'backend','photos')
+
+# Cache des réponses (bio.cache_reponses) : backend fichiers, partagé par tous les workers
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache'),
+        'OPTIONS': {'MAX_ENTRIES': 5000},
+    }
+}
+CACHE_REPONSES_TIMEOUT = 300  # secondes ; les changements de données invalident avant
+
+# Exports en tâche de fond (manage.py export_worker)
+EXPORT_ROOT = os.path.join(BASE_DIR, 'exports')  # hors de MEDIA_ROOT
+EXPORT_RETENTION = 24 * 3600  # secondes de conservation d'un fichier produit
+EXPORT_TIMEOUT = 3600  # un export 'running' plus ancien est remis en attente
+DOSSIER_PDF_PROCESSUS = os.cpu_count() or 1  # processus de rendu des dossiers PDF du worker d'export
+DOSSIER_PDF_PROCESSUS_WEB = 2  # par worker web (ZIP diffusé directement) : multiplié par le nombre de workers
+EXPORT_TOKEN_LIFETIME = timedelta(minutes=15)  # jeton d'export délivré après confirmation du mot de passe
+
+# Reconnaissance faciale (InsightFace)
+FACE_MODEL_NAME = 'buffalo_l'
+FACE_DET_SIZE = (640, 640)
+FACE_MATCH_THRESHOLD = 0.6
+FACE_MODEL_PRELOAD = False  # chargement au démarrage de wsgi/asgi et d'enrollment_worker (bio.faces.prechauffer)
+FACE_MODEL_THREADS = 0  # threads ONNX par session, 0 = valeur par défaut d'onnxruntime
+FACE_SEARCH_TOP_K = 20
+FACE_SEARCH_MAX_TOP_K = 200
+FACE_BATCH_MAX_IMAGES = 50  # images par appel à api/recherche-photo/lot/
+# Photos de recherche : réduites avant détection, tailles de détection essayées dans l'ordre
+FACE_PROBE_MAX_SIDE = 1280
+FACE_PROBE_DET_SIZES = [(320, 320), (640, 640)]
+
+# Moteur de recherche photo : 'exact' (produit matriciel) ou 'ivf' (index approximatif)
+FACE_SEARCH_BACKEND = 'exact'
+FACE_INDEX_PATH = os.path.join(BASE_DIR, 'index', 'visages_ivf.npz')
+FACE_INDEX_NLIST = None  # auto : 4 * sqrt(nombre d'embeddings)
+FACE_INDEX_NPROBE = 16
+FACE_INDEX_SAVE_EVERY = 1000
+# Galerie exacte : fichier mappé en mémoire partagé par les workers
+FACE_GALLERY_PATH = os.path.join(BASE_DIR, 'index', 'galerie.bin')
+FACE_GALLERY_COMPACT_RATIO = 0.2  # compaction quand 20 % des lignes sont supprimées
+
+# Enrôlement des visages en tâche de fond (manage.py enrollment_worker)
+FACE_ENROLL_BATCH_SIZE = 16
+FACE_ENROLL_POOL_SIZE = 2
+FACE_ENROLL_MAX_ATTEMPTS = 3
+FACE_ENROLL_RETRY_DELAY = 30  # secondes, doublé à chaque nouvelle tentative
+FACE_ENROLL_TIMEOUT = 600  # une tâche 'running' plus ancienne est remise en attente
+
+# Journal d'activité (bio.journal) : écrit par lots depuis un tampon en mémoire
+JOURNAL_TAILLE_LOT = 200
+JOURNAL_INTERVALLE_MS = 500
+JOURNAL_TAILLE_MAX = 20000
+# Archives mensuelles compressées du journal (manage.py archive_activity)
+ACTIVITE_ARCHIVE_ROOT = os.path.join(BASE_DIR, 'archives', 'activites')
+ACTIVITE_RETENTION_JOURS = 180
+
+# Import en masse des fiches (bio.import_fiches)
+IMPORT_TAILLE_LOT = 500  # lignes par transaction
+IMPORT_API_MAX_LIGNES = 20000  # au-delà : manage.py import_fiches
@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
 
 application = get_wsgi_application()
+
+# modèle de visages chargé ici et non dans AppConfig.ready() : les commandes manage.py n'en ont pas besoin
+from bio.faces import prechauffer  # noqa: E402
+
+prechauffer()
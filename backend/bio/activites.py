@@ -0,0 +1,173 @@
+"""
+Journal d'activité : filtres de consultation et archives mensuelles.
+
+Au-delà de ACTIVITE_RETENTION_JOURS, les lignes sont déplacées (manage.py
+archive_activity) dans un fichier NDJSON compressé par mois,
+ACTIVITE_ARCHIVE_ROOT/activites_AAAA-MM.ndjson.gz. Chaque passage ajoute un
+membre gzip au fichier du mois ; gzip relit les membres à la suite. Les
+lignes sont écrites avant d'être supprimées : un passage interrompu peut
+laisser des doublons, que la lecture élimine par id.
+
+Les mêmes filtres (utilisateur, action, debut, fin) servent à la table et aux
+archives ; l'archive garde le nom d'utilisateur, elle reste lisible après la
+suppression du compte.
+"""
+import gzip
+import heapq
+import json
+import os
+import re
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .models import Activite
+from .statistiques import bornes_periode, filtrer_periode
+
+ACTIONS = {code for code, _ in Activite.ACTIONS}
+FICHIER = re.compile(r'^activites_(\d{4})-(\d{2})\.ndjson\.gz$')
+
+
+class FiltresInvalides(ValueError):
+    pass
+
+
+def lire_filtres(params):
+    """?utilisateur=<id ou username>&action=…&debut=AAAA-MM-JJ&fin=AAAA-MM-JJ (bornes incluses)."""
+    filtres = {}
+    utilisateur = (params.get('utilisateur') or '').strip()
+    if utilisateur:
+        filtres['utilisateur'] = int(utilisateur) if utilisateur.isdigit() else utilisateur
+    action = params.get('action')
+    if action:
+        if action not in ACTIONS:
+            raise FiltresInvalides(f"Action inconnue '{action}'.")
+        filtres['action'] = action
+    for nom in ('debut', 'fin'):
+        if params.get(nom):
+            try:
+                valeur = parse_date(params[nom])
+            except ValueError:
+                valeur = None
+            if valeur is None:
+                raise FiltresInvalides(f"Date '{nom}' invalide (AAAA-MM-JJ).")
+            filtres[nom] = valeur
+    return filtres
+
+
+def filtrer(queryset, filtres):
+    utilisateur = filtres.get('utilisateur')
+    if isinstance(utilisateur, int):
+        queryset = queryset.filter(utilisateur_id=utilisateur)
+    elif utilisateur:
+        queryset = queryset.filter(utilisateur__username=utilisateur)
+    if filtres.get('action'):
+        queryset = queryset.filter(action=filtres['action'])
+    return filtrer_periode(queryset, filtres.get('debut'), filtres.get('fin'), champ='date_heure')
+
+
+# --- Archives ---
+
+CHAMPS_ARCHIVE = ['id', 'utilisateur_id', 'utilisateur__username', 'action', 'description', 'date_heure']
+
+
+def chemin_archive(annee, mois):
+    return os.path.join(settings.ACTIVITE_ARCHIVE_ROOT, f'activites_{annee:04d}-{mois:02d}.ndjson.gz')
+
+
+def _ligne_archive(ligne):
+    return {
+        'id': ligne['id'],
+        'utilisateur_id': ligne['utilisateur_id'],
+        'utilisateur': ligne['utilisateur__username'],
+        'action': ligne['action'],
+        'description': ligne['description'],
+        'date_heure': ligne['date_heure'],
+    }
+
+
+def archiver(avant, taille_lot=5000):
+    """
+    Déplace les lignes antérieures à `avant` dans les archives mensuelles, par lots
+    (date_heure, id) croissants. Retourne {(année, mois): lignes archivées}.
+    """
+    os.makedirs(settings.ACTIVITE_ARCHIVE_ROOT, exist_ok=True)
+    archives = {}
+    queryset = Activite.objects.filter(date_heure__lt=avant).order_by('date_heure', 'id').values(*CHAMPS_ARCHIVE)
+    while True:
+        lot = list(queryset[:taille_lot])
+        if not lot:
+            return archives
+        par_mois = {}
+        for ligne in lot:
+            jour = timezone.localtime(ligne['date_heure'])
+            par_mois.setdefault((jour.year, jour.month), []).append(_ligne_archive(ligne))
+        for (annee, mois), lignes in par_mois.items():
+            with open(chemin_archive(annee, mois), 'ab') as brut:
+                with gzip.GzipFile(fileobj=brut, mode='wb') as f:
+                    f.write(''.join(
+                        json.dumps(ligne, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n' for ligne in lignes
+                    ).encode())
+                brut.flush()
+                os.fsync(brut.fileno())
+            archives[(annee, mois)] = archives.get((annee, mois), 0) + len(lignes)
+        # écrites et synchronisées : les lignes peuvent quitter la table
+        Activite.objects.filter(id__in=[ligne['id'] for ligne in lot]).delete()
+
+
+def fichiers_archives(debut=None, fin=None):
+    """Archives des mois qui recoupent [debut, fin], du plus récent au plus ancien."""
+    if not os.path.isdir(settings.ACTIVITE_ARCHIVE_ROOT):
+        return []
+    fichiers = []
+    for nom in os.listdir(settings.ACTIVITE_ARCHIVE_ROOT):
+        m = FICHIER.match(nom)
+        if not m:
+            continue
+        mois = (int(m.group(1)), int(m.group(2)))
+        if (debut and mois < (debut.year, debut.month)) or (fin and mois > (fin.year, fin.month)):
+            continue
+        fichiers.append((mois, os.path.join(settings.ACTIVITE_ARCHIVE_ROOT, nom)))
+    return [chemin for _, chemin in sorted(fichiers, reverse=True)]
+
+
+def _correspond(ligne, filtres, depuis, avant, texte):
+    utilisateur = filtres.get('utilisateur')
+    if isinstance(utilisateur, int) and ligne['utilisateur_id'] != utilisateur:
+        return False
+    if isinstance(utilisateur, str) and ligne['utilisateur'] != utilisateur:
+        return False
+    if filtres.get('action') and ligne['action'] != filtres['action']:
+        return False
+    if depuis and ligne['date_heure'] < depuis or avant and ligne['date_heure'] >= avant:
+        return False
+    return not texte or texte in ligne['description'].lower()
+
+
+def chercher_archives(filtres, texte=None, limite=500):
+    """Lignes archivées correspondant aux filtres (et au texte dans la description), les plus récentes d'abord."""
+    depuis, avant = bornes_periode(filtres.get('debut'), filtres.get('fin'))
+    texte = texte.lower() if texte else None
+    vus = set()
+
+    def lignes():
+        for chemin in fichiers_archives(filtres.get('debut'), filtres.get('fin')):
+            with gzip.open(chemin, 'rt', encoding='utf-8') as f:
+                for brut in f:
+                    ligne = json.loads(brut)
+                    if ligne['id'] in vus:
+                        continue
+                    ligne['date_heure'] = parse_datetime(ligne['date_heure'])
+                    if _correspond(ligne, filtres, depuis, avant, texte):
+                        vus.add(ligne['id'])
+                        yield ligne
+
+    return heapq.nlargest(limite, lignes(), key=lambda ligne: (ligne['date_heure'], ligne['id']))
+
+
+def date_retention(jours=None):
+    jours = settings.ACTIVITE_RETENTION_JOURS if jours is None else jours
+    return timezone.now() - timedelta(days=jours)
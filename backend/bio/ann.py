@@ -0,0 +1,270 @@
+"""
+Index approximatif (IVF) pour les galeries de visages de grande taille.
+
+Les embeddings sont répartis en nlist listes par un k-means sphérique ; une
+recherche ne score que les nprobe listes dont le centroïde est le plus proche
+du probe. L'index est persisté sur disque et tenu à jour de façon
+incrémentale à partir de la table EmbeddingVisage ; il n'est reconstruit que
+lorsque la galerie a tant grandi que ses listes sont trop peu nombreuses.
+
+Pour savoir s'il y a lieu de synchroniser sans interroger la table à chaque
+recherche, l'index est comparé à une génération gardée dans le cache Django :
+les signaux d'EmbeddingVisage (et les écritures en masse, qui n'en émettent
+pas) la renouvellent avec signaler_modification(). Comme pour les versions de
+bio.cache_reponses, un backend partagé est nécessaire avec plusieurs processus.
+"""
+import math
+import os
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Max
+from django.utils.dateparse import parse_datetime
+
+from .gallery import DIMENSION, Galerie, lire_embeddings, meilleurs_par_personne
+from .models import EmbeddingVisage
+
+
+def affecter(vecteurs, centroides, taille_lot=65536):
+    """Indice du centroïde le plus proche (produit scalaire) pour chaque vecteur."""
+    affectation = np.empty(len(vecteurs), dtype=np.int64)
+    for debut in range(0, len(vecteurs), taille_lot):
+        lot = vecteurs[debut:debut + taille_lot]
+        affectation[debut:debut + len(lot)] = np.argmax(lot @ centroides.T, axis=1)
+    return affectation
+
+
+def kmeans_spherique(matrice, nlist, n_iter=20, graine=0):
+    """Centroïdes L2-normalisés appris sur un échantillon de la galerie."""
+    rng = np.random.default_rng(graine)
+    n = len(matrice)
+    echantillon = matrice[rng.choice(n, min(n, nlist * 100), replace=False)]
+    centroides = echantillon[rng.choice(len(echantillon), nlist, replace=False)].copy()
+
+    for _ in range(n_iter):
+        affectation = affecter(echantillon, centroides)
+        ordre = np.argsort(affectation, kind='stable')
+        listes, debuts = np.unique(affectation[ordre], return_index=True)
+        sommes = np.add.reduceat(echantillon[ordre], debuts, axis=0)
+
+        nouveaux = echantillon[rng.choice(len(echantillon), nlist)].copy()  # listes vides
+        nouveaux[listes] = sommes
+        normes = np.linalg.norm(nouveaux, axis=1, keepdims=True)
+        centroides = nouveaux / np.maximum(normes, 1e-12)
+    return centroides.astype(np.float32)
+
+
+def taille_listes(n, nlist=None):
+    """nlist pour n embeddings : 4 * sqrt(n) par défaut, jamais plus que n."""
+    if nlist is None:
+        nlist = max(1, int(4 * math.sqrt(n)))
+    return max(1, min(nlist, n))
+
+
+class IndexIVF:
+    def __init__(self, centroides, model_version):
+        self.centroides = np.ascontiguousarray(centroides, dtype=np.float32)
+        self.model_version = model_version
+        nlist = len(self.centroides)
+        self.ids = [np.empty(0, dtype=np.int64) for _ in range(nlist)]
+        self.personne_ids = [np.empty(0, dtype=np.int64) for _ in range(nlist)]
+        self.champs = [np.empty(0, dtype=np.int8) for _ in range(nlist)]
+        self.vecteurs = [np.empty((0, DIMENSION), dtype=np.float32) for _ in range(nlist)]
+        self.derniere_maj = None  # date_calcul la plus récente intégrée
+        self.signature = None
+        self.modifications = 0    # depuis la dernière sauvegarde
+        # les recherches lisent les listes pendant qu'une synchro les remplace
+        self._verrou = threading.RLock()
+
+    def __len__(self):
+        return sum(len(ids) for ids in self.ids)
+
+    @property
+    def nlist(self):
+        return len(self.centroides)
+
+    @classmethod
+    def construire(cls, galerie, model_version, nlist=None, n_iter=20):
+        n = len(galerie)
+        nlist = taille_listes(n, nlist)
+        if n:
+            centroides = kmeans_spherique(galerie.matrice, nlist, n_iter=n_iter)
+        else:
+            centroides = np.zeros((1, DIMENSION), dtype=np.float32)
+        index = cls(centroides, model_version)
+        index.ajouter(galerie.ids, galerie.personne_ids, galerie.champs, galerie.matrice)
+        return index
+
+    def ajouter(self, ids, personne_ids, champs, vecteurs):
+        """Insère (ou remplace) des embeddings dans la liste de leur centroïde."""
+        if not len(ids):
+            return
+        affectation = affecter(vecteurs, self.centroides)
+        with self._verrou:
+            self.supprimer(ids)
+            for liste in np.unique(affectation):
+                m = affectation == liste
+                self.ids[liste] = np.concatenate([self.ids[liste], ids[m]])
+                self.personne_ids[liste] = np.concatenate([self.personne_ids[liste], personne_ids[m]])
+                self.champs[liste] = np.concatenate([self.champs[liste], champs[m]])
+                self.vecteurs[liste] = np.concatenate([self.vecteurs[liste], vecteurs[m]])
+            self.modifications += len(ids)
+
+    def supprimer(self, ids):
+        ids = np.asarray(ids, dtype=np.int64)
+        if not len(ids):
+            return
+        with self._verrou:
+            for liste in range(self.nlist):
+                if not len(self.ids[liste]):
+                    continue
+                garder = ~np.isin(self.ids[liste], ids)
+                if garder.all():
+                    continue
+                self.ids[liste] = self.ids[liste][garder]
+                self.personne_ids[liste] = self.personne_ids[liste][garder]
+                self.champs[liste] = self.champs[liste][garder]
+                self.vecteurs[liste] = self.vecteurs[liste][garder]
+                self.modifications += int((~garder).sum())
+
+    def rechercher(self, probe, top_k=10, seuil=0.6, nprobe=None):
+        """Même contrat que Galerie.rechercher, limité aux nprobe listes les plus proches."""
+        probe = np.asarray(probe, dtype=np.float32)
+        nprobe = min(nprobe or settings.FACE_INDEX_NPROBE, self.nlist)
+        proches = np.argpartition(-(self.centroides @ probe), nprobe - 1)[:nprobe]
+        # instantané cohérent des listes (références seulement) ; le calcul se fait hors verrou
+        with self._verrou:
+            listes = [
+                (self.vecteurs[liste], self.personne_ids[liste], self.champs[liste])
+                for liste in proches if len(self.ids[liste])
+            ]
+        if not listes:
+            return []
+
+        scores = np.concatenate([vecteurs @ probe for vecteurs, _, _ in listes])
+        personne_ids = np.concatenate([personne_ids for _, personne_ids, _ in listes])
+        champs = np.concatenate([champs for _, _, champs in listes])
+        return meilleurs_par_personne(scores, personne_ids, champs, top_k, seuil)
+
+    def a_reentrainer(self, nlist=None):
+        """Vrai quand la galerie justifie au moins deux fois plus de listes que l'index n'en a."""
+        return 2 * self.nlist <= taille_listes(len(self), nlist)
+
+    def synchroniser(self):
+        """Intègre les embeddings ajoutés, recalculés ou supprimés depuis la dernière synchro."""
+        queryset = EmbeddingVisage.objects.filter(model_version=self.model_version)
+        borne = queryset.aggregate(m=Max('date_calcul'))['m']
+        nouveaux = queryset
+        if self.derniere_maj is not None:
+            nouveaux = queryset.filter(date_calcul__gte=self.derniere_maj)
+        self.ajouter(*lire_embeddings(nouveaux))
+        self.derniere_maj = borne
+
+        if len(self) != queryset.count():
+            en_base = np.fromiter(
+                queryset.values_list('id', flat=True).iterator(chunk_size=10000), dtype=np.int64
+            )
+            self.supprimer(np.setdiff1d(np.concatenate(self.ids), en_base))
+
+    def sauvegarder(self, chemin):
+        """Écrit l'index dans un fichier temporaire puis le renomme (atomique)."""
+        os.makedirs(os.path.dirname(chemin), exist_ok=True)
+        tmp = f"{chemin}.{os.getpid()}.tmp"
+        with open(tmp, 'wb') as f:
+            np.savez(
+                f,
+                centroides=self.centroides,
+                tailles=np.array([len(ids) for ids in self.ids], dtype=np.int64),
+                ids=np.concatenate(self.ids),
+                personne_ids=np.concatenate(self.personne_ids),
+                champs=np.concatenate(self.champs),
+                vecteurs=np.concatenate(self.vecteurs),
+                model_version=np.array(self.model_version),
+                derniere_maj=np.array(self.derniere_maj.isoformat() if self.derniere_maj else ''),
+            )
+        os.replace(tmp, chemin)
+        self.modifications = 0
+
+    @classmethod
+    def charger(cls, chemin):
+        with np.load(chemin) as d:
+            index = cls(d['centroides'], str(d['model_version']))
+            coupures = np.cumsum(d['tailles'])[:-1]
+            index.ids = np.split(d['ids'], coupures)
+            index.personne_ids = np.split(d['personne_ids'], coupures)
+            index.champs = np.split(d['champs'], coupures)
+            index.vecteurs = np.split(d['vecteurs'], coupures)
+            index.derniere_maj = parse_datetime(str(d['derniere_maj'])) or None
+        return index
+
+
+def construire_index(model_version, nlist=None, n_iter=20):
+    """Construit l'index complet à partir de la table des embeddings."""
+    borne = EmbeddingVisage.objects.filter(
+        model_version=model_version
+    ).aggregate(m=Max('date_calcul'))['m']
+    index = IndexIVF.construire(
+        Galerie.depuis_base(model_version), model_version,
+        nlist=nlist or settings.FACE_INDEX_NLIST, n_iter=n_iter,
+    )
+    index.derniere_maj = borne
+    return index
+
+
+_index = None
+_verrou = threading.Lock()
+GENERATION = 'bio:ann:generation'
+
+
+def signaler_modification():
+    """Nouvelle génération de la table des embeddings : les index des processus se synchroniseront."""
+    cache.set(GENERATION, time.time(), None)
+
+
+def generation():
+    valeur = cache.get(GENERATION)
+    if valeur is None:
+        # clé absente (cache vidé) : une valeur neuve force une synchronisation
+        valeur = time.time()
+        if not cache.add(GENERATION, valeur, None):
+            valeur = cache.get(GENERATION, valeur)
+    return valeur
+
+
+def get_index():
+    """
+    Index IVF du processus : chargé depuis FACE_INDEX_PATH (ou construit s'il
+    manque), puis synchronisé quand la table des embeddings change.
+    """
+    global _index
+    model_version = settings.FACE_MODEL_NAME
+    chemin = str(settings.FACE_INDEX_PATH)
+    signature = generation()
+
+    with _verrou:
+        if _index is None or _index.model_version != model_version:
+            index = None
+            if os.path.exists(chemin):
+                index = IndexIVF.charger(chemin)
+                if index.model_version != model_version:
+                    index = None
+            if index is None:
+                index = construire_index(model_version)
+                index.sauvegarder(chemin)
+            _index = index
+
+        if _index.signature != signature:
+            _index.synchroniser()
+            _index.signature = signature
+            if _index.a_reentrainer(settings.FACE_INDEX_NLIST):
+                # centroïdes appris sur une galerie bien plus petite (une seule liste si elle était vide)
+                index = construire_index(model_version)
+                index.signature = signature
+                index.sauvegarder(chemin)
+                _index = index
+            elif _index.modifications >= settings.FACE_INDEX_SAVE_EVERY:
+                _index.sauvegarder(chemin)
+    return _index
@@ -5,5 +5,5 @@ class BioConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'bio'
 
-def ready(self):
-    import bio.signals
+    def ready(self):
+        import bio.signals
@@ -0,0 +1,106 @@
+"""
+Authentification JWT sans requête en base.
+
+Le rôle, les codes de permission et les drapeaux staff/superuser sont écrits
+dans le jeton à sa délivrance (MyTokenObtainPairSerializer.get_token) ; chaque
+requête est ensuite autorisée à partir de ces claims, sans relire
+l'utilisateur. request.user est alors un UtilisateurJeton : pour un
+enregistrement qui pointe vers l'utilisateur, passer par son id
+(created_by_id=request.user.pk).
+
+Révocation : chaque utilisateur a un compteur (Utilisateur.version_jetons),
+copié dans le claim 'ver'. Un changement de rôle, de permissions, de mot de
+passe ou d'état du compte l'incrémente (voir signals.py) ; les jetons émis
+avant sont alors refusés, y compris au rafraîchissement. Le compteur est lu
+dans le cache partagé, la base n'est consultée qu'en cas d'absence.
+"""
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.utils.functional import cached_property
+from rest_framework_simplejwt.authentication import JWTStatelessUserAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings
+
+CLAIM_ROLE = 'role'
+CLAIM_PERMISSIONS = 'perms'
+CLAIM_VERSION = 'ver'
+PREFIXE = 'bio:jetons:version'
+
+
+def _cle(user_id):
+    return f'{PREFIXE}:{user_id}'
+
+
+def version_jetons(user_id):
+    """Version courante des jetons de l'utilisateur (cache, puis base si absente)."""
+    version = cache.get(_cle(user_id))
+    if version is None:
+        from .models import Utilisateur
+        version = Utilisateur.objects.filter(pk=user_id).values_list('version_jetons', flat=True).first()
+        if version is None:
+            return None  # utilisateur supprimé
+        cache.set(_cle(user_id), version, None)
+    return version
+
+
+def revoquer_jetons(user_id):
+    """Invalide tous les jetons déjà émis pour l'utilisateur ; retourne la nouvelle version."""
+    from .models import Utilisateur
+    Utilisateur.objects.filter(pk=user_id).update(version_jetons=F('version_jetons') + 1)
+    cache.delete(_cle(user_id))
+    # une lecture concurrente a pu remettre l'ancienne valeur avant la validation
+    transaction.on_commit(lambda: cache.delete(_cle(user_id)))
+    return Utilisateur.objects.filter(pk=user_id).values_list('version_jetons', flat=True).first()
+
+
+def jeton_a_jour(token):
+    version = version_jetons(token.get(api_settings.USER_ID_CLAIM))
+    return version is not None and token.get(CLAIM_VERSION) == version
+
+
+class RoleJeton:
+    """Remplace Role pour le code qui lit user.role.name."""
+    def __init__(self, name):
+        self.name = name
+
+    def __str__(self):
+        return self.name
+
+
+class UtilisateurJeton(TokenUser):
+    """Utilisateur reconstruit à partir des claims du jeton, sans accès à la base."""
+
+    @cached_property
+    def id(self):
+        return int(self.token[api_settings.USER_ID_CLAIM])
+
+    @cached_property
+    def pk(self):
+        return self.id
+
+    @cached_property
+    def role(self):
+        nom = self.token.get(CLAIM_ROLE)
+        return RoleJeton(nom) if nom else None
+
+    @cached_property
+    def codes_permissions(self):
+        return frozenset(self.token.get(CLAIM_PERMISSIONS, ()))
+
+    def has_permission(self, perm_code):
+        # même règle que Utilisateur.has_permission
+        return perm_code in self.codes_permissions or self.is_superuser
+
+    def get_username(self):
+        return self.username
+
+
+class JWTSansRequete(JWTStatelessUserAuthentication):
+    """JWTAuthentication sans chargement de l'utilisateur ; refuse les jetons révoqués."""
+
+    def get_user(self, validated_token):
+        if not jeton_a_jour(validated_token):
+            raise InvalidToken("Jeton révoqué, veuillez vous reconnecter.")
+        return super().get_user(validated_token)
@@ -0,0 +1,121 @@
+"""
+Cache des réponses GET (tableau de bord, premières pages de liste, /me).
+
+Chaque réponse est rangée sous une clé qui contient le rôle (et l'utilisateur
+si la réponse lui est propre) et les versions des données dont elle dépend.
+Une version est l'horodatage du dernier changement de ces données : les
+signaux la renouvellent (invalider), ce qui rend les anciennes clés
+inatteignables sans avoir à les énumérer. Elle sert aussi de Last-Modified ;
+l'ETag est le hash du contenu, ce qui permet de répondre 304 aux GET
+conditionnels sans rien recalculer.
+
+Avec plusieurs processus, utiliser un backend partagé (fichiers, voir CACHES) :
+les versions doivent être vues de tous les workers.
+"""
+import functools
+import hashlib
+import json
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+PREFIXE = 'bio:reponse'
+
+_compteurs = defaultdict(lambda: {'hits': 0, 'misses': 0, 'not_modified': 0})
+_verrou = threading.Lock()
+
+
+def _compter(nom, evenement):
+    with _verrou:
+        _compteurs[nom][evenement] += 1
+
+
+def stats_cache():
+    """Compteurs hit/miss/304 par réponse, pour ce processus."""
+    with _verrou:
+        stats = {nom: dict(c) for nom, c in _compteurs.items()}
+    for c in stats.values():
+        total = c['hits'] + c['misses']
+        c['taux_hit'] = round(c['hits'] / total, 3) if total else None
+    return stats
+
+
+def invalider(*portees):
+    """Nouvelle version des données : les réponses qui en dépendent seront recalculées."""
+    maintenant = time.time()
+    cache.set_many({f'{PREFIXE}:version:{p}': maintenant for p in portees}, None)
+
+
+def versions(portees):
+    cles = [f'{PREFIXE}:version:{p}' for p in portees]
+    connues = cache.get_many(cles)
+    manquantes = {cle: time.time() for cle in cles if cle not in connues}
+    for cle, valeur in manquantes.items():
+        # add : un autre processus a pu l'initialiser entre-temps
+        if not cache.add(cle, valeur, None):
+            valeur = cache.get(cle, valeur)
+        connues[cle] = valeur
+    return [connues[cle] for cle in cles]
+
+
+def _etag(data):
+    contenu = json.dumps(data, cls=JSONEncoder, sort_keys=True, ensure_ascii=False).encode()
+    return f'"{hashlib.md5(contenu).hexdigest()}"'
+
+
+def reponse_en_cache(nom, portees=('fiches',), par_utilisateur=False, condition=None):
+    """
+    Décorateur de vue DRF (fonction ou méthode) pour les GET.
+    `portees` : données dont dépend la réponse ; '{user}' est remplacé par l'id de l'utilisateur.
+    `condition(request)` : si fourni et faux, la requête n'est pas mise en cache.
+    """
+    def decorateur(vue):
+        @functools.wraps(vue)
+        def wrapper(*args, **kwargs):
+            request = next(a for a in args if isinstance(a, Request))
+            if request.method != 'GET' or (condition and not condition(request)):
+                return vue(*args, **kwargs)
+
+            user = request.user
+            role = user.role.name if getattr(user, 'role', None) else '-'
+            if user.is_superuser:
+                role = f'{role}+su'
+            vers = versions([p.format(user=user.pk) for p in portees])
+            requete = hashlib.md5(request.get_full_path().encode()).hexdigest()
+            cle = ':'.join([
+                PREFIXE, nom, role, str(user.pk) if par_utilisateur else '*',
+                '-'.join(repr(v) for v in vers), requete,
+            ])
+
+            entree = cache.get(cle)
+            if entree is None:
+                _compter(nom, 'misses')
+                response = vue(*args, **kwargs)
+                if response.status_code != 200:
+                    return response
+                entree = {'data': response.data, 'etag': _etag(response.data)}
+                cache.set(cle, entree, settings.CACHE_REPONSES_TIMEOUT)
+            else:
+                _compter(nom, 'hits')
+                response = Response(entree['data'])
+
+            response['ETag'] = entree['etag']
+            response['Last-Modified'] = http_date(int(max(vers)))
+            patch_cache_control(response, private=True, no_cache=True)
+            patch_vary_headers(response, ['Authorization'])
+            conditionnelle = get_conditional_response(
+                request, etag=entree['etag'], last_modified=int(max(vers)), response=response,
+            )
+            if conditionnelle is not response:
+                _compter(nom, 'not_modified')
+            return conditionnelle
+        return wrapper
+    return decorateur
@@ -0,0 +1,160 @@
+"""
+Mise en page PDF d'un dossier individuel (reportlab).
+
+Module volontairement sans Django : il est importé par les processus du pool
+de rendu (bio.dossiers), qui ne reçoivent que des dicts et des chemins de
+fichiers et ne touchent jamais à la base.
+"""
+import io
+
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+from reportlab.lib.units import cm
+from reportlab.lib.utils import ImageReader
+from reportlab.platypus import Image, Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+from xml.sax.saxutils import escape
+
+LARGEUR_PHOTO = 4.5 * cm
+HAUTEUR_PHOTO = 6 * cm
+
+# (titre, [(libellé, clé dans les données)])
+SECTIONS = [
+    ("État civil", [
+        ("Nom", 'nom'), ("Prénoms", 'prenom'), ("Surnom", 'surnom'), ("Genre", 'genre'),
+        ("Date de naissance", 'date_naissance'), ("Lieu de naissance", 'lieu_naissance'),
+        ("Nationalité", 'nationalite'), ("Domicile", 'domicile'), ("Profession", 'profession'),
+        ("Père", 'filiation_pere'), ("Mère", 'filiation_mere'), ("Nom d'épouse", 'nom_epouse'),
+    ]),
+    ("Signalement", [
+        ("Taille", 'dactyloscopique.taille'), ("Corpulence", 'dactyloscopique.corpulance'),
+        ("Cheveux", 'dactyloscopique.cheveux'), ("Visage", 'dactyloscopique.visage'),
+        ("Ethnie", 'dactyloscopique.ethnie'), ("Marques particulières", 'anthropometrique.marque_particuliere'),
+    ]),
+    ("Fiche anthropométrique", [
+        ("Unité d'origine", 'anthropometrique.unite_origine'), ("Numéro", 'anthropometrique.numero'),
+        ("Région", 'anthropometrique.region'), ("Province", 'anthropometrique.province'),
+        ("Arrondissement", 'anthropometrique.arrondissement'), ("Faits", 'anthropometrique.faits'),
+        ("Véhicule / zone d'action", 'anthropometrique.vehicule_zone_action'),
+    ]),
+    ("Fiche dactyloscopique", [
+        ("CIN", 'dactyloscopique.cin'), ("Contact", 'dactyloscopique.contact'),
+        ("Service militaire", 'dactyloscopique.service_militaire'),
+        ("Contact épouse", 'dactyloscopique.contact_epouse'), ("Motifs", 'dactyloscopique.motifs'),
+        ("Date et lieu d'arrestation", 'dactyloscopique.date_lieu_arrestation'),
+        ("Unité d'arrestation", 'dactyloscopique.unite_arrestation'), ("NRPV", 'dactyloscopique.nrpv'),
+        ("Par", 'dactyloscopique.par'),
+    ]),
+]
+# textes libres, sur toute la largeur de la grille
+CHAMPS_LONGS = {
+    'domicile', 'anthropometrique.faits', 'anthropometrique.marque_particuliere',
+    'anthropometrique.vehicule_zone_action', 'dactyloscopique.motifs', 'dactyloscopique.date_lieu_arrestation',
+}
+PHOTOS = [("Face", 'photo_face'), ("Profil", 'photo_profil'), ("En pied", 'photo_longue')]
+
+_styles = getSampleStyleSheet()
+STYLE_TITRE = ParagraphStyle('titre', parent=_styles['Title'], fontSize=16, spaceAfter=4)
+STYLE_SOUS_TITRE = ParagraphStyle('sous_titre', parent=_styles['Normal'], alignment=1, textColor=colors.grey)
+STYLE_SECTION = ParagraphStyle('section', parent=_styles['Heading3'], spaceBefore=6, spaceAfter=2)
+STYLE_LIBELLE = ParagraphStyle('libelle', parent=_styles['Normal'], fontName='Helvetica-Bold', fontSize=9)
+STYLE_VALEUR = ParagraphStyle('valeur', parent=_styles['Normal'], fontSize=9, leading=11)
+
+
+def _texte(valeur):
+    if valeur in (None, ''):
+        return '—'
+    return escape(str(valeur)).replace('\n', '<br/>')
+
+
+def _photo(chemin):
+    if not chemin:
+        return Paragraph("Pas de photo", STYLE_SOUS_TITRE)
+    try:
+        largeur, hauteur = ImageReader(chemin).getSize()  # ouvre le fichier : erreur ici plutôt qu'au rendu
+    except (OSError, IOError):
+        return Paragraph("Photo illisible", STYLE_SOUS_TITRE)
+    # réduite pour tenir dans le cadre, proportions conservées
+    echelle = min(LARGEUR_PHOTO / largeur, HAUTEUR_PHOTO / hauteur)
+    return Image(chemin, width=largeur * echelle, height=hauteur * echelle)
+
+
+def _bloc_photos(donnees):
+    photos = [_photo(donnees['photos'].get(champ)) for _, champ in PHOTOS]
+    libelles = [Paragraph(libelle, STYLE_SOUS_TITRE) for libelle, _ in PHOTOS]
+    table = Table([photos, libelles], colWidths=[LARGEUR_PHOTO + 0.6 * cm] * 3, rowHeights=[HAUTEUR_PHOTO + 0.4 * cm, None])
+    table.setStyle(TableStyle([
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('VALIGN', (0, 0), (-1, 0), 'MIDDLE'),
+        ('BOX', (0, 0), (-1, 0), 0.5, colors.grey),
+        ('INNERGRID', (0, 0), (-1, 0), 0.5, colors.grey),
+    ]))
+    return table
+
+
+def _bloc_section(donnees, champs):
+    """Grille libellé/valeur sur deux colonnes ; les textes longs occupent toute la largeur."""
+    lignes, spans, courts = [], [], []
+
+    def vider_courts():
+        while courts:
+            paire, courts[:] = courts[:2], courts[2:]
+            ligne = []
+            for libelle, cle in paire:
+                ligne += [Paragraph(libelle, STYLE_LIBELLE), Paragraph(_texte(donnees.get(cle)), STYLE_VALEUR)]
+            lignes.append(ligne + [''] * (4 - len(ligne)))
+
+    for libelle, cle in champs:
+        if cle in CHAMPS_LONGS:
+            vider_courts()
+            spans.append(('SPAN', (1, len(lignes)), (3, len(lignes))))
+            lignes.append([Paragraph(libelle, STYLE_LIBELLE), Paragraph(_texte(donnees.get(cle)), STYLE_VALEUR), '', ''])
+        else:
+            courts.append((libelle, cle))
+    vider_courts()
+
+    # splitInRow : un texte long (faits, motifs) peut continuer sur la page suivante
+    table = Table(lignes, colWidths=[3.2 * cm, 5.3 * cm] * 2, splitInRow=1)
+    table.setStyle(TableStyle([
+        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+        ('TOPPADDING', (0, 0), (-1, -1), 1),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 2),
+        ('LINEBELOW', (0, 0), (-1, -1), 0.25, colors.lightgrey),
+        ('BACKGROUND', (0, 0), (0, -1), colors.whitesmoke),
+        ('BACKGROUND', (2, 0), (2, -1), colors.whitesmoke),
+        *spans,
+    ]))
+    return table
+
+
+def rendre_dossier(donnees):
+    """
+    PDF du dossier d'une personne. `donnees` : valeurs à plat (clés 'fiche.champ'
+    pour les fiches liées) et 'photos' {champ: chemin}. Retourne (nom, octets, pages).
+    """
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(
+        buffer, pagesize=A4, leftMargin=2 * cm, rightMargin=2 * cm, topMargin=1.2 * cm, bottomMargin=1.5 * cm,
+        title=f"Dossier {donnees['id']}",
+    )
+    nom_complet = ' '.join(filter(None, [donnees.get('nom'), donnees.get('prenom')])) or f"Personne {donnees['id']}"
+    elements = [
+        Paragraph("FICHE SIGNALÉTIQUE", STYLE_TITRE),
+        Paragraph(f"{escape(nom_complet)} — dossier n° {donnees['id']}", STYLE_SOUS_TITRE),
+        Spacer(1, 0.4 * cm),
+        _bloc_photos(donnees),
+    ]
+    for titre, champs in SECTIONS:
+        elements.append(Paragraph(titre, STYLE_SECTION))
+        elements.append(_bloc_section(donnees, champs))
+
+    pages = []
+
+    def pied_de_page(canvas, doc):
+        canvas.setFont('Helvetica', 8)
+        canvas.setFillColor(colors.grey)
+        canvas.drawRightString(A4[0] - 2 * cm, 1 * cm, f"Dossier {donnees['id']} — page {doc.page}")
+        pages.append(doc.page)
+
+    doc.build(elements, onFirstPage=pied_de_page, onLaterPages=pied_de_page)
+    return f"dossier_{donnees['id']}.pdf", buffer.getvalue(), len(pages)
@@ -0,0 +1,166 @@
+"""
+Dossiers PDF individuels : lecture des fiches par lots, rendu en parallèle
+dans un pool de processus (bio.dossier_pdf), livraison en ZIP diffusé au fil
+de l'eau.
+
+Les photos insérées sont les aperçus (renditions 'preview', 512 px) : déjà
+réduites et orientées, elles sont générées une fois si elles manquent puis
+resservies aux exports suivants.
+"""
+import json
+import multiprocessing
+import threading
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.utils import timezone
+
+from .dossier_pdf import rendre_dossier
+from .exports import lire_lots
+from .faces import CHAMPS_PHOTO
+from .models import Personne, RenditionPhoto
+from .renditions import generer_renditions
+
+DOSSIERS_PAR_LOT = 32
+
+_pool = None
+_processus = None
+_verrou_pool = threading.Lock()
+
+
+def configurer_pool(processus):
+    """Taille du pool de ce processus, à fixer avant le premier rendu (export_worker)."""
+    global _processus
+    with _verrou_pool:
+        if _pool is None:
+            _processus = processus
+
+
+def taille_pool():
+    # par défaut, le petit pool des workers web : chacun a le sien, ils sont plusieurs
+    return _processus or settings.DOSSIER_PDF_PROCESSUS_WEB
+
+
+def get_pool():
+    """Pool de rendu créé au premier usage puis gardé par le processus."""
+    global _pool
+    if _pool is None:
+        with _verrou_pool:
+            if _pool is None:
+                # spawn : les processus de rendu ne partagent ni connexions ni threads du worker web
+                _pool = ProcessPoolExecutor(
+                    max_workers=taille_pool(),
+                    mp_context=multiprocessing.get_context('spawn'),
+                )
+    return _pool
+
+
+def _valeur(valeur):
+    if isinstance(valeur, datetime):
+        if timezone.is_aware(valeur):
+            valeur = timezone.localtime(valeur)
+        return valeur.strftime('%d/%m/%Y %H:%M')
+    if isinstance(valeur, date):
+        return valeur.strftime('%d/%m/%Y')
+    return valeur
+
+
+def chemins_photos(lignes):
+    """{personne_id: {champ: chemin de l'aperçu}} ; les aperçus manquants sont générés et gardés."""
+    ids = [ligne['id'] for ligne in lignes]
+    apercus = {}
+    for personne_id, champ, fichier in RenditionPhoto.objects.filter(
+        personne_id__in=ids, type=RenditionPhoto.PREVIEW
+    ).values_list('personne_id', 'champ', 'fichier'):
+        apercus.setdefault(personne_id, {})[champ] = default_storage.path(fichier)
+
+    manquants = [
+        ligne['id'] for ligne in lignes
+        if any(ligne[champ] and champ not in apercus.get(ligne['id'], {}) for champ in CHAMPS_PHOTO)
+    ]
+    for personne in Personne.objects.filter(id__in=manquants).only('id', *CHAMPS_PHOTO):
+        champs = [c for c in CHAMPS_PHOTO if getattr(personne, c) and c not in apercus.get(personne.id, {})]
+        try:
+            generer_renditions(personne, champs)
+        except (OSError, ValueError):
+            continue  # photo illisible : le dossier l'indiquera
+        for rendition in RenditionPhoto.objects.filter(personne=personne, champ__in=champs, type=RenditionPhoto.PREVIEW):
+            apercus.setdefault(personne.id, {})[rendition.champ] = rendition.fichier.path
+    return apercus
+
+
+def donnees_dossiers(lignes):
+    """Lignes de bio.exports.lire_lots -> dicts sérialisables envoyés au pool."""
+    photos = chemins_photos(lignes)
+    return [
+        {
+            **{cle.replace('__', '.'): _valeur(valeur) for cle, valeur in ligne.items()},
+            'photos': photos.get(ligne['id'], {}),
+        }
+        for ligne in lignes
+    ]
+
+
+def dossier(personne_id):
+    """(nom, octets, pages) du dossier d'une seule personne, rendu dans le processus courant."""
+    for lot in lire_lots(Personne.objects.filter(id=personne_id)):
+        return rendre_dossier(donnees_dossiers(lot)[0])
+    return None
+
+
+def rendre_dossiers(queryset, progression=None):
+    """(nom, octets, pages) de chaque personne, dans l'ordre des ids ; un lot en cours de rendu à la fois."""
+    pool = get_pool()
+    for lot in lire_lots(queryset, taille=DOSSIERS_PAR_LOT):
+        yield from pool.map(rendre_dossier, donnees_dossiers(lot), chunksize=4)
+        if progression:
+            progression(len(lot))
+
+
+class _FluxZip:
+    """Sortie non « seekable » de zipfile : les octets écrits sont repris par le générateur."""
+    def __init__(self):
+        self.morceaux = []
+
+    def write(self, data):
+        self.morceaux.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def vider(self):
+        data = b''.join(self.morceaux)
+        self.morceaux = []
+        return data
+
+
+def flux_zip(queryset, progression=None):
+    """
+    ZIP des dossiers diffusé au fil du rendu, terminé par rapport.json
+    (dossiers, pages, durée, pages par seconde).
+    """
+    sortie = _FluxZip()
+    debut = time.perf_counter()
+    dossiers = pages = 0
+    # PDF déjà compressés : stockés tels quels
+    with zipfile.ZipFile(sortie, 'w', compression=zipfile.ZIP_STORED) as archive:
+        for nom, octets, nb_pages in rendre_dossiers(queryset, progression):
+            archive.writestr(nom, octets)
+            dossiers += 1
+            pages += nb_pages
+            yield sortie.vider()
+        duree = time.perf_counter() - debut
+        rapport = {
+            'dossiers': dossiers,
+            'pages': pages,
+            'duree_s': round(duree, 2),
+            'pages_par_seconde': round(pages / duree, 1) if duree else None,
+            'processus': taille_pool(),
+        }
+        archive.writestr('rapport.json', json.dumps(rapport, indent=2))
+    yield sortie.vider()
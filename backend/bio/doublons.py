@@ -0,0 +1,126 @@
+"""
+Détection des doublons probables à la création d'une fiche.
+
+Les candidats ne sont cherchés que dans des « blocs » indexés, calculés à
+l'enregistrement (Personne.calculer_cles, FicheDactyloscopique.save) :
+même code phonétique de nom et de prénom, même nom et même année de
+naissance, même prénom et même année, ou même CIN normalisé. Seuls ces
+quelques candidats sont ensuite comparés finement, la requête reste donc
+en temps constant quelle que soit la taille de la table.
+"""
+from difflib import SequenceMatcher
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Q
+
+from .faces import normaliser, vecteur_depuis_bytes
+from .models import EmbeddingVisage, FicheDactyloscopique, Personne
+from .texte import normaliser_texte
+
+MAX_CANDIDATS = 200
+SEUIL_DOUBLON = 0.5
+POIDS = {
+    'nom': 0.35,
+    'prenom': 0.25,
+    'date_naissance': 0.2,
+    'cin': 0.5,
+    'visage': 0.3,
+}
+CHAMPS_CANDIDAT = (
+    'id', 'nom', 'prenom', 'date_naissance', 'cle_nom', 'cle_prenom', 'dactyloscopique__cin_normalise',
+)
+
+
+def _similarite(a, b):
+    a, b = normaliser_texte(a), normaliser_texte(b)
+    if not a or not b:
+        return 0.0
+    return SequenceMatcher(None, a, b).ratio()
+
+
+def candidats(personne, cin_normalise=''):
+    """Lignes des personnes partageant au moins un bloc avec `personne` (clés déjà calculées)."""
+    blocs = Q(pk__in=[])
+    if personne.cle_nom and personne.cle_prenom:
+        blocs |= Q(cle_nom=personne.cle_nom, cle_prenom=personne.cle_prenom)
+    if personne.annee_naissance:
+        if personne.cle_nom:
+            blocs |= Q(cle_nom=personne.cle_nom, annee_naissance=personne.annee_naissance)
+        if personne.cle_prenom:
+            blocs |= Q(cle_prenom=personne.cle_prenom, annee_naissance=personne.annee_naissance)
+    if cin_normalise:
+        # sous-requête séparée : l'index de cin_normalise reste utilisable malgré le OR
+        blocs |= Q(id__in=list(
+            FicheDactyloscopique.objects.filter(cin_normalise=cin_normalise).values_list('personne_id', flat=True)[:MAX_CANDIDATS]
+        ))
+    return list(
+        Personne.objects.filter(blocs).exclude(pk=personne.pk)
+        .values(*CHAMPS_CANDIDAT)[:MAX_CANDIDATS]
+    )
+
+
+def _date(valeur):
+    return valeur.isoformat() if valeur else None
+
+
+def similarites_visage(face, personne_ids):
+    """Meilleure similarité cosinus entre un visage et les embeddings stockés de chaque personne."""
+    embeddings = EmbeddingVisage.objects.filter(
+        personne_id__in=personne_ids, model_version=settings.FACE_MODEL_NAME
+    ).values_list('personne_id', 'vecteur')
+    probe = normaliser(face.embedding)
+    meilleures = {}
+    for personne_id, vecteur in embeddings:
+        score = float(np.dot(vecteur_depuis_bytes(vecteur), probe))
+        meilleures[personne_id] = max(score, meilleures.get(personne_id, -1.0))
+    return meilleures
+
+
+def chercher_doublons(personne, cin_normalise='', face=None, limite=10):
+    """
+    Doublons probables de `personne`, du plus au moins probable :
+    [{id, nom, prenom, date_naissance, score, motifs, similarite_visage}, ...].
+    `face` (visage détecté sur la photo de face) confirme ou départage les candidats.
+    """
+    lignes = candidats(personne, cin_normalise)
+    visages = similarites_visage(face, [l['id'] for l in lignes]) if face is not None and lignes else {}
+
+    resultats = []
+    for ligne in lignes:
+        motifs = []
+        score = POIDS['nom'] * _similarite(personne.nom, ligne['nom'])
+        score += POIDS['prenom'] * _similarite(personne.prenom, ligne['prenom'])
+        if personne.cle_nom and ligne['cle_nom'] == personne.cle_nom:
+            motifs.append('nom')
+        if personne.cle_prenom and ligne['cle_prenom'] == personne.cle_prenom:
+            motifs.append('prenom')
+        if ligne['date_naissance'] and personne.annee_naissance:
+            if ligne['date_naissance'] == personne.date_naissance:
+                score += POIDS['date_naissance']
+                motifs.append('date_naissance')
+            elif ligne['date_naissance'].year == personne.annee_naissance:
+                score += POIDS['date_naissance'] / 2
+                motifs.append('annee_naissance')
+        if cin_normalise and ligne['dactyloscopique__cin_normalise'] == cin_normalise:
+            score += POIDS['cin']
+            motifs.append('cin')
+        similarite_visage = visages.get(ligne['id'])
+        if similarite_visage is not None and similarite_visage >= settings.FACE_MATCH_THRESHOLD:
+            score += POIDS['visage']
+            motifs.append('visage')
+
+        if score < SEUIL_DOUBLON and 'cin' not in motifs:
+            continue
+        resultats.append({
+            'id': ligne['id'],
+            'nom': ligne['nom'],
+            'prenom': ligne['prenom'],
+            'date_naissance': _date(ligne['date_naissance']),
+            'score': round(min(score, 1.0), 3),
+            'motifs': motifs,
+            'similarite_visage': None if similarite_visage is None else round(similarite_visage, 4),
+        })
+
+    resultats.sort(key=lambda r: (-r['score'], -r['id']))
+    return resultats[:limite]
@@ -0,0 +1,100 @@
+"""
+File d'enrôlement des visages, adossée à la table TacheEnrolement.
+
+La vue de création ne fait qu'enregistrer une tâche par photo ; le worker
+(manage.py enrollment_worker) réserve les tâches par lots, calcule les
+embeddings dans un pool de threads (les sessions ONNX libèrent le GIL) et
+réessaie les échecs avant de les classer en erreur.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .faces import CHAMPS_PHOTO, analyser_photo, get_modele, sauver_embedding
+from .models import TacheEnrolement
+from .renditions import generer_visage
+
+
+def creer_taches(personne):
+    """Une tâche en attente par photo présente ; retourne {champ: statut}."""
+    champs = [champ for champ in CHAMPS_PHOTO if getattr(personne, champ)]
+    TacheEnrolement.objects.bulk_create([
+        TacheEnrolement(personne=personne, champ=champ) for champ in champs
+    ])
+    return {champ: TacheEnrolement.PENDING for champ in champs}
+
+
+def statuts(personne_id):
+    return {
+        t['champ']: {"statut": t['statut'], "erreur": t['erreur'] or None}
+        for t in TacheEnrolement.objects.filter(personne_id=personne_id).values('champ', 'statut', 'erreur')
+    }
+
+
+def liberer_taches_bloquees():
+    """Remet en attente les tâches d'un worker arrêté en cours de traitement."""
+    limite = timezone.now() - timedelta(seconds=settings.FACE_ENROLL_TIMEOUT)
+    return TacheEnrolement.objects.filter(
+        statut=TacheEnrolement.RUNNING, date_maj__lt=limite
+    ).update(statut=TacheEnrolement.PENDING)
+
+
+def reserver_lot(taille):
+    """Passe au plus `taille` tâches disponibles à 'running' ; plusieurs workers peuvent tourner."""
+    with transaction.atomic():
+        taches = list(
+            TacheEnrolement.objects
+            .select_for_update(skip_locked=True)
+            .select_related('personne')
+            .filter(statut=TacheEnrolement.PENDING, disponible_a__lte=timezone.now())
+            .order_by('disponible_a', 'id')[:taille]
+        )
+        TacheEnrolement.objects.filter(id__in=[t.id for t in taches]).update(
+            statut=TacheEnrolement.RUNNING, date_maj=timezone.now()
+        )
+    return taches
+
+
+def _analyser(tache, model):
+    fichier = getattr(tache.personne, tache.champ)
+    if not fichier:
+        return None  # photo retirée depuis la création de la tâche
+    return analyser_photo(fichier.path, model)
+
+
+def _echec(tache, erreur):
+    tache.tentatives += 1
+    tache.erreur = str(erreur)
+    if tache.tentatives >= settings.FACE_ENROLL_MAX_ATTEMPTS:
+        tache.statut = TacheEnrolement.ERROR
+    else:
+        tache.statut = TacheEnrolement.PENDING
+        delai = settings.FACE_ENROLL_RETRY_DELAY * 2 ** (tache.tentatives - 1)
+        tache.disponible_a = timezone.now() + timedelta(seconds=delai)
+    tache.save(update_fields=['tentatives', 'erreur', 'statut', 'disponible_a', 'date_maj'])
+
+
+def traiter_lot(taches, pool):
+    """Calcule les embeddings d'un lot (calcul dans le pool, écritures dans le thread appelant)."""
+    model = get_modele()
+    futures = [(tache, pool.submit(_analyser, tache, model)) for tache in taches]
+    bilan = {}
+    for tache, future in futures:
+        try:
+            face = future.result()
+            tache.statut = sauver_embedding(tache.personne_id, tache.champ, face)
+            if face is not None:
+                generer_visage(tache.personne, tache.champ, face.bbox)
+            tache.erreur = ''
+            tache.save(update_fields=['statut', 'erreur', 'date_maj'])
+        except Exception as e:
+            _echec(tache, e)
+        bilan[tache.statut] = bilan.get(tache.statut, 0) + 1
+    return bilan
+
+
+def creer_pool(taille=None):
+    return ThreadPoolExecutor(max_workers=taille or settings.FACE_ENROLL_POOL_SIZE)
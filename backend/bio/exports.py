@@ -0,0 +1,111 @@
+"""
+Exports en flux (CSV, NDJSON, XML) des fiches avec leurs deux fiches liées.
+
+Les lignes sont lues par lots sur la clé primaire (WHERE id > dernier id) :
+avec MySQL, .iterator() ne diffuse pas les résultats (le client charge tout
+le jeu), alors qu'un lot borné garde la mémoire constante sur tous les
+backends. Chaque lot est encodé puis envoyé avant de lire le suivant.
+"""
+import csv
+import json
+from xml.etree.ElementTree import Element, SubElement, tostring
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import FicheAnthropometrique, FicheDactyloscopique, Personne
+
+TAILLE_LOT = 1000
+FICHES = {
+    'anthropometrique': FicheAnthropometrique,
+    'dactyloscopique': FicheDactyloscopique,
+}
+# champs techniques non exportés (clés de recherche et de doublons, repère d'import)
+EXCLUS = {'cle_nom', 'cle_prenom', 'annee_naissance', 'cin_normalise', 'ref_import', 'personne'}
+
+
+def _champs(modele):
+    return [f.attname for f in modele._meta.concrete_fields if f.name not in EXCLUS]
+
+
+CHAMPS_PERSONNE = _champs(Personne)
+CHAMPS_FICHES = {nom: [c for c in _champs(modele) if c != 'id'] for nom, modele in FICHES.items()}
+# chemins lus en .values() (une seule requête avec les deux jointures)
+CHEMINS = CHAMPS_PERSONNE + [f'{nom}__{c}' for nom, champs in CHAMPS_FICHES.items() for c in champs]
+
+
+def lire_lots(queryset, taille=TAILLE_LOT, progression=None):
+    """Lots de lignes {chemin: valeur}, par id croissant ; progression(n) après chaque lot."""
+    queryset = queryset.order_by('id').values(*CHEMINS)
+    dernier_id = 0
+    while True:
+        lot = list(queryset.filter(id__gt=dernier_id)[:taille])
+        if not lot:
+            return
+        yield lot
+        dernier_id = lot[-1]['id']
+        if progression:
+            progression(len(lot))
+
+
+def imbriquer(ligne):
+    """Ligne plate -> dict avec les fiches en sous-objets."""
+    personne = {c: ligne[c] for c in CHAMPS_PERSONNE}
+    for nom, champs in CHAMPS_FICHES.items():
+        personne[nom] = {c: ligne[f'{nom}__{c}'] for c in champs}
+    return personne
+
+
+class _Tampon:
+    """Pseudo-fichier pour csv.writer : write() renvoie la ligne au lieu de l'écrire."""
+    def write(self, valeur):
+        return valeur
+
+
+def flux_csv(queryset, progression=None):
+    writer = csv.writer(_Tampon())
+    # BOM : Excel détecte ainsi l'UTF-8 (accents)
+    yield ('\ufeff' + writer.writerow([c.replace('__', '.') for c in CHEMINS])).encode()
+    for lot in lire_lots(queryset, progression=progression):
+        yield ''.join(
+            writer.writerow(['' if ligne[c] is None else ligne[c] for c in CHEMINS]) for ligne in lot
+        ).encode()
+
+
+def flux_ndjson(queryset, progression=None):
+    for lot in lire_lots(queryset, progression=progression):
+        yield ''.join(
+            json.dumps(imbriquer(ligne), cls=DjangoJSONEncoder, ensure_ascii=False) + '\n' for ligne in lot
+        ).encode()
+
+
+def _element(parent, nom, valeur):
+    el = SubElement(parent, nom)
+    if valeur is not None:
+        el.text = valeur.isoformat() if hasattr(valeur, 'isoformat') else str(valeur)
+
+
+def element_personne(ligne):
+    personne = Element('Personne')
+    for c in CHAMPS_PERSONNE:
+        _element(personne, c, ligne[c])
+    for nom, champs in CHAMPS_FICHES.items():
+        fiche = SubElement(personne, nom)
+        for c in champs:
+            _element(fiche, c, ligne[f'{nom}__{c}'])
+    return personne
+
+
+def flux_xml(queryset, progression=None):
+    """Document écrit au fil de l'eau : en-tête, une balise Personne par ligne, fermeture."""
+    yield b'<?xml version="1.0" encoding="utf-8"?>\n<Personnes>\n'
+    for lot in lire_lots(queryset, progression=progression):
+        yield b''.join(tostring(element_personne(ligne), encoding='utf-8', xml_declaration=False) + b'\n' for ligne in lot)
+    yield b'</Personnes>\n'
+
+
+# format -> (générateur, content-type, extension)
+FORMATS = {
+    'csv': (flux_csv, 'text/csv; charset=utf-8', 'csv'),
+    'ndjson': (flux_ndjson, 'application/x-ndjson', 'ndjson'),
+    'xml': (flux_xml, 'application/xml', 'xml'),
+}
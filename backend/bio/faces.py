@@ -0,0 +1,211 @@
+"""
+Reconnaissance faciale : détection InsightFace et stockage des embeddings.
+
+Le modèle est chargé une seule fois par processus (get_modele) puis partagé
+par toutes les vues ; les sessions ONNX supportent les appels concurrents.
+"""
+import os
+import resource
+import threading
+import time
+
+import cv2
+import insightface
+from insightface.app.common import Face
+import numpy as np
+import onnxruntime
+from django.conf import settings
+
+from .models import EmbeddingVisage
+
+CHAMPS_PHOTO = ('photo_face', 'photo_profil', 'photo_longue')
+
+_modele = None
+_verrou = threading.Lock()
+_stats = {}
+
+
+def _memoire_rss_mo():
+    """Mémoire résidente actuelle du processus en Mo."""
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError):
+        # pic de mémoire (Ko sous Linux) faute de /proc
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _charger_modele():
+    rss_avant = _memoire_rss_mo()
+    debut = time.perf_counter()
+
+    options = {}
+    if settings.FACE_MODEL_THREADS:
+        # utile quand plusieurs processus se partagent les cœurs (reindex_faces)
+        options['sess_options'] = onnxruntime.SessionOptions()
+        options['sess_options'].intra_op_num_threads = settings.FACE_MODEL_THREADS
+
+    # seuls détection et reconnaissance servent ici : on ignore landmarks et genderage
+    model = insightface.app.FaceAnalysis(
+        name=settings.FACE_MODEL_NAME,
+        allowed_modules=['detection', 'recognition'],
+        providers=['CPUExecutionProvider'],
+        **options,
+    )
+    model.prepare(ctx_id=-1, det_size=settings.FACE_DET_SIZE)
+    chargement = time.perf_counter() - debut
+
+    # inférence à vide pour initialiser les sessions ONNX avant la première requête
+    debut = time.perf_counter()
+    largeur, hauteur = settings.FACE_DET_SIZE
+    model.get(np.zeros((hauteur, largeur, 3), dtype=np.uint8))
+    model.models['recognition'].get_feat(np.zeros((112, 112, 3), dtype=np.uint8))
+    warmup = time.perf_counter() - debut
+
+    _stats.update({
+        "modele": settings.FACE_MODEL_NAME,
+        "det_size": list(settings.FACE_DET_SIZE),
+        "pid": os.getpid(),
+        "temps_chargement_s": round(chargement, 3),
+        "temps_warmup_s": round(warmup, 3),
+        "memoire_modele_mo": round(_memoire_rss_mo() - rss_avant, 1),
+    })
+    return model
+
+
+def get_modele():
+    """Modèle InsightFace du processus, chargé au premier appel."""
+    global _modele
+    if _modele is None:
+        with _verrou:
+            if _modele is None:
+                _modele = _charger_modele()
+    return _modele
+
+
+def prechauffer():
+    """
+    Charge le modèle au démarrage du serveur (wsgi/asgi, ex. gunicorn --preload)
+    ou du worker d'enrôlement si FACE_MODEL_PRELOAD, plutôt qu'à la première requête.
+    """
+    if settings.FACE_MODEL_PRELOAD:
+        get_modele()
+
+
+def stats_modele():
+    return {
+        "charge": _modele is not None,
+        **_stats,
+        "memoire_processus_mo": round(_memoire_rss_mo(), 1),
+    }
+
+
+def normaliser(vecteur):
+    """Vecteur float32 de norme 1 (la similarité cosinus devient un produit scalaire)."""
+    vecteur = np.asarray(vecteur, dtype=np.float32)
+    norme = np.linalg.norm(vecteur)
+    return vecteur / norme if norme > 0 else vecteur
+
+
+def vecteur_depuis_bytes(data):
+    return np.frombuffer(data, dtype=np.float32)
+
+
+def meilleur_visage(faces):
+    """Visage retenu pour une photo d'enrôlement : le plus sûr du détecteur."""
+    if not faces:
+        return None
+    return max(faces, key=lambda f: float(f.det_score))
+
+
+class ImageIllisible(Exception):
+    pass
+
+
+def decoder_image(fichier, cote_max=None):
+    """
+    Décode un fichier envoyé directement depuis son contenu, sans passer par
+    le disque, et le réduit pour que son plus grand côté ne dépasse pas cote_max.
+    Retourne (image, echelle) ; diviser par echelle ramène aux coordonnées d'origine.
+    """
+    data = np.frombuffer(fichier.read(), dtype=np.uint8)
+    img = cv2.imdecode(data, cv2.IMREAD_COLOR) if data.size else None
+    if img is None:
+        raise ImageIllisible(f"Impossible de lire l'image {getattr(fichier, 'name', '')}")
+
+    echelle = 1.0
+    if cote_max and max(img.shape[:2]) > cote_max:
+        echelle = cote_max / max(img.shape[:2])
+        img = cv2.resize(img, None, fx=echelle, fy=echelle, interpolation=cv2.INTER_AREA)
+    return img, echelle
+
+
+def detecter_visages(img, det_sizes, model=None):
+    """
+    Détection puis embeddings, en essayant les tailles de détection dans l'ordre :
+    on ne passe à la taille suivante (plus coûteuse) que si aucun visage n'est trouvé.
+    """
+    if model is None:
+        model = get_modele()
+    for det_size in det_sizes:
+        bboxes, kpss = model.det_model.detect(img, input_size=tuple(det_size), max_num=0, metric='default')
+        if bboxes.shape[0]:
+            break
+    else:
+        return []
+
+    faces = []
+    for i in range(bboxes.shape[0]):
+        face = Face(bbox=bboxes[i, 0:4], kps=kpss[i] if kpss is not None else None, det_score=bboxes[i, 4])
+        model.models['recognition'].get(img, face)
+        faces.append(face)
+    return faces
+
+
+def analyser_photo(chemin, model=None):
+    """Détecte le visage principal d'une photo ; None si aucun visage."""
+    img = cv2.imread(chemin)
+    if img is None:
+        raise ImageIllisible(f"Impossible de lire l'image {chemin}")
+    if model is None:
+        model = get_modele()
+    return meilleur_visage(model.get(img))
+
+
+def sauver_embedding(personne_id, champ, face):
+    """Stocke (ou retire si aucun visage) l'embedding d'une photo ; retourne le statut."""
+    if face is None:
+        EmbeddingVisage.objects.filter(personne_id=personne_id, champ=champ).delete()
+        return 'no_face'
+
+    EmbeddingVisage.objects.update_or_create(
+        personne_id=personne_id,
+        champ=champ,
+        defaults={
+            'vecteur': normaliser(face.embedding).tobytes(),
+            'bbox': [float(x) for x in face.bbox],
+            'det_score': float(face.det_score),
+            'model_version': settings.FACE_MODEL_NAME,
+        }
+    )
+    return 'done'
+
+
+def enregistrer_embeddings(personne, model=None, champs=CHAMPS_PHOTO):
+    """
+    Calcule et stocke l'embedding de chaque photo présente de la personne.
+    Retourne {champ: statut} avec statut 'done', 'no_face' ou 'error'.
+    """
+    statuts = {}
+    for champ in champs:
+        fichier = getattr(personne, champ)
+        if not fichier:
+            continue
+        try:
+            face = analyser_photo(fichier.path, model)
+        except ImageIllisible:
+            statuts[champ] = 'error'
+            continue
+        statuts[champ] = sauver_embedding(personne.id, champ, face)
+    return statuts
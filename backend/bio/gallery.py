@@ -0,0 +1,124 @@
+"""
+Galerie d'embeddings pour la recherche photo.
+
+Tous les embeddings (L2-normalisés) tiennent dans une matrice float32
+contiguë ; un probe est comparé à toute la galerie par un seul produit
+matrice-vecteur, puis les meilleurs scores sont sélectionnés avec argpartition.
+"""
+import numpy as np
+from django.conf import settings
+
+from .faces import CHAMPS_PHOTO
+from .models import EmbeddingVisage
+
+DIMENSION = 512
+
+
+class Galerie:
+    def __init__(self, ids, personne_ids, champs, matrice, signature=None):
+        self.ids = ids                    # id EmbeddingVisage, int64
+        self.personne_ids = personne_ids  # int64
+        self.champs = champs              # indice dans CHAMPS_PHOTO, int8
+        self.matrice = np.ascontiguousarray(matrice, dtype=np.float32)
+        self.signature = signature
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def depuis_base(cls, model_version, signature=None):
+        queryset = EmbeddingVisage.objects.filter(model_version=model_version)
+        return cls(*lire_embeddings(queryset), signature=signature)
+
+    def scores(self, probe):
+        """Similarité cosinus du probe normalisé avec chaque embedding (un seul appel BLAS)."""
+        return self.matrice @ np.asarray(probe, dtype=np.float32)
+
+    def rechercher(self, probe, top_k=10, seuil=0.6):
+        """
+        Retourne au plus top_k personnes au-dessus du seuil, triées par score :
+        [(personne_id, score, champ), ...] avec le meilleur score de chaque personne.
+        """
+        scores = self.scores(probe)
+        return meilleurs_par_personne(scores, self.personne_ids, self.champs, top_k, seuil)
+
+    def scores_lot(self, probes):
+        """Scores (m, n) de m probes contre toute la galerie en un seul produit matrice-matrice."""
+        return np.asarray(probes, dtype=np.float32) @ self.matrice.T
+
+    def rechercher_lot(self, probes, top_k=10, seuil=0.6):
+        """Une liste de résultats (format de rechercher) par probe."""
+        if not len(probes):
+            return []
+        scores = self.scores_lot(probes)
+        return [
+            meilleurs_par_personne(ligne, self.personne_ids, self.champs, top_k, seuil)
+            for ligne in scores
+        ]
+
+
+def lire_embeddings(queryset):
+    """Charge les embeddings d'un queryset en tableaux (ids, personne_ids, champs, matrice)."""
+    rows = queryset.order_by('id').values_list('id', 'personne_id', 'champ', 'vecteur')
+    n = rows.count()
+    ids = np.empty(n, dtype=np.int64)
+    personne_ids = np.empty(n, dtype=np.int64)
+    champs = np.empty(n, dtype=np.int8)
+    matrice = np.empty((n, DIMENSION), dtype=np.float32)
+
+    i = 0
+    for emb_id, personne_id, champ, vecteur in rows.iterator(chunk_size=2000):
+        if i >= n:
+            break  # lignes ajoutées entre le count() et la lecture
+        ids[i] = emb_id
+        personne_ids[i] = personne_id
+        champs[i] = CHAMPS_PHOTO.index(champ)
+        matrice[i] = np.frombuffer(vecteur, dtype=np.float32)
+        i += 1
+    return ids[:i], personne_ids[:i], champs[:i], matrice[:i]
+
+
+def meilleurs_par_personne(scores, personne_ids, champs, top_k, seuil):
+    """
+    Sélectionne, parmi des lignes scorées, au plus top_k personnes au-dessus
+    du seuil avec le meilleur score de chacune.
+    """
+    if len(scores) == 0 or top_k <= 0:
+        return []
+
+    # une personne a au plus len(CHAMPS_PHOTO) photos : ces k lignes contiennent top_k personnes
+    k = min(len(scores), top_k * len(CHAMPS_PHOTO))
+    candidats = np.argpartition(-scores, k - 1)[:k]
+    candidats = candidats[scores[candidats] >= seuil]
+    candidats = candidats[np.argsort(-scores[candidats], kind='stable')]
+
+    resultats = []
+    vus = set()
+    for i in candidats:
+        personne_id = int(personne_ids[i])
+        if personne_id in vus:
+            continue
+        vus.add(personne_id)
+        resultats.append((personne_id, float(scores[i]), CHAMPS_PHOTO[champs[i]]))
+        if len(resultats) == top_k:
+            break
+    return resultats
+
+
+def rechercher(probe, top_k=10, seuil=0.6, nprobe=None):
+    """Recherche via le moteur configuré (FACE_SEARCH_BACKEND : 'exact' ou 'ivf')."""
+    if settings.FACE_SEARCH_BACKEND == 'ivf':
+        from .ann import get_index
+        return get_index().rechercher(probe, top_k=top_k, seuil=seuil, nprobe=nprobe)
+    from .mmap_gallery import get_galerie_partagee
+    return get_galerie_partagee().rechercher(probe, top_k=top_k, seuil=seuil)
+
+
+def rechercher_lot(probes, top_k=10, seuil=0.6, nprobe=None):
+    """Comme rechercher, pour plusieurs probes à la fois."""
+    if settings.FACE_SEARCH_BACKEND == 'ivf':
+        from .ann import get_index
+        index = get_index()
+        return [index.rechercher(p, top_k=top_k, seuil=seuil, nprobe=nprobe) for p in probes]
+    from .mmap_gallery import get_galerie_partagee
+    return get_galerie_partagee().rechercher_lot(probes, top_k=top_k, seuil=seuil)
@@ -0,0 +1,304 @@
+"""
+Import en masse de fiches (api/personnes/import/, manage.py import_fiches).
+
+Entrée : CSV ou NDJSON au format des exports (bio.exports), donc relisible
+tel quel. En CSV, les champs des fiches liées sont en colonnes
+'anthropometrique.champ' / 'dactyloscopique.champ'. En NDJSON, ils sont en
+sous-objets. Les colonnes photo_face / photo_profil / photo_longue donnent le
+nom d'un fichier de l'archive ZIP de photos jointe.
+
+Chaque ligne est validée champ par champ ; une ligne invalide est rejetée
+avec ses erreurs, les autres sont écrites par lots, un lot par transaction :
+bulk_create des personnes puis des deux fiches. Sans RETURNING (MySQL), les
+ids des personnes sont relus par le repère ref_import posé sur chaque ligne.
+Si la base refuse un lot, ses lignes sont reprises une à une : seules celles
+qui échouent encore sont rejetées. bulk_create n'appelle ni
+save() ni les signaux. Ce que ceux-ci faisaient est donc repris ici : clés de
+doublons (calculer_cles, normaliser_identifiant), fiches liées (sans passer par
+des fiches vides mises à jour ensuite), tâches d'enrôlement des photos, puis,
+une fois le lot validé, index de recherche et version 'fiches' du cache. Les
+renditions des photos sont laissées à manage.py build_renditions.
+"""
+import csv
+import io
+import json
+import os
+import time
+import uuid
+import zipfile
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from PIL import Image
+
+from . import cache_reponses, recherche
+from .exports import CHAMPS_FICHES, FICHES
+from .faces import CHAMPS_PHOTO
+from .models import Personne, TacheEnrolement
+from .texte import normaliser_identifiant
+
+# colonnes des exports sans objet à l'import
+IGNORES = {'id', 'created_by_id', 'updated_by_id', 'date_creation', 'date_modification'}
+TECHNIQUES = IGNORES | set(Personne.CHAMPS_CLES.values()) | {'created_by', 'updated_by', 'ref_import'}
+CHAMPS_PERSONNE = [
+    f.name for f in Personne._meta.concrete_fields
+    if f.name not in TECHNIQUES and f.attname not in TECHNIQUES and f.name not in CHAMPS_PHOTO
+]
+FORMATS = ('csv', 'ndjson')
+
+
+class FormatInvalide(ValueError):
+    pass
+
+
+def format_fichier(nom, format_=None):
+    format_ = format_ or ('ndjson' if os.path.splitext(nom)[1].lower() in ('.ndjson', '.jsonl') else 'csv')
+    if format_ not in FORMATS:
+        raise FormatInvalide(f"Format '{format_}' inconnu (csv ou ndjson).")
+    return format_
+
+
+def lire_csv(fichier):
+    """(numéro de ligne, dict) ; les colonnes 'fiche.champ' deviennent des sous-objets."""
+    texte = io.TextIOWrapper(fichier, encoding='utf-8-sig', newline='')
+    try:
+        lecteur = csv.DictReader(texte)
+        for ligne in lecteur:
+            donnees = {nom: {} for nom in FICHES}
+            for colonne, valeur in ligne.items():
+                if colonne is None:
+                    donnees['_en_trop'] = valeur
+                    continue
+                fiche, _, champ = colonne.partition('.')
+                if champ and fiche in FICHES:
+                    donnees[fiche][champ] = valeur
+                else:
+                    donnees[colonne] = valeur
+            yield lecteur.line_num, donnees
+    finally:
+        texte.detach()  # le fichier reste ouvert pour l'appelant
+
+
+def lire_ndjson(fichier):
+    texte = io.TextIOWrapper(fichier, encoding='utf-8')
+    try:
+        for numero, brut in enumerate(texte, start=1):
+            if not brut.strip():
+                continue
+            try:
+                donnees = json.loads(brut)
+            except ValueError as e:
+                donnees = {'_json_invalide': str(e)}
+            yield numero, donnees
+    finally:
+        texte.detach()
+
+
+LECTEURS = {'csv': lire_csv, 'ndjson': lire_ndjson}
+
+
+def compter_lignes(fichier, format_):
+    """Nombre de lignes de données, puis retour au début du fichier."""
+    total = sum(1 for _ in LECTEURS[format_](fichier))
+    fichier.seek(0)
+    return total
+
+
+class LigneInvalide(Exception):
+    def __init__(self, erreurs):
+        super().__init__(erreurs)
+        self.erreurs = erreurs
+
+
+def _nettoyer(modele, champs, donnees, prefixe, erreurs):
+    """Valeurs converties par les champs du modèle ; '' vaut NULL pour les champs qui l'acceptent."""
+    valeurs = {}
+    for nom, valeur in donnees.items():
+        if nom in IGNORES or nom in TECHNIQUES:
+            continue
+        if nom not in champs:
+            erreurs[f'{prefixe}{nom}'] = ["Champ inconnu."]
+            continue
+        champ = modele._meta.get_field(nom)
+        if valeur == '' and champ.null:
+            valeur = None
+        try:
+            valeurs[nom] = champ.clean(valeur, None)
+        except ValidationError as e:
+            erreurs[f'{prefixe}{nom}'] = e.messages
+    return valeurs
+
+
+class ArchivePhotos:
+    """Photos du ZIP, retrouvées par chemin complet ou par nom de fichier."""
+    def __init__(self, fichier):
+        self.zip = zipfile.ZipFile(fichier)
+        self.noms = {}
+        for info in self.zip.infolist():
+            if not info.is_dir():
+                self.noms.setdefault(info.filename, info)
+                self.noms.setdefault(os.path.basename(info.filename), info)
+
+    def verifier(self, nom):
+        info = self.noms.get(nom)
+        if info is None:
+            raise KeyError(nom)
+        with self.zip.open(info) as f:
+            Image.open(f).verify()  # en-tête et structure, sans décoder les pixels
+        return info
+
+    def lire(self, info):
+        return self.zip.read(info)
+
+
+class ImportFiches:
+    def __init__(self, utilisateur_id=None, photos=None, taille_lot=None):
+        self.utilisateur_id = utilisateur_id
+        self.photos = photos
+        self.taille_lot = taille_lot or settings.IMPORT_TAILLE_LOT
+        self.lignes = 0
+        self.importees = 0
+        self.rejets = []
+        self.debut = None
+
+    def valider(self, donnees):
+        """Ligne -> (champs Personne, {fiche: champs}, {champ photo: entrée du ZIP}) ; LigneInvalide sinon."""
+        if not isinstance(donnees, dict):
+            raise LigneInvalide({'ligne': ["Objet JSON attendu."]})
+        if '_json_invalide' in donnees:
+            raise LigneInvalide({'ligne': [f"JSON invalide : {donnees['_json_invalide']}"]})
+        if '_en_trop' in donnees:
+            raise LigneInvalide({'ligne': ["Plus de valeurs que de colonnes."]})
+
+        erreurs = {}
+        donnees = dict(donnees)
+        fiches = {}
+        for nom, modele in FICHES.items():
+            sous = donnees.pop(nom, None) or {}
+            if not isinstance(sous, dict):
+                erreurs[nom] = ["Objet attendu."]
+                continue
+            fiches[nom] = _nettoyer(modele, CHAMPS_FICHES[nom], sous, f'{nom}.', erreurs)
+
+        photos = {}
+        for champ in CHAMPS_PHOTO:
+            nom = str(donnees.pop(champ, None) or '').strip()
+            if not nom:
+                continue
+            if self.photos is None:
+                erreurs[champ] = ["Photo indiquée mais aucune archive ZIP fournie."]
+                continue
+            try:
+                photos[champ] = self.photos.verifier(nom)
+            except KeyError:
+                erreurs[champ] = [f"'{nom}' absente de l'archive."]
+            except Exception:
+                erreurs[champ] = [f"'{nom}' n'est pas une image lisible."]
+
+        personne = _nettoyer(Personne, CHAMPS_PERSONNE, donnees, '', erreurs)
+        if erreurs:
+            raise LigneInvalide(erreurs)
+        return personne, fiches, photos
+
+    def importer(self, lignes, progression=None):
+        """Valide et écrit (numéro, dict) par lots ; progression(rapport) après chaque lot."""
+        self.debut = time.perf_counter()
+        lot = []
+        for numero, donnees in lignes:
+            self.lignes += 1
+            try:
+                lot.append((numero, *self.valider(donnees)))
+            except LigneInvalide as e:
+                self.rejets.append({'ligne': numero, 'erreurs': e.erreurs})
+                continue
+            if len(lot) == self.taille_lot:
+                self.ecrire(lot)
+                lot = []
+                if progression:
+                    progression(self.rapport())
+        if lot:
+            self.ecrire(lot)
+        if progression:
+            progression(self.rapport())
+        return self.rapport()
+
+    def ecrire(self, lot):
+        try:
+            self.ecrire_lot(lot)
+        except Exception as e:
+            if len(lot) == 1:
+                self.rejeter(lot[0], e)
+                return
+            # lot refusé par la base : lignes reprises une à une pour ne rejeter que les fautives
+            for ligne in lot:
+                try:
+                    self.ecrire_lot([ligne])
+                except Exception as e:
+                    self.rejeter(ligne, e)
+
+    def rejeter(self, ligne, erreur):
+        self.rejets.append({'ligne': ligne[0], 'erreurs': {'ligne': [str(erreur)]}})
+
+    def ecrire_lot(self, lot):
+        """Écrit les lignes en une transaction ; toute erreur annule le lot et remonte."""
+        enregistrees = []
+        try:
+            personnes = []
+            for numero, champs, _, photos in lot:
+                personne = Personne(created_by_id=self.utilisateur_id, **champs)
+                for champ, info in photos.items():
+                    nom = Personne._meta.get_field(champ).generate_filename(None, os.path.basename(info.filename))
+                    nom = default_storage.save(nom, ContentFile(self.photos.lire(info)))
+                    enregistrees.append(nom)
+                    setattr(personne, champ, nom)
+                personne.calculer_cles()  # bulk_create n'appelle pas save()
+                personnes.append(personne)
+
+            with transaction.atomic():
+                self.inserer_personnes(personnes)
+                for nom, modele in FICHES.items():
+                    fiches = [modele(personne_id=p.id, **fiche[nom]) for p, (_, _, fiche, _) in zip(personnes, lot)]
+                    if nom == 'dactyloscopique':
+                        for fiche in fiches:
+                            fiche.cin_normalise = normaliser_identifiant(fiche.cin)
+                    modele.objects.bulk_create(fiches)
+                TacheEnrolement.objects.bulk_create([
+                    TacheEnrolement(personne_id=p.id, champ=champ)
+                    for p in personnes for champ in CHAMPS_PHOTO if getattr(p, champ)
+                ])
+                recherche.indexer_apres_commit([p.id for p in personnes])
+                transaction.on_commit(lambda: cache_reponses.invalider('fiches'))
+        except Exception:
+            for nom in enregistrees:
+                default_storage.delete(nom)
+            raise
+        self.importees += len(lot)
+
+    def inserer_personnes(self, personnes):
+        if connection.features.can_return_rows_from_bulk_insert:
+            Personne.objects.bulk_create(personnes)  # ids renvoyés par l'insertion
+            return
+        # MySQL : bulk_create ne renvoie pas les ids, relus par le repère unique de chaque ligne
+        lot = uuid.uuid4().hex
+        for i, personne in enumerate(personnes):
+            personne.ref_import = f'{lot}:{i}'
+        Personne.objects.bulk_create(personnes)
+        ids = dict(Personne.objects.filter(
+            ref_import__in=[p.ref_import for p in personnes]
+        ).values_list('ref_import', 'id'))
+        for personne in personnes:
+            personne.id = ids[personne.ref_import]
+
+    def rapport(self):
+        duree = time.perf_counter() - self.debut if self.debut else 0
+        return {
+            'lignes': self.lignes,
+            'importees': self.importees,
+            'rejetees': len(self.rejets),
+            'duree_s': round(duree, 2),
+            'lignes_par_seconde': round(self.importees / duree, 1) if duree else None,
+            'rejets': self.rejets,
+        }
@@ -0,0 +1,45 @@
+"""
+Jeton d'export (step-up) : le mot de passe est vérifié une fois
+(api/export/jeton/), puis les exports présentent ce jeton court et signé au
+lieu du mot de passe. Sa validation ne coûte qu'une vérification HMAC, là où
+authenticate() recalcule le hash PBKDF2 à chaque appel.
+"""
+from django.conf import settings
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import Token
+
+SCOPE_EXPORT = 'export'
+ENTETE = 'HTTP_X_EXPORT_TOKEN'
+
+
+class JetonExport(Token):
+    # type distinct de 'access' : JWTAuthentication le refuse comme jeton de connexion
+    token_type = 'export'
+    lifetime = settings.EXPORT_TOKEN_LIFETIME
+
+    @classmethod
+    def for_user(cls, user):
+        jeton = super().for_user(user)
+        jeton['scope'] = SCOPE_EXPORT
+        return jeton
+
+
+def jeton_requete(request):
+    """Jeton présenté dans l'en-tête X-Export-Token ou le champ export_token."""
+    return request.META.get(ENTETE) or request.data.get('export_token')
+
+
+def jeton_valide(request):
+    """Vrai si la requête porte un jeton d'export valide, émis pour l'utilisateur connecté."""
+    brut = jeton_requete(request)
+    if not brut:
+        return False
+    try:
+        jeton = JetonExport(brut)
+    except TokenError:
+        return False
+    return (
+        jeton.get('scope') == SCOPE_EXPORT
+        and jeton.get(api_settings.USER_ID_CLAIM) == str(getattr(request.user, api_settings.USER_ID_FIELD))
+    )
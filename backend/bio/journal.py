@@ -0,0 +1,158 @@
+"""
+Journal d'activité en mémoire tampon.
+
+Les vues appellent enregistrer() : l'événement est ajouté à une liste en
+mémoire, sans requête. Un thread du processus écrit le tampon en un seul
+bulk_create dès qu'il atteint JOURNAL_TAILLE_LOT événements ou, au plus
+tard, toutes les JOURNAL_INTERVALLE_MS millisecondes. Le tampon est vidé à
+l'arrêt du processus (atexit).
+
+La date de l'événement est fixée à l'appel et non à l'écriture. Si un lot
+est refusé, ses événements sont repris un par un : ceux que la base rejette
+encore (IntegrityError, DataError) sont abandonnés, journalisés et comptés
+('rejetes'), pour qu'une ligne invalide ne bloque pas les suivantes. Si la
+base est indisponible, le reste est remis en tête du tampon pour le passage
+suivant ; au-delà de JOURNAL_TAILLE_MAX événements en attente, les plus
+anciens sont abandonnés et comptés (stats_journal, affiché par api/sante/).
+"""
+import atexit
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.db import DataError, IntegrityError, close_old_connections
+from django.utils import timezone
+
+from .models import Activite
+
+logger = logging.getLogger(__name__)
+
+
+class Journal:
+    def __init__(self, taille_lot, intervalle, taille_max):
+        self.taille_lot = taille_lot
+        self.intervalle = intervalle
+        self.taille_max = taille_max
+        self._condition = threading.Condition()
+        self._tampon = []
+        self._thread = None
+        self._pid = None
+        self._arret = False
+        self.stats = {'enregistres': 0, 'ecrits': 0, 'lots': 0, 'perdus': 0, 'rejetes': 0, 'erreurs': 0}
+
+    def enregistrer(self, utilisateur_id, action, description=''):
+        evenement = Activite(
+            utilisateur_id=utilisateur_id, action=action, description=description, date_heure=timezone.now(),
+        )
+        with self._condition:
+            self._demarrer()
+            self._tampon.append(evenement)
+            self.stats['enregistres'] += 1
+            if len(self._tampon) > self.taille_max:
+                perdus = len(self._tampon) - self.taille_max
+                del self._tampon[:perdus]
+                self.stats['perdus'] += perdus
+            if len(self._tampon) >= self.taille_lot:
+                self._condition.notify()
+
+    def _demarrer(self):
+        # après un fork (gunicorn --preload), le thread du parent n'existe pas dans l'enfant
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._arret = False
+        self._thread = threading.Thread(target=self._boucle, name='journal-activite', daemon=True)
+        self._thread.start()
+
+    def _boucle(self):
+        while True:
+            with self._condition:
+                if not self._arret and len(self._tampon) < self.taille_lot:
+                    self._condition.wait(self.intervalle)
+                arret = self._arret
+            self.vider()
+            if arret:
+                return
+
+    def vider(self):
+        """Écrit tout ce qui est en attente, par lots de taille_lot."""
+        with self._condition:
+            lot, self._tampon = self._tampon, []
+        if not lot:
+            return 0
+        close_old_connections()
+        ecrits = rejetes = 0
+        try:
+            for i in range(0, len(lot), self.taille_lot):
+                morceau = lot[i:i + self.taille_lot]
+                try:
+                    Activite.objects.bulk_create(morceau)
+                    ecrits += len(morceau)
+                    continue
+                except (IntegrityError, DataError):
+                    pass
+                for evenement in morceau:  # ligne par ligne pour isoler l'événement refusé
+                    try:
+                        Activite.objects.bulk_create([evenement])
+                        ecrits += 1
+                    except (IntegrityError, DataError):
+                        rejetes += 1
+                        logger.exception(
+                            "Événement du journal refusé et abandonné : %s utilisateur=%s",
+                            evenement.action, evenement.utilisateur_id,
+                        )
+        except Exception:
+            restants = lot[ecrits + rejetes:]
+            logger.exception("Écriture du journal d'activité impossible, %d événement(s) remis en attente", len(restants))
+            with self._condition:
+                self._tampon[:0] = restants
+                self.stats['erreurs'] += 1
+        finally:
+            close_old_connections()
+        with self._condition:
+            self.stats['ecrits'] += ecrits
+            self.stats['rejetes'] += rejetes
+            self.stats['lots'] += 1
+        return ecrits
+
+    def arreter(self, delai=5.0):
+        """Réveille le thread, attend la dernière écriture ; le tampon restant est écrit ici sinon."""
+        with self._condition:
+            thread = self._thread if self._pid == os.getpid() else None
+            self._arret = True
+            self._condition.notify()
+        if thread is not None and thread.is_alive():
+            thread.join(delai)
+        self.vider()
+        with self._condition:
+            self._thread = None
+
+    def en_attente(self):
+        with self._condition:
+            return len(self._tampon)
+
+
+journal = Journal(
+    taille_lot=settings.JOURNAL_TAILLE_LOT,
+    intervalle=settings.JOURNAL_INTERVALLE_MS / 1000,
+    taille_max=settings.JOURNAL_TAILLE_MAX,
+)
+atexit.register(journal.arreter)
+
+
+def enregistrer(request_ou_id, action, description=''):
+    """Ajoute un événement au journal ; accepte une requête authentifiée ou un id d'utilisateur."""
+    user = getattr(request_ou_id, 'user', None)
+    utilisateur_id = user.pk if user is not None else request_ou_id
+    if utilisateur_id is None:
+        return
+    journal.enregistrer(utilisateur_id, action, description)
+
+
+def stats_journal():
+    with journal._condition:
+        stats = dict(journal.stats)
+    stats['en_attente'] = journal.en_attente()
+    return stats
@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from bio.activites import archiver, date_retention
+
+
+class Command(BaseCommand):
+    help = (
+        "Déplace les lignes du journal d'activité plus anciennes que la rétention dans les archives "
+        "mensuelles compressées (recherche : api/activites/archives/)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--jours', type=int, help="rétention en jours (défaut : ACTIVITE_RETENTION_JOURS)")
+        parser.add_argument('--lot', type=int, default=5000, help="lignes déplacées par lot")
+
+    def handle(self, *args, **options):
+        debut = time.perf_counter()
+        avant = date_retention(options['jours'])
+        archives = archiver(avant, taille_lot=options['lot'])
+        for (annee, mois), lignes in sorted(archives.items()):
+            self.stdout.write(f"{annee:04d}-{mois:02d} : {lignes} ligne(s)")
+        self.stdout.write(self.style.SUCCESS(
+            f"{sum(archives.values())} ligne(s) antérieures au {avant:%Y-%m-%d} archivée(s) "
+            f"en {time.perf_counter() - debut:.1f}s"
+        ))
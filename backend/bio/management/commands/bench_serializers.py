@@ -0,0 +1,58 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from bio.models import Personne
+from bio.serializers import CHAMPS_RESUME, PersonneSerializer, resumer_personnes
+
+
+class Command(BaseCommand):
+    help = (
+        "Mesure le temps de sérialisation des listes de Personne pour 1 000 lignes : "
+        "PersonneSerializer complet, ?fields= et représentation « resume »."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lignes', type=int, default=1000, help="lignes lues (les plus récentes)")
+        parser.add_argument('--repetitions', type=int, default=5)
+        parser.add_argument('--fields', default='id,nom,prenom,date_naissance,age', help="champs du cas ?fields=")
+
+    def handle(self, *args, **options):
+        n = options['lignes']
+        # URLs absolues comme en production : un hôte accepté par ALLOWED_HOSTS
+        hote = next((h for h in settings.ALLOWED_HOSTS if h not in ('*', '') and not h.startswith('.')), 'localhost')
+        request = Request(APIRequestFactory().get('/', HTTP_HOST=hote))
+        ids = list(Personne.objects.order_by('-date_creation', '-id').values_list('id', flat=True)[:n])
+        if not ids:
+            raise CommandError("Aucune fiche en base.")
+        champs = options['fields'].split(',')
+
+        complet = list(
+            Personne.objects.filter(id__in=ids)
+            .select_related('anthropometrique', 'dactyloscopique').prefetch_related('renditions')
+        )
+        partiel = list(Personne.objects.filter(id__in=ids))
+        lignes = list(Personne.objects.filter(id__in=ids).values(*CHAMPS_RESUME))
+
+        cas = [
+            ("complet (avant)", lambda: PersonneSerializer(complet, many=True, context={'request': request}).data),
+            (f"?fields={options['fields']}", lambda: PersonneSerializer(
+                partiel, many=True, fields=champs, context={'request': request}
+            ).data),
+            ("?vue=resume (requête des miniatures comprise)", lambda: resumer_personnes(lignes, request)),
+        ]
+        self.stdout.write(f"{len(ids)} ligne(s), meilleur de {options['repetitions']} essais, ms pour 1 000 lignes :")
+        reference = None
+        for nom, fonction in cas:
+            meilleur = min(self.chronometrer(fonction) for _ in range(options['repetitions']))
+            par_mille = meilleur * 1000 / len(ids) * 1000
+            reference = reference or par_mille
+            self.stdout.write(f"  {nom:<45} {par_mille:9.1f} ms   x{reference / par_mille:.1f}")
+
+    def chronometrer(self, fonction):
+        debut = time.perf_counter()
+        fonction()
+        return time.perf_counter() - debut
@@ -0,0 +1,46 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from bio.models import FicheDactyloscopique, Personne
+from bio.texte import normaliser_identifiant
+
+
+class Command(BaseCommand):
+    help = "Recalcule les clés de blocage des doublons (codes phonétiques, année de naissance, CIN normalisé) de toutes les fiches, après un changement des règles phonétiques. La migration 0018 remplit déjà les fiches antérieures à 0010."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lot', type=int, default=2000, help="lignes mises à jour par lot")
+
+    def handle(self, *args, **options):
+        debut = time.perf_counter()
+        lot = []
+        personnes = 0
+        for personne in Personne.objects.order_by('id').only('id', 'nom', 'prenom', 'date_naissance').iterator(chunk_size=options['lot']):
+            personne.calculer_cles()
+            lot.append(personne)
+            if len(lot) == options['lot']:
+                Personne.objects.bulk_update(lot, ['cle_nom', 'cle_prenom', 'annee_naissance'])
+                personnes += len(lot)
+                lot = []
+                self.stdout.write(f"... personne {personne.id}")
+        if lot:
+            Personne.objects.bulk_update(lot, ['cle_nom', 'cle_prenom', 'annee_naissance'])
+            personnes += len(lot)
+
+        lot = []
+        fiches = 0
+        for fiche in FicheDactyloscopique.objects.exclude(cin='').exclude(cin__isnull=True).order_by('id').only('id', 'cin').iterator(chunk_size=options['lot']):
+            fiche.cin_normalise = normaliser_identifiant(fiche.cin)
+            lot.append(fiche)
+            if len(lot) == options['lot']:
+                FicheDactyloscopique.objects.bulk_update(lot, ['cin_normalise'])
+                fiches += len(lot)
+                lot = []
+        if lot:
+            FicheDactyloscopique.objects.bulk_update(lot, ['cin_normalise'])
+            fiches += len(lot)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{personnes} personne(s) et {fiches} CIN traités en {time.perf_counter() - debut:.0f}s"
+        ))
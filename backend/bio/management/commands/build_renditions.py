@@ -0,0 +1,62 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from bio.faces import CHAMPS_PHOTO
+from bio.models import EmbeddingVisage, Personne, RenditionPhoto
+from bio.renditions import TAILLES, generer_renditions, generer_visage
+
+
+class Command(BaseCommand):
+    help = "Génère les renditions (miniature, aperçu, visage recadré) manquantes des photos existantes."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help="régénère aussi les renditions existantes")
+        parser.add_argument('--lot', type=int, default=500, help="personnes traitées par lot")
+
+    def handle(self, *args, **options):
+        debut = time.perf_counter()
+        lot = []
+        photos = 0
+        for personne in Personne.objects.order_by('id').only('id', *CHAMPS_PHOTO).iterator(chunk_size=options['lot']):
+            lot.append(personne)
+            if len(lot) == options['lot']:
+                photos += self.traiter(lot, options['force'])
+                lot = []
+        if lot:
+            photos += self.traiter(lot, options['force'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{photos} photo(s) traitée(s) en {time.perf_counter() - debut:.0f}s"
+        ))
+
+    def traiter(self, personnes, force):
+        existantes = set()
+        if not force:
+            existantes = set(RenditionPhoto.objects.filter(
+                personne_id__in=[p.id for p in personnes]
+            ).values_list('personne_id', 'champ', 'type'))
+        bboxes = {
+            (e['personne_id'], e['champ']): e['bbox']
+            for e in EmbeddingVisage.objects.filter(
+                personne_id__in=[p.id for p in personnes]
+            ).values('personne_id', 'champ', 'bbox')
+        }
+
+        photos = 0
+        for personne in personnes:
+            for champ in CHAMPS_PHOTO:
+                if not getattr(personne, champ):
+                    continue
+                try:
+                    if any((personne.id, champ, t) not in existantes for t in TAILLES):
+                        generer_renditions(personne, [champ])
+                    bbox = bboxes.get((personne.id, champ))
+                    if bbox and (personne.id, champ, RenditionPhoto.FACE) not in existantes:
+                        generer_visage(personne, champ, bbox)
+                except (OSError, ValueError) as e:
+                    self.stderr.write(f"Personne {personne.id} {champ} : {e}")
+                    continue
+                photos += 1
+        self.stdout.write(f"... personne {personnes[-1].id}")
+        return photos
@@ -0,0 +1,49 @@
+import signal
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from bio.enrolement import creer_pool, liberer_taches_bloquees, reserver_lot, traiter_lot
+from bio.faces import prechauffer
+
+
+class Command(BaseCommand):
+    help = "Calcule en tâche de fond les embeddings des photos enregistrées (TacheEnrolement)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lot', type=int, default=settings.FACE_ENROLL_BATCH_SIZE, help="tâches réservées par lot")
+        parser.add_argument('--pool', type=int, default=settings.FACE_ENROLL_POOL_SIZE, help="threads de calcul")
+        parser.add_argument('--attente', type=float, default=2.0, help="secondes entre deux lots quand la file est vide")
+        parser.add_argument('--une-fois', action='store_true', help="vide la file puis s'arrête")
+
+    def handle(self, *args, **options):
+        self.arret = False
+        signal.signal(signal.SIGTERM, self.demander_arret)
+        signal.signal(signal.SIGINT, self.demander_arret)
+
+        prechauffer()
+        self.stdout.write(f"Worker d'enrôlement démarré (lot={options['lot']}, pool={options['pool']})")
+        with creer_pool(options['pool']) as pool:
+            while not self.arret:
+                close_old_connections()
+                liberer_taches_bloquees()
+                taches = reserver_lot(options['lot'])
+                if not taches:
+                    if options['une_fois']:
+                        break
+                    time.sleep(options['attente'])
+                    continue
+
+                debut = time.perf_counter()
+                bilan = traiter_lot(taches, pool)
+                duree = time.perf_counter() - debut
+                self.stdout.write(
+                    f"{len(taches)} photo(s) en {duree:.2f}s ({len(taches) / duree:.1f}/s) : {bilan}"
+                )
+        self.stdout.write("Worker d'enrôlement arrêté")
+
+    def demander_arret(self, signum, frame):
+        # le lot en cours est terminé avant de sortir
+        self.arret = True
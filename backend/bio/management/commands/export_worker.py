@@ -0,0 +1,56 @@
+import signal
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from bio.dossiers import configurer_pool
+from bio.taches_export import echec, executer, liberer_taches_bloquees, nettoyer_expirees, reserver_tache
+
+
+class Command(BaseCommand):
+    help = "Produit en tâche de fond les exports demandés (TacheExport) et supprime les fichiers expirés."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--attente', type=float, default=2.0, help="secondes entre deux passages quand la file est vide")
+        parser.add_argument('--une-fois', action='store_true', help="vide la file puis s'arrête")
+
+    def handle(self, *args, **options):
+        self.arret = False
+        signal.signal(signal.SIGTERM, self.demander_arret)
+        signal.signal(signal.SIGINT, self.demander_arret)
+        # seul processus de rendu de la machine : tous les cœurs pour les dossiers PDF
+        configurer_pool(settings.DOSSIER_PDF_PROCESSUS)
+
+        self.stdout.write("Worker d'export démarré")
+        while not self.arret:
+            close_old_connections()
+            liberer_taches_bloquees()
+            supprimees = nettoyer_expirees()
+            if supprimees:
+                self.stdout.write(f"{supprimees} export(s) expiré(s) supprimé(s)")
+            tache = reserver_tache()
+            if tache is None:
+                if options['une_fois']:
+                    break
+                time.sleep(options['attente'])
+                continue
+
+            debut = time.perf_counter()
+            try:
+                executer(tache)
+            except Exception as e:
+                echec(tache, e)
+                self.stderr.write(f"Export {tache.id} en erreur : {e}")
+                continue
+            duree = time.perf_counter() - debut
+            self.stdout.write(
+                f"Export {tache.id} ({tache.format}) : {tache.lignes} ligne(s) en {duree:.1f}s "
+                f"({tache.lignes / duree if duree else 0:.0f} lignes/s)"
+            )
+        self.stdout.write("Worker d'export arrêté")
+
+    def demander_arret(self, signum, frame):
+        # l'export en cours est terminé avant de sortir
+        self.arret = True
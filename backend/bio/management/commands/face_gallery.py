@@ -0,0 +1,35 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from bio import mmap_gallery
+
+
+class Command(BaseCommand):
+    help = (
+        "Galerie partagée des visages : 'rebuild' la recrée depuis la base, "
+        "'compact' retire les lignes supprimées, 'info' affiche l'en-tête."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('action', choices=['rebuild', 'compact', 'info'])
+
+    def handle(self, *args, **options):
+        chemin = str(settings.FACE_GALLERY_PATH)
+        action = options['action']
+
+        if action == 'rebuild':
+            mmap_gallery.reconstruire(chemin, settings.FACE_MODEL_NAME)
+        elif not os.path.exists(chemin):
+            raise CommandError(f"{chemin} n'existe pas, lancer d'abord 'face_gallery rebuild'.")
+        elif action == 'compact':
+            mmap_gallery.compacter(chemin)
+
+        entete = mmap_gallery.lire_entete(chemin)
+        taille = os.path.getsize(chemin) / (1024 * 1024)
+        self.stdout.write(
+            f"{chemin} : modèle {entete['model_version']}, dim {entete['dimension']}, "
+            f"{entete['lignes']} lignes dont {entete['supprimees']} supprimées, "
+            f"génération {entete['generation']}, {taille:.1f} Mo"
+        )
@@ -0,0 +1,76 @@
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from bio.ann import IndexIVF, construire_index
+from bio.faces import normaliser
+from bio.gallery import Galerie
+
+
+class Command(BaseCommand):
+    help = (
+        "Index IVF des visages : 'build' (re)construit l'index sur disque, "
+        "'report' mesure le rappel et la latence par rapport à la recherche exacte."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('action', choices=['build', 'report'])
+        parser.add_argument('--nlist', type=int, default=None, help="nombre de listes (défaut : FACE_INDEX_NLIST ou 4*sqrt(n))")
+        parser.add_argument('--iterations', type=int, default=20, help="itérations du k-means")
+        parser.add_argument('--requetes', type=int, default=200, help="nombre de probes pour le rapport")
+        parser.add_argument('--top-k', type=int, default=10)
+        parser.add_argument('--nprobe', default='1,2,4,8,16,32,64', help="valeurs de nprobe testées, séparées par des virgules")
+        parser.add_argument('--bruit', type=float, default=0.3, help="bruit ajouté aux embeddings servant de probes")
+
+    def handle(self, *args, **options):
+        model_version = settings.FACE_MODEL_NAME
+        if options['action'] == 'build':
+            debut = time.perf_counter()
+            index = construire_index(model_version, nlist=options['nlist'], n_iter=options['iterations'])
+            index.sauvegarder(str(settings.FACE_INDEX_PATH))
+            self.stdout.write(self.style.SUCCESS(
+                f"Index construit : {len(index)} embeddings, {index.nlist} listes "
+                f"en {time.perf_counter() - debut:.1f}s -> {settings.FACE_INDEX_PATH}"
+            ))
+        else:
+            self.rapport(model_version, options)
+
+    def rapport(self, model_version, options):
+        galerie = Galerie.depuis_base(model_version)
+        if not len(galerie):
+            raise CommandError("Aucun embedding en base pour ce modèle.")
+        index = IndexIVF.construire(galerie, model_version, nlist=options['nlist'], n_iter=options['iterations'])
+        top_k = options['top_k']
+
+        # probes : embeddings existants bruités, pour simuler une autre photo de la même personne
+        rng = np.random.default_rng(0)
+        lignes = rng.choice(len(galerie), min(options['requetes'], len(galerie)), replace=False)
+        probes = [
+            normaliser(galerie.matrice[i] + options['bruit'] * rng.standard_normal(galerie.matrice.shape[1]) / np.sqrt(galerie.matrice.shape[1]))
+            for i in lignes
+        ]
+
+        debut = time.perf_counter()
+        verites = [
+            {pid for pid, _, _ in galerie.rechercher(p, top_k=top_k, seuil=-1.0)} for p in probes
+        ]
+        exact_ms = (time.perf_counter() - debut) * 1000 / len(probes)
+
+        self.stdout.write(f"Galerie : {len(galerie)} embeddings, {index.nlist} listes, top_k={top_k}")
+        self.stdout.write(f"{'nprobe':>8} {'rappel@k':>10} {'moy. ms':>10} {'p95 ms':>10} {'gain':>8}")
+        self.stdout.write(f"{'exact':>8} {1.0:>10.3f} {exact_ms:>10.2f} {'':>10} {1.0:>7.1f}x")
+        for nprobe in [int(x) for x in options['nprobe'].split(',')]:
+            latences = []
+            rappels = []
+            for probe, verite in zip(probes, verites):
+                debut = time.perf_counter()
+                trouves = index.rechercher(probe, top_k=top_k, seuil=-1.0, nprobe=nprobe)
+                latences.append((time.perf_counter() - debut) * 1000)
+                rappels.append(len(verite & {pid for pid, _, _ in trouves}) / max(1, len(verite)))
+            moyenne = float(np.mean(latences))
+            self.stdout.write(
+                f"{nprobe:>8} {np.mean(rappels):>10.3f} {moyenne:>10.2f} "
+                f"{np.percentile(latences, 95):>10.2f} {exact_ms / moyenne:>7.1f}x"
+            )
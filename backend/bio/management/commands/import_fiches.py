@@ -0,0 +1,65 @@
+import json
+import zipfile
+
+from django.core.management.base import BaseCommand, CommandError
+
+from bio.import_fiches import LECTEURS, ArchivePhotos, FormatInvalide, ImportFiches, format_fichier
+from bio.models import Utilisateur
+
+
+class Command(BaseCommand):
+    help = (
+        "Importe des fiches en masse depuis un CSV ou NDJSON au format des exports, avec une archive ZIP "
+        "de photos facultative. Écriture par lots (bulk_create), rejets détaillés par ligne."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('fichier')
+        parser.add_argument('--photos', help="archive ZIP des photos citées dans le fichier")
+        parser.add_argument('--format', choices=['csv', 'ndjson'], help="déduit de l'extension par défaut")
+        parser.add_argument('--lot', type=int, help="lignes par transaction (défaut : IMPORT_TAILLE_LOT)")
+        parser.add_argument('--utilisateur', help="username enregistré comme créateur des fiches")
+        parser.add_argument('--rapport', help="fichier JSON où écrire le rapport complet (rejets compris)")
+
+    def handle(self, *args, **options):
+        try:
+            format_ = format_fichier(options['fichier'], options['format'])
+        except FormatInvalide as e:
+            raise CommandError(str(e))
+        utilisateur_id = None
+        if options['utilisateur']:
+            utilisateur_id = Utilisateur.objects.filter(username=options['utilisateur']).values_list('id', flat=True).first()
+            if utilisateur_id is None:
+                raise CommandError(f"Utilisateur inconnu : {options['utilisateur']}")
+
+        photos = None
+        if options['photos']:
+            try:
+                photos = ArchivePhotos(options['photos'])
+            except (OSError, zipfile.BadZipFile) as e:
+                raise CommandError(f"Archive de photos illisible : {e}")
+
+        import_ = ImportFiches(utilisateur_id=utilisateur_id, photos=photos, taille_lot=options['lot'])
+        try:
+            with open(options['fichier'], 'rb') as fichier:
+                rapport = import_.importer(LECTEURS[format_](fichier), progression=self.progression)
+        except OSError as e:
+            raise CommandError(str(e))
+
+        for rejet in rapport['rejets'][:50]:
+            self.stderr.write(f"ligne {rejet['ligne']} : {json.dumps(rejet['erreurs'], ensure_ascii=False)}")
+        if len(rapport['rejets']) > 50:
+            self.stderr.write(f"... {len(rapport['rejets']) - 50} autre(s) rejet(s)")
+        if options['rapport']:
+            with open(options['rapport'], 'w', encoding='utf-8') as f:
+                json.dump(rapport, f, ensure_ascii=False, indent=2)
+        self.stdout.write(self.style.SUCCESS(
+            f"{rapport['importees']} fiche(s) importée(s), {rapport['rejetees']} rejet(s) en {rapport['duree_s']}s "
+            f"({rapport['lignes_par_seconde'] or 0} lignes/s)"
+        ))
+
+    def progression(self, rapport):
+        self.stdout.write(
+            f"... {rapport['lignes']} ligne(s) lue(s), {rapport['importees']} importée(s), "
+            f"{rapport['lignes_par_seconde'] or 0} lignes/s"
+        )
@@ -0,0 +1,113 @@
+import csv
+import json
+import os
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from bio.models import Role, Utilisateur
+from bio.roles import ids_modele
+
+COLONNES = ('username', 'email', 'password', 'role', 'first_name', 'last_name')
+
+
+def lire_lignes(chemin, format_):
+    """(numéro de ligne, dict) depuis un CSV (en-tête : COLONNES) ou un tableau JSON d'objets."""
+    if format_ == 'json':
+        with open(chemin, encoding='utf-8') as f:
+            donnees = json.load(f)
+        if not isinstance(donnees, list):
+            raise CommandError("Le JSON doit être un tableau d'objets.")
+        yield from enumerate(donnees, start=1)
+    else:
+        with open(chemin, encoding='utf-8-sig', newline='') as f:
+            # ligne 1 : en-tête
+            yield from enumerate(csv.DictReader(f), start=2)
+
+
+class Command(BaseCommand):
+    help = (
+        "Crée des comptes en masse depuis un fichier CSV ou JSON (colonnes : username, email, password, "
+        "role, first_name, last_name). Insertions groupées : comptes, puis permissions du rôle."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('fichier')
+        parser.add_argument('--format', choices=['csv', 'json'], help="déduit de l'extension par défaut")
+        parser.add_argument('--lot', type=int, default=500, help="comptes créés par transaction")
+
+    def handle(self, *args, **options):
+        chemin = options['fichier']
+        if not os.path.exists(chemin):
+            raise CommandError(f"Fichier introuvable : {chemin}")
+        format_ = options['format'] or ('json' if chemin.lower().endswith('.json') else 'csv')
+
+        debut = time.perf_counter()
+        roles = dict(Role.objects.values_list('name', 'id'))
+        existants = set(Utilisateur.objects.values_list('username', flat=True))
+        rejets, lot = [], []
+        crees = 0
+
+        for numero, ligne in lire_lignes(chemin, format_):
+            erreur = self.valider(ligne, roles, existants)
+            if erreur:
+                rejets.append((numero, erreur))
+                continue
+            existants.add(ligne['username'].strip())
+            lot.append(self.utilisateur(ligne, roles))
+            if len(lot) == options['lot']:
+                crees += self.creer(lot)
+                lot = []
+        if lot:
+            crees += self.creer(lot)
+
+        for numero, erreur in rejets:
+            self.stderr.write(f"ligne {numero} : {erreur}")
+        duree = time.perf_counter() - debut
+        self.stdout.write(self.style.SUCCESS(
+            f"{crees} compte(s) créé(s), {len(rejets)} rejet(s) en {duree:.1f}s"
+        ))
+
+    def valider(self, ligne, roles, existants):
+        if not isinstance(ligne, dict):
+            return "objet attendu"
+        username = (ligne.get('username') or '').strip()
+        if not username:
+            return "username manquant"
+        if username in existants:
+            return f"'{username}' existe déjà"
+        role = (ligne.get('role') or '').strip()
+        if role and role not in roles:
+            return f"rôle inconnu '{role}'"
+        return None
+
+    def utilisateur(self, ligne, roles):
+        role = (ligne.get('role') or '').strip()
+        utilisateur = Utilisateur(
+            username=ligne['username'].strip(),
+            email=(ligne.get('email') or '').strip(),
+            first_name=(ligne.get('first_name') or '').strip(),
+            last_name=(ligne.get('last_name') or '').strip(),
+            role_id=roles.get(role),
+        )
+        # sans mot de passe : compte inutilisable tant qu'un administrateur n'en a pas défini un
+        utilisateur.password = make_password(ligne.get('password') or None)
+        return utilisateur
+
+    def creer(self, lot):
+        """Un lot : insertion des comptes puis des permissions de leur rôle, dans une transaction."""
+        with transaction.atomic():
+            Utilisateur.objects.bulk_create(lot)
+            # MySQL ne renvoie pas les ids créés par bulk_create : relus par username
+            ids = dict(Utilisateur.objects.filter(
+                username__in=[u.username for u in lot]
+            ).values_list('username', 'id'))
+            Liaison = Utilisateur.permissions.through
+            Liaison.objects.bulk_create([
+                Liaison(utilisateur_id=ids[u.username], permission_id=permission_id)
+                for u in lot
+                for permission_id in ids_modele(u.role_id, u.is_superuser)
+            ], ignore_conflicts=True)
+        return len(lot)
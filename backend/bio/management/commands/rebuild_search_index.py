@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from bio.models import Personne
+from bio.recherche import indexer
+
+
+class Command(BaseCommand):
+    help = "Reconstruit l'index de recherche textuelle (TermeRecherche) de toutes les fiches."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lot', type=int, default=1000, help="personnes indexées par lot")
+
+    def handle(self, *args, **options):
+        debut = time.perf_counter()
+        ids = Personne.objects.order_by('id').values_list('id', flat=True)
+        lot = []
+        total = 0
+        for personne_id in ids.iterator(chunk_size=options['lot']):
+            lot.append(personne_id)
+            if len(lot) == options['lot']:
+                indexer(lot)
+                total += len(lot)
+                lot = []
+                self.stdout.write(f"{total} personne(s) indexée(s)")
+        if lot:
+            indexer(lot)
+            total += len(lot)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{total} personne(s) indexée(s) en {time.perf_counter() - debut:.1f}s"
+        ))
@@ -0,0 +1,208 @@
+import json
+import multiprocessing
+import os
+import time
+from collections import deque
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from bio import ann, mmap_gallery
+from bio.faces import CHAMPS_PHOTO, ImageIllisible, analyser_photo, get_modele, normaliser
+from bio.models import EmbeddingVisage, Personne
+
+
+def enregistrer_embeddings(embeddings):
+    """Insère ou remplace les embeddings (un par personne et par photo) en une requête."""
+    options = {}
+    # MySQL (ON DUPLICATE KEY UPDATE) refuse unique_fields : la clé unique (personne, champ) suffit
+    if connections[EmbeddingVisage.objects.db].features.supports_update_conflicts_with_target:
+        options['unique_fields'] = ['personne', 'champ']
+    EmbeddingVisage.objects.bulk_create(
+        embeddings,
+        update_conflicts=True,
+        update_fields=['vecteur', 'bbox', 'det_score', 'model_version', 'date_calcul'],
+        **options,
+    )
+
+
+def _init_processus(threads):
+    # un modèle par processus, chargé une fois avant le premier lot
+    settings.FACE_MODEL_THREADS = threads
+    get_modele()
+
+
+def _analyser_lot(photos):
+    """Calcule les embeddings d'un lot de (personne_id, champ, chemin), sans accès base."""
+    resultats = []
+    for personne_id, champ, chemin in photos:
+        try:
+            face = analyser_photo(chemin)
+        except ImageIllisible as e:
+            resultats.append((personne_id, champ, 'error', str(e)))
+            continue
+        if face is None:
+            resultats.append((personne_id, champ, 'no_face', None))
+        else:
+            resultats.append((personne_id, champ, 'done', (
+                normaliser(face.embedding).tobytes(),
+                [float(x) for x in face.bbox],
+                float(face.det_score),
+            )))
+    return resultats
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcule les embeddings des photos de Personne (changement de modèle ou de det_size) "
+        "dans un pool de processus, avec reprise sur point de contrôle."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processus', type=int, default=os.cpu_count(), help="processus de calcul (un modèle chacun)")
+        parser.add_argument('--threads', type=int, default=1, help="threads ONNX par processus")
+        parser.add_argument('--lot', type=int, default=32, help="personnes par lot envoyé au pool")
+        parser.add_argument('--id-min', type=int)
+        parser.add_argument('--id-max', type=int)
+        parser.add_argument('--depuis', help="date_creation minimale (AAAA-MM-JJ)")
+        parser.add_argument('--jusqu-a', help="date_creation maximale incluse (AAAA-MM-JJ)")
+        parser.add_argument('--model-version', help="ne reprend que les personnes dont un embedding vient de cette version")
+        parser.add_argument('--checkpoint', default=os.path.join(settings.BASE_DIR, 'index', 'reindex_faces.json'))
+        parser.add_argument('--reprendre', action='store_true', help="repart du dernier point de contrôle")
+
+    def handle(self, *args, **options):
+        filtres = {k: options[k] for k in ('id_min', 'id_max', 'depuis', 'jusqu_a', 'model_version')}
+        filtres['modele'] = settings.FACE_MODEL_NAME
+        dernier_id = self.lire_checkpoint(options['checkpoint'], filtres) if options['reprendre'] else None
+
+        personnes = self.queryset(filtres, dernier_id)
+        total = personnes.count()
+        self.stdout.write(f"{total} personne(s) à traiter, {options['processus']} processus")
+        if not total:
+            return
+
+        # les processus forkés ne doivent pas hériter des connexions ouvertes
+        connections.close_all()
+        pool = multiprocessing.Pool(options['processus'], initializer=_init_processus, initargs=(options['threads'],))
+        en_cours = deque()
+        traitees = photos = 0
+        debut = time.perf_counter()
+        try:
+            for lot in self.lots(personnes, options['lot']):
+                en_cours.append((lot[-1][0], len(lot), sum(len(p) for _, p in lot), pool.apply_async(
+                    _analyser_lot, ([photo for _, p in lot for photo in p],)
+                )))
+                # au plus deux lots d'avance par processus : mémoire bornée
+                while len(en_cours) >= 2 * options['processus']:
+                    traitees, photos = self.ecrire(en_cours.popleft(), options, filtres, traitees, photos, total, debut)
+            while en_cours:
+                traitees, photos = self.ecrire(en_cours.popleft(), options, filtres, traitees, photos, total, debut)
+        finally:
+            pool.terminate()
+
+        mmap_gallery.reconstruire(str(settings.FACE_GALLERY_PATH), settings.FACE_MODEL_NAME)
+        if os.path.exists(options['checkpoint']):
+            os.remove(options['checkpoint'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Terminé : {photos} photo(s) en {time.perf_counter() - debut:.0f}s, galerie partagée reconstruite"
+        ))
+
+    def queryset(self, filtres, dernier_id):
+        sans_photo = Q()
+        for champ in CHAMPS_PHOTO:
+            sans_photo &= Q(**{champ: ''}) | Q(**{f'{champ}__isnull': True})
+        qs = Personne.objects.exclude(sans_photo)
+        if filtres['id_min'] is not None:
+            qs = qs.filter(id__gte=filtres['id_min'])
+        if filtres['id_max'] is not None:
+            qs = qs.filter(id__lte=filtres['id_max'])
+        if filtres['depuis']:
+            qs = qs.filter(date_creation__date__gte=self.date(filtres['depuis']))
+        if filtres['jusqu_a']:
+            qs = qs.filter(date_creation__date__lte=self.date(filtres['jusqu_a']))
+        if filtres['model_version']:
+            qs = qs.filter(id__in=EmbeddingVisage.objects.filter(
+                model_version=filtres['model_version']
+            ).values('personne_id'))
+        if dernier_id is not None:
+            qs = qs.filter(id__gt=dernier_id)
+        return qs.order_by('id').only('id', *CHAMPS_PHOTO)
+
+    def date(self, valeur):
+        d = parse_date(valeur)
+        if d is None:
+            raise CommandError(f"Date invalide : {valeur}")
+        return d
+
+    def lots(self, personnes, taille):
+        """Lots de (personne_id, [(personne_id, champ, chemin), ...]) lus en flux."""
+        lot = []
+        for personne in personnes.iterator(chunk_size=2000):
+            lot.append((personne.id, [
+                (personne.id, champ, getattr(personne, champ).path)
+                for champ in CHAMPS_PHOTO if getattr(personne, champ)
+            ]))
+            if len(lot) == taille:
+                yield lot
+                lot = []
+        if lot:
+            yield lot
+
+    def ecrire(self, en_cours, options, filtres, traitees, photos, total, debut):
+        dernier_id, nb_personnes, nb_photos, resultat = en_cours
+        resultats = resultat.get()
+
+        embeddings = []
+        sans_visage = Q(pk__in=[])
+        erreurs = 0
+        for personne_id, champ, statut, data in resultats:
+            if statut == 'done':
+                vecteur, bbox, det_score = data
+                embeddings.append(EmbeddingVisage(
+                    personne_id=personne_id, champ=champ, vecteur=vecteur, bbox=bbox,
+                    det_score=det_score, model_version=settings.FACE_MODEL_NAME,
+                    date_calcul=timezone.now(),
+                ))
+            elif statut == 'no_face':
+                sans_visage |= Q(personne_id=personne_id, champ=champ)
+            else:
+                erreurs += 1
+                self.stderr.write(data)
+
+        enregistrer_embeddings(embeddings)
+        EmbeddingVisage.objects.filter(sans_visage).delete()
+        ann.signaler_modification()  # bulk_create n'émet pas de signaux
+
+        traitees += nb_personnes
+        photos += nb_photos
+        self.ecrire_checkpoint(options['checkpoint'], filtres, dernier_id)
+
+        duree = time.perf_counter() - debut
+        debit = photos / duree if duree else 0
+        eta = (total - traitees) * duree / traitees if traitees else 0
+        self.stdout.write(
+            f"{traitees}/{total} personnes, {photos} photos, {debit:.1f} visages/s, "
+            f"{erreurs} erreur(s) dans le lot, ETA {eta / 60:.1f} min"
+        )
+        return traitees, photos
+
+    def lire_checkpoint(self, chemin, filtres):
+        if not os.path.exists(chemin):
+            return None
+        with open(chemin) as f:
+            checkpoint = json.load(f)
+        if checkpoint['filtres'] != filtres:
+            raise CommandError("Le point de contrôle correspond à d'autres filtres ; relancer sans --reprendre.")
+        self.stdout.write(f"Reprise après la personne {checkpoint['dernier_id']}")
+        return checkpoint['dernier_id']
+
+    def ecrire_checkpoint(self, chemin, filtres, dernier_id):
+        os.makedirs(os.path.dirname(chemin), exist_ok=True)
+        tmp = f"{chemin}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump({'filtres': filtres, 'dernier_id': dernier_id}, f)
+        os.replace(tmp, chemin)
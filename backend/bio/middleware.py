@@ -0,0 +1,19 @@
+from django.conf import settings
+
+
+class CacheRenditionsMiddleware:
+    """
+    Cache long pour les renditions servies par Django : leur nom dépend de leur
+    contenu, une URL ne change donc jamais. En production, le serveur web qui
+    sert MEDIA_ROOT doit appliquer le même en-tête sur ce préfixe.
+    """
+    PREFIXE = settings.MEDIA_URL + 'renditions/'
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if request.path.startswith(self.PREFIXE) and response.status_code == 200:
+            response['Cache-Control'] = 'public, max-age=31536000, immutable'
+        return response
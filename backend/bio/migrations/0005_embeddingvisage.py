@@ -0,0 +1,31 @@
+# Generated by Django 4.2.30 on 2026-10-18 02:21
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bio', '0004_activite'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmbeddingVisage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('champ', models.CharField(choices=[('photo_face', 'Photo de face'), ('photo_profil', 'Photo de profil'), ('photo_longue', 'Photo longue')], max_length=20)),
+                ('vecteur', models.BinaryField()),
+                ('bbox', models.JSONField()),
+                ('det_score', models.FloatField()),
+                ('model_version', models.CharField(max_length=50)),
+                ('date_calcul', models.DateTimeField(auto_now=True)),
+                ('personne', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='embeddings', to='bio.personne')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['model_version'], name='bio_embeddi_model_v_a7d33b_idx')],
+                'unique_together': {('personne', 'champ')},
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.30 on 2026-10-18 02:27
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bio', '0005_embeddingvisage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TacheEnrolement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('champ', models.CharField(choices=[('photo_face', 'Photo de face'), ('photo_profil', 'Photo de profil'), ('photo_longue', 'Photo longue')], max_length=20)),
+                ('statut', models.CharField(choices=[('pending', 'En attente'), ('running', 'En cours'), ('done', 'Terminé'), ('no_face', 'Aucun visage'), ('error', 'Erreur')], default='pending', max_length=10)),
+                ('tentatives', models.PositiveIntegerField(default=0)),
+                ('erreur', models.TextField(blank=True)),
+                ('disponible_a', models.DateTimeField(default=django.utils.timezone.now)),
+                ('date_creation', models.DateTimeField(auto_now_add=True)),
+                ('date_maj', models.DateTimeField(auto_now=True)),
+                ('personne', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='taches_enrolement', to='bio.personne')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['statut', 'disponible_a'], name='bio_tacheen_statut_2e9a1d_idx')],
+                'unique_together': {('personne', 'champ')},
+            },
+        ),
+    ]
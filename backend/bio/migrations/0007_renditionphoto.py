@@ -0,0 +1,29 @@
+# Generated by Django 4.2.30 on 2026-10-18 02:30
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bio', '0006_tacheenrolement'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RenditionPhoto',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('champ', models.CharField(choices=[('photo_face', 'Photo de face'), ('photo_profil', 'Photo de profil'), ('photo_longue', 'Photo longue')], max_length=20)),
+                ('type', models.CharField(choices=[('thumb', 'Miniature'), ('preview', 'Aperçu'), ('face', 'Visage recadré')], max_length=10)),
+                ('fichier', models.ImageField(upload_to='renditions/')),
+                ('largeur', models.PositiveIntegerField(default=0)),
+                ('hauteur', models.PositiveIntegerField(default=0)),
+                ('personne', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='renditions', to='bio.personne')),
+            ],
+            options={
+                'unique_together': {('personne', 'champ', 'type')},
+            },
+        ),
+    ]
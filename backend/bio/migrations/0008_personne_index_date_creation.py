@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-18 02:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bio', '0007_renditionphoto'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='personne',
+            index=models.Index(fields=['date_creation', 'id'], name='bio_personn_date_cr_645f61_idx'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.30 on 2026-10-18 02:32
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bio', '0008_personne_index_date_creation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TermeRecherche',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('terme', models.CharField(max_length=50)),
+                ('champ', models.CharField(max_length=30)),
+                ('poids', models.PositiveSmallIntegerField()),
+                ('personne', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='termes', to='bio.personne')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['terme', 'personne'], name='bio_termere_terme_fef08f_idx')],
+            },
+        ),
+    ]
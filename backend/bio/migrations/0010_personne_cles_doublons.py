@@ -0,0 +1,45 @@
+# Generated by Django 4.2.30 on 2026-10-18 02:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bio', '0009_termerecherche'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fichedactyloscopique',
+            name='cin_normalise',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=50),
+        ),
+        migrations.AddField(
+            model_name='personne',
+            name='annee_naissance',
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='personne',
+            name='cle_nom',
+            field=models.CharField(blank=True, default='', max_length=16),
+        ),
+        migrations.AddField(
+            model_name='personne',
+            name='cle_prenom',
+            field=models.CharField(blank=True, default='', max_length=16),
+        ),
+        migrations.AddIndex(
+            model_name='personne',
+            index=models.Index(fields=['cle_nom', 'cle_prenom'], name='bio_personn_cle_nom_15fac2_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='personne',
+            index=models.Index(fields=['cle_nom', 'annee_naissance'], name='bio_personn_cle_nom_61bae8_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='personne',
+            index=models.Index(fields=['cle_prenom', 'annee_naissance'], name='bio_personn_cle_pre_643864_idx'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.30 on 2026-10-18 02:41
+
+import bio.models
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bio', '0010_personne_cles_doublons'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TacheExport',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('format', models.CharField(choices=[('excel', 'Excel (xlsx)'), ('csv', 'CSV'), ('ndjson', 'NDJSON'), ('xml', 'XML')], max_length=10)),
+                ('filtres', models.JSONField(default=dict)),
+                ('cle', models.CharField(max_length=64)),
+                ('statut', models.CharField(choices=[('pending', 'En attente'), ('running', 'En cours'), ('done', 'Terminé'), ('error', 'Erreur')], default='pending', max_length=10)),
+                ('lignes', models.PositiveIntegerField(default=0)),
+                ('total', models.PositiveIntegerField(blank=True, null=True)),
+                ('fichier', models.FileField(blank=True, storage=bio.models.stockage_exports, upload_to='')),
+                ('erreur', models.TextField(blank=True)),
+                ('date_creation', models.DateTimeField(auto_now_add=True)),
+                ('date_maj', models.DateTimeField(auto_now=True)),
+                ('date_fin', models.DateTimeField(blank=True, null=True)),
+                ('expire_le', models.DateTimeField(blank=True, null=True)),
+                ('utilisateur', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='exports', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['statut', 'date_creation'], name='bio_tacheex_statut_008cf1_idx'), models.Index(fields=['cle', 'statut'], name='bio_tacheex_cle_6247c2_idx')],
+            },
+        ),
+    ]
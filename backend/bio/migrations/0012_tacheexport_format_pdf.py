@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 02:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bio', '0011_tacheexport'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='tacheexport',
+            name='format',
+            field=models.CharField(choices=[('excel', 'Excel (xlsx)'), ('csv', 'CSV'), ('ndjson', 'NDJSON'), ('xml', 'XML'), ('pdf', 'Dossiers PDF (zip)')], max_length=10),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 02:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bio', '0012_tacheexport_format_pdf'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='utilisateur',
+            name='version_jetons',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
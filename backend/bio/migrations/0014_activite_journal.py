@@ -0,0 +1,24 @@
+# Generated by Django 4.2.30 on 2026-10-18 02:50
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bio', '0013_utilisateur_version_jetons'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='activite',
+            name='action',
+            field=models.CharField(choices=[('connexion', 'Connexion'), ('ajout_fiche', 'Ajout de fiche'), ('suppression_fiche', 'Suppression de fiche'), ('consultation', 'Consultation'), ('recherche', 'Recherche'), ('export', 'Export')], max_length=50),
+        ),
+        migrations.AlterField(
+            model_name='activite',
+            name='date_heure',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.30 on 2026-10-18 02:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bio', '0014_activite_journal'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='activite',
+            index=models.Index(fields=['date_heure', 'id'], name='bio_activit_date_he_483c22_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='activite',
+            index=models.Index(fields=['utilisateur', 'date_heure'], name='bio_activit_utilisa_719037_idx'),
+        ),
+    ]
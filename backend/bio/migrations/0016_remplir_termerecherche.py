@@ -0,0 +1,68 @@
+import re
+import unicodedata
+
+from django.db import migrations
+
+# copie figée de bio.texte et bio.recherche à la date de la migration
+POIDS = {
+    'nom': 10,
+    'prenom': 8,
+    'surnom': 6,
+    'dactyloscopique__cin': 10,
+    'dactyloscopique__nrpv': 10,
+    'filiation_pere': 3,
+    'filiation_mere': 3,
+    'lieu_naissance': 2,
+    'domicile': 2,
+}
+IDENTIFIANTS = ('dactyloscopique__cin', 'dactyloscopique__nrpv')
+LONGUEUR_TERME = 50
+TAILLE_LOT = 1000
+_NON_ALNUM = re.compile(r'[^a-z0-9]+')
+
+
+def mots(valeur):
+    if not valeur:
+        return []
+    decompose = unicodedata.normalize('NFKD', str(valeur))
+    sans_accents = ''.join(c for c in decompose if not unicodedata.combining(c))
+    return _NON_ALNUM.sub(' ', sans_accents.lower()).split()
+
+
+def termes(ligne):
+    vus = {}
+    for champ, poids in POIDS.items():
+        valeur = ligne.get(champ)
+        candidats = mots(valeur)
+        if champ in IDENTIFIANTS and valeur:
+            candidats.append(''.join(mots(valeur)))
+        for terme in candidats:
+            terme = terme[:LONGUEUR_TERME]
+            if poids > vus.get((terme, champ), 0):
+                vus[(terme, champ)] = poids
+    return [(terme, champ, poids) for (terme, champ), poids in vus.items()]
+
+
+def remplir_index(apps, schema_editor):
+    """Indexe les fiches créées avant 0009 (les suivantes l'ont été par le signal index_personne)."""
+    Personne = apps.get_model('bio', 'Personne')
+    TermeRecherche = apps.get_model('bio', 'TermeRecherche')
+    ids = list(Personne.objects.filter(termes__isnull=True).order_by('id').values_list('id', flat=True))
+    for debut in range(0, len(ids), TAILLE_LOT):
+        lignes = Personne.objects.filter(id__in=ids[debut:debut + TAILLE_LOT]).values('id', *POIDS)
+        TermeRecherche.objects.bulk_create([
+            TermeRecherche(terme=terme, personne_id=ligne['id'], champ=champ, poids=poids)
+            for ligne in lignes
+            for terme, champ, poids in termes(ligne)
+        ], batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bio', '0015_activite_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(remplir_index, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 03:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bio', '0016_remplir_termerecherche'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='personne',
+            name='ref_import',
+            field=models.CharField(blank=True, editable=False, max_length=40, null=True, unique=True),
+        ),
+    ]
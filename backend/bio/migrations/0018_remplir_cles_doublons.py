@@ -0,0 +1,90 @@
+import re
+import unicodedata
+
+from django.db import migrations
+from django.db.models import Q
+
+# copie figée de bio.texte à la date de la migration
+TAILLE_LOT = 2000
+_NON_ALNUM = re.compile(r'[^a-z0-9]+')
+_REGLES_PHONETIQUES = [
+    (re.compile(r'eau|au'), 'o'),
+    (re.compile(r'ou'), 'u'),
+    (re.compile(r'o'), 'u'),
+    (re.compile(r'ai|ei|e'), 'e'),
+    (re.compile(r'y'), 'i'),
+    (re.compile(r'ph'), 'f'),
+    (re.compile(r'th'), 't'),
+    (re.compile(r'sch|ch|sh'), 'x'),
+    (re.compile(r'gn'), 'n'),
+    (re.compile(r'qu|q|ck'), 'k'),
+    (re.compile(r'c(?=[eiy])'), 's'),
+    (re.compile(r'c'), 'k'),
+    (re.compile(r'gu(?=[ei])'), 'g'),
+    (re.compile(r'g(?=[ei])'), 'j'),
+    (re.compile(r'(?<=[aeiu])s(?=[aeiu])'), 'z'),
+    (re.compile(r'w'), 'v'),
+    (re.compile(r'h'), ''),
+    (re.compile(r'(?<=.)[tdsxz]$'), ''),
+]
+
+
+def mots(valeur):
+    if not valeur:
+        return []
+    decompose = unicodedata.normalize('NFKD', str(valeur))
+    sans_accents = ''.join(c for c in decompose if not unicodedata.combining(c))
+    return _NON_ALNUM.sub(' ', sans_accents.lower()).split()
+
+
+def code_phonetique(valeur):
+    texte = ''.join(mots(valeur))
+    if not texte:
+        return ''
+    texte = re.sub(r'(.)\1+', r'\1', texte)
+    for motif, remplacement in _REGLES_PHONETIQUES:
+        texte = motif.sub(remplacement, texte)
+    if not texte:
+        return ''
+    code = texte[0] + re.sub(r'[aeiu]', '', texte[1:])
+    return re.sub(r'(.)\1+', r'\1', code)[:16]
+
+
+def remplir_cles(apps, schema_editor):
+    """Calcule les clés des fiches créées avant 0010 (les suivantes les ont reçues à l'enregistrement)."""
+    Personne = apps.get_model('bio', 'Personne')
+    FicheDactyloscopique = apps.get_model('bio', 'FicheDactyloscopique')
+
+    a_remplir = Personne.objects.filter(
+        Q(cle_nom='', nom__gt='') | Q(cle_prenom='', prenom__gt='')
+        | Q(annee_naissance__isnull=True, date_naissance__isnull=False)
+    )
+    ids = list(a_remplir.order_by('id').values_list('id', flat=True))
+    for debut in range(0, len(ids), TAILLE_LOT):
+        lot = list(Personne.objects.filter(id__in=ids[debut:debut + TAILLE_LOT]).only('id', 'nom', 'prenom', 'date_naissance'))
+        for personne in lot:
+            personne.cle_nom = code_phonetique(personne.nom)
+            prenoms = mots(personne.prenom)
+            personne.cle_prenom = code_phonetique(prenoms[0]) if prenoms else ''
+            personne.annee_naissance = personne.date_naissance.year if personne.date_naissance else None
+        Personne.objects.bulk_update(lot, ['cle_nom', 'cle_prenom', 'annee_naissance'])
+
+    ids = list(
+        FicheDactyloscopique.objects.filter(cin_normalise='', cin__gt='').order_by('id').values_list('id', flat=True)
+    )
+    for debut in range(0, len(ids), TAILLE_LOT):
+        lot = list(FicheDactyloscopique.objects.filter(id__in=ids[debut:debut + TAILLE_LOT]).only('id', 'cin'))
+        for fiche in lot:
+            fiche.cin_normalise = ''.join(mots(fiche.cin))
+        FicheDactyloscopique.objects.bulk_update(lot, ['cin_normalise'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bio', '0017_personne_ref_import'),
+    ]
+
+    operations = [
+        migrations.RunPython(remplir_cles, migrations.RunPython.noop),
+    ]
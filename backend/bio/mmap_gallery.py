@@ -0,0 +1,228 @@
+"""
+Galerie d'embeddings partagée entre les workers via un fichier mappé en mémoire.
+
+Le fichier contient un en-tête (version du modèle, dimension, nombre de
+lignes, compteur de génération) suivi d'enregistrements de taille fixe
+ajoutés en fin de fichier. Une suppression pose une marque (tombstone) sur
+l'enregistrement ; la compaction réécrit le fichier sans les lignes marquées.
+Chaque worker mappe le fichier avec np.memmap (pages partagées par le noyau)
+et le remappe dès que le compteur de génération de l'en-tête change.
+"""
+import fcntl
+import os
+import struct
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+from django.conf import settings
+
+from .faces import CHAMPS_PHOTO
+from .gallery import DIMENSION, Galerie, lire_embeddings
+from .models import EmbeddingVisage
+
+MAGIC = b'BIOGAL01'
+ENTETE = struct.Struct('<8sIIQQQ32s')  # magic, dim, réservé, lignes, génération, supprimées, modèle
+TAILLE_ENTETE = 4096
+
+ENREGISTREMENT = np.dtype({
+    'names': ['id', 'personne_id', 'champ', 'supprime', 'vecteur'],
+    'formats': ['<i8', '<i8', 'i1', 'u1', ('<f4', (DIMENSION,))],
+    'offsets': [0, 8, 16, 17, 32],
+    'itemsize': 32 + 4 * DIMENSION,
+})
+
+
+def lire_entete(chemin):
+    with open(chemin, 'rb') as f:
+        magic, dim, _, lignes, generation, supprimees, modele = ENTETE.unpack(f.read(ENTETE.size))
+    if magic != MAGIC:
+        raise ValueError(f"{chemin} n'est pas un fichier de galerie")
+    return {
+        'dimension': dim,
+        'lignes': lignes,
+        'generation': generation,
+        'supprimees': supprimees,
+        'model_version': modele.rstrip(b'\0').decode(),
+    }
+
+
+def _ecrire_entete(f, entete):
+    f.seek(0)
+    f.write(ENTETE.pack(
+        MAGIC, entete['dimension'], 0, entete['lignes'], entete['generation'],
+        entete['supprimees'], entete['model_version'].encode()[:32],
+    ))
+
+
+@contextmanager
+def verrou_ecriture(chemin):
+    """Verrou exclusif inter-processus pour les écrivains."""
+    os.makedirs(os.path.dirname(chemin), exist_ok=True)
+    with open(f"{chemin}.lock", 'w') as verrou:
+        fcntl.flock(verrou, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(verrou, fcntl.LOCK_UN)
+
+
+def _enregistrements(ids, personne_ids, champs, vecteurs):
+    lignes = np.zeros(len(ids), dtype=ENREGISTREMENT)
+    lignes['id'] = ids
+    lignes['personne_id'] = personne_ids
+    lignes['champ'] = champs
+    lignes['vecteur'] = vecteurs
+    return lignes
+
+
+def _ecrire_fichier(chemin, model_version, lignes, generation):
+    """Écrit un fichier complet dans un temporaire puis le renomme (atomique)."""
+    tmp = f"{chemin}.{os.getpid()}.tmp"
+    with open(tmp, 'wb') as f:
+        _ecrire_entete(f, {
+            'dimension': DIMENSION, 'lignes': len(lignes), 'generation': generation,
+            'supprimees': 0, 'model_version': model_version,
+        })
+        f.seek(TAILLE_ENTETE)
+        f.write(lignes.tobytes())
+    os.replace(tmp, chemin)
+
+
+def reconstruire(chemin, model_version):
+    """Recrée le fichier à partir de la table EmbeddingVisage."""
+    with verrou_ecriture(chemin):
+        generation = lire_entete(chemin)['generation'] + 1 if os.path.exists(chemin) else 1
+        queryset = EmbeddingVisage.objects.filter(model_version=model_version)
+        _ecrire_fichier(chemin, model_version, _enregistrements(*lire_embeddings(queryset)), generation)
+
+
+def ajouter(chemin, ids, personne_ids, champs, vecteurs):
+    """Ajoute des embeddings en fin de fichier ; un id déjà présent est d'abord marqué supprimé."""
+    with verrou_ecriture(chemin):
+        _marquer_supprimes(chemin, ids)
+        lignes = _enregistrements(ids, personne_ids, champs, vecteurs)
+        with open(chemin, 'r+b') as f:
+            entete = lire_entete(chemin)
+            f.seek(TAILLE_ENTETE + entete['lignes'] * ENREGISTREMENT.itemsize)
+            f.write(lignes.tobytes())
+            f.flush()
+            # l'en-tête est écrit en dernier : les lecteurs ne voient que des lignes complètes
+            entete['lignes'] += len(lignes)
+            entete['generation'] += 1
+            _ecrire_entete(f, entete)
+
+
+def supprimer(chemin, ids):
+    with verrou_ecriture(chemin):
+        if _marquer_supprimes(chemin, ids):
+            _compacter_si_necessaire(chemin)
+
+
+def compacter(chemin):
+    with verrou_ecriture(chemin):
+        _compacter(chemin)
+
+
+def _marquer_supprimes(chemin, ids):
+    entete = lire_entete(chemin)
+    if not entete['lignes']:
+        return 0
+    lignes = np.memmap(chemin, dtype=ENREGISTREMENT, mode='r+', offset=TAILLE_ENTETE, shape=(entete['lignes'],))
+    cibles = np.flatnonzero(np.isin(lignes['id'], ids) & (lignes['supprime'] == 0))
+    if len(cibles):
+        lignes['supprime'][cibles] = 1
+        lignes.flush()
+        with open(chemin, 'r+b') as f:
+            entete['supprimees'] += len(cibles)
+            entete['generation'] += 1
+            _ecrire_entete(f, entete)
+    del lignes
+    return len(cibles)
+
+
+def _compacter_si_necessaire(chemin):
+    entete = lire_entete(chemin)
+    if entete['supprimees'] > settings.FACE_GALLERY_COMPACT_RATIO * max(entete['lignes'], 1):
+        _compacter(chemin)
+
+
+def _compacter(chemin):
+    entete = lire_entete(chemin)
+    lignes = np.memmap(chemin, dtype=ENREGISTREMENT, mode='r', offset=TAILLE_ENTETE, shape=(entete['lignes'],))
+    vivantes = np.array(lignes[lignes['supprime'] == 0])
+    del lignes
+    _ecrire_fichier(chemin, entete['model_version'], vivantes, entete['generation'] + 1)
+
+
+class GalerieMmap(Galerie):
+    """Galerie en lecture seule adossée au fichier mappé ; les lignes supprimées ne sont jamais retenues."""
+
+    def __init__(self, lignes, generation):
+        self.lignes = lignes
+        self.ids = lignes['id']
+        self.personne_ids = lignes['personne_id']
+        self.champs = lignes['champ']
+        self.matrice = lignes['vecteur']  # vue à pas fixe, utilisable telle quelle par BLAS
+        self.signature = generation
+
+    def scores(self, probe):
+        scores = super().scores(probe)
+        scores[self.lignes['supprime'] != 0] = -np.inf
+        return scores
+
+    def scores_lot(self, probes):
+        scores = super().scores_lot(probes)
+        scores[:, self.lignes['supprime'] != 0] = -np.inf
+        return scores
+
+
+_galerie = None
+_cle = None
+_verrou = threading.Lock()
+
+
+def get_galerie_partagee():
+    """
+    Galerie mappée du processus. Seul l'en-tête est relu à chaque appel ;
+    le fichier est remappé quand la génération ou le fichier (compaction) change.
+    """
+    global _galerie, _cle
+    chemin = str(settings.FACE_GALLERY_PATH)
+    model_version = settings.FACE_MODEL_NAME
+
+    if not os.path.exists(chemin) or lire_entete(chemin)['model_version'] != model_version:
+        reconstruire(chemin, model_version)
+
+    entete = lire_entete(chemin)
+    cle = (os.stat(chemin).st_ino, entete['generation'])
+    if cle != _cle:
+        with _verrou:
+            if cle != _cle:
+                if entete['lignes']:
+                    lignes = np.memmap(chemin, dtype=ENREGISTREMENT, mode='r', offset=TAILLE_ENTETE, shape=(entete['lignes'],))
+                else:
+                    lignes = np.zeros(0, dtype=ENREGISTREMENT)
+                _galerie = GalerieMmap(lignes, entete['generation'])
+                _cle = cle
+    return _galerie
+
+
+def enregistrer(embedding):
+    """Reporte un embedding enregistré en base dans le fichier partagé."""
+    chemin = str(settings.FACE_GALLERY_PATH)
+    if embedding.model_version != settings.FACE_MODEL_NAME or not os.path.exists(chemin):
+        return  # le fichier sera construit depuis la base à la première recherche
+    ajouter(
+        chemin,
+        np.array([embedding.id], dtype=np.int64),
+        np.array([embedding.personne_id], dtype=np.int64),
+        np.array([CHAMPS_PHOTO.index(embedding.champ)], dtype=np.int8),
+        np.frombuffer(bytes(embedding.vecteur), dtype=np.float32)[None, :],
+    )
+
+
+def retirer(embedding_ids):
+    chemin = str(settings.FACE_GALLERY_PATH)
+    if os.path.exists(chemin):
+        supprimer(chemin, np.asarray(embedding_ids, dtype=np.int64))
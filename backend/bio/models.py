@@ -2,8 +2,14 @@ from django.db import models
 from django.contrib.auth.models import AbstractUser
 from django.db import models
 from django.conf import settings
+from django.core.files.storage import FileSystemStorage
 from django.db.models.signals import post_save
 from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from django.utils.functional import cached_property
+
+from .texte import code_phonetique, mots, normaliser_identifiant
 
 
 class Role(models.Model):
@@ -33,32 +39,32 @@ class Permission(models.Model):
 class Utilisateur(AbstractUser):
     role = models.ForeignKey('Role', on_delete=models.SET_NULL, null=True, blank=True)
     permissions = models.ManyToManyField('Permission', blank=True)
+    # incrémentée pour révoquer les jetons déjà émis (voir bio.authentication)
+    version_jetons = models.PositiveIntegerField(default=0, editable=False)
 
     def has_permission(self, perm_code):
         return self.permissions.filter(code=perm_code).exists() or self.is_superuser
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._profil_enregistre = instance._profil()
+        return instance
+
+    def _profil(self):
+        # champs qui déterminent les permissions d'office (sans charger un champ différé)
+        return self.__dict__.get('role_id'), self.__dict__.get('is_superuser')
+
     def save(self, *args, **kwargs):
         super().save(*args, **kwargs)  # Sauvegarde d’abord l’utilisateur
-        from .models import Permission
-        try:
-            view_users_perm = Permission.objects.get(code='view_users')
-        except Permission.DoesNotExist:
-            view_users_perm = Permission.objects.create(
-                code='view_users', description='Voir la liste des utilisateurs'
-            )
-
-        try:
-            view_personnes_perm = Permission.objects.get(code='view_personnes')
-        except Permission.DoesNotExist:
-            view_personnes_perm = Permission.objects.create(
-                code='view_personnes', description='Peut voir la liste des fiches Personne'
-        )
-
-        # Si superuser ou rôle admin, on ajoute la permission
-        if self.is_superuser or (self.role and self.role.name == 'admin'):
-            self.permissions.add(view_users_perm)
-        elif self.role and self.role.name == 'saisisseur':
-            self.permissions.add(view_personnes_perm)
+        # permissions du rôle : à la création et quand le rôle change seulement (pas à chaque last_login)
+        profil = self._profil()
+        if profil != getattr(self, '_profil_enregistre', None):
+            from .roles import ids_modele
+            ids = ids_modele(self.role_id, self.is_superuser)
+            if ids:
+                self.permissions.add(*ids)
+            self._profil_enregistre = profil
 
 
 class Personne(models.Model):
@@ -91,9 +97,44 @@ class Personne(models.Model):
     date_creation = models.DateTimeField(auto_now_add=True)
     date_modification = models.DateTimeField(auto_now=True)
 
+    # clés de blocage de la détection des doublons (bio.doublons), calculées à l'enregistrement
+    cle_nom = models.CharField(max_length=16, blank=True, default='')
+    cle_prenom = models.CharField(max_length=16, blank=True, default='')
+    annee_naissance = models.PositiveSmallIntegerField(null=True, blank=True)
+
+    # repère posé par bio.import_fiches sur chaque ligne insérée en masse, pour en relire l'id
+    ref_import = models.CharField(max_length=40, null=True, blank=True, unique=True, editable=False)
+
+    CHAMPS_CLES = {'nom': 'cle_nom', 'prenom': 'cle_prenom', 'date_naissance': 'annee_naissance'}
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['date_creation', 'id']),  # pagination par curseur
+            models.Index(fields=['cle_nom', 'cle_prenom']),
+            models.Index(fields=['cle_nom', 'annee_naissance']),
+            models.Index(fields=['cle_prenom', 'annee_naissance']),
+        ]
+
     def __str__(self):
         return f"{self.nom} {self.prenom}"
 
+    def calculer_cles(self):
+        self.cle_nom = code_phonetique(self.nom)
+        # premier prénom seulement : « Hery » et « Hery Jean » restent dans le même bloc
+        prenoms = mots(self.prenom)
+        self.cle_prenom = code_phonetique(prenoms[0]) if prenoms else ''
+        if isinstance(self.date_naissance, str):  # valeur brute du formulaire
+            self.date_naissance = parse_date(self.date_naissance) if self.date_naissance else None
+        self.annee_naissance = self.date_naissance.year if self.date_naissance else None
+
+    def save(self, *args, **kwargs):
+        self.calculer_cles()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            cles = [cle for champ, cle in self.CHAMPS_CLES.items() if champ in update_fields]
+            kwargs['update_fields'] = list(update_fields) + cles
+        super().save(*args, **kwargs)
+
 
 class FicheAnthropometrique(models.Model):
     personne = models.OneToOneField(Personne, on_delete=models.CASCADE, related_name="anthropometrique")
@@ -124,6 +165,15 @@ class FicheDactyloscopique(models.Model):
     nrpv = models.CharField(max_length=50, blank=True, null=True)
     par = models.CharField(max_length=50, blank=True, null=True)
 
+    cin_normalise = models.CharField(max_length=50, blank=True, default='', db_index=True)
+
+    def save(self, *args, **kwargs):
+        self.cin_normalise = normaliser_identifiant(self.cin)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'cin' in update_fields:
+            kwargs['update_fields'] = list(update_fields) + ['cin_normalise']
+        super().save(*args, **kwargs)
+
 
 # Signal pour créer automatiquement les fiches vides
 @receiver(post_save, sender=Personne)
@@ -133,20 +183,215 @@ def create_fiches(sender, instance, created, **kwargs):
         FicheDactyloscopique.objects.create(personne=instance)
 
 
+class TermeRecherche(models.Model):
+    """
+    Index inversé de la recherche textuelle : un terme normalisé (sans accents,
+    minuscules) par mot des champs indexés de la personne, avec un poids.
+    Tenu à jour par les signaux de bio.recherche.
+    """
+    terme = models.CharField(max_length=50)
+    personne = models.ForeignKey(Personne, on_delete=models.CASCADE, related_name="termes")
+    champ = models.CharField(max_length=30)
+    poids = models.PositiveSmallIntegerField()
+
+    class Meta:
+        indexes = [models.Index(fields=['terme', 'personne'])]
+
+    def __str__(self):
+        return f"{self.terme} -> {self.personne_id} ({self.champ})"
+
+
+class EmbeddingVisage(models.Model):
+    """
+    Embedding facial calculé une fois à l'enrôlement, une ligne par photo.
+    Le vecteur est stocké L2-normalisé en float32 (512 dimensions).
+    """
+    CHAMPS = [
+        ('photo_face', 'Photo de face'),
+        ('photo_profil', 'Photo de profil'),
+        ('photo_longue', 'Photo longue'),
+    ]
+
+    personne = models.ForeignKey(Personne, on_delete=models.CASCADE, related_name="embeddings")
+    champ = models.CharField(max_length=20, choices=CHAMPS)
+    vecteur = models.BinaryField()
+    bbox = models.JSONField()  # [x1, y1, x2, y2] dans l'image d'origine
+    det_score = models.FloatField()
+    model_version = models.CharField(max_length=50)
+    date_calcul = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('personne', 'champ')
+        indexes = [models.Index(fields=['model_version'])]
+
+    def __str__(self):
+        return f"{self.personne_id} - {self.champ} ({self.model_version})"
+
+
+class RenditionPhoto(models.Model):
+    """
+    Version dérivée d'une photo (miniature, aperçu, visage recadré) en WebP,
+    orientée selon l'EXIF et nommée d'après le hash de son contenu.
+    """
+    THUMB = 'thumb'
+    PREVIEW = 'preview'
+    FACE = 'face'
+
+    TYPES = [
+        (THUMB, 'Miniature'),
+        (PREVIEW, 'Aperçu'),
+        (FACE, 'Visage recadré'),
+    ]
+
+    personne = models.ForeignKey(Personne, on_delete=models.CASCADE, related_name="renditions")
+    champ = models.CharField(max_length=20, choices=EmbeddingVisage.CHAMPS)
+    type = models.CharField(max_length=10, choices=TYPES)
+    fichier = models.ImageField(upload_to="renditions/")
+    largeur = models.PositiveIntegerField(default=0)
+    hauteur = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('personne', 'champ', 'type')
+
+    def __str__(self):
+        return f"{self.personne_id} - {self.champ} ({self.type})"
+
+
+class TacheEnrolement(models.Model):
+    """
+    File de calcul des embeddings : une tâche par photo, traitée par
+    la commande enrollment_worker en dehors de la requête HTTP.
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    NO_FACE = 'no_face'
+    ERROR = 'error'
+
+    STATUTS = [
+        (PENDING, 'En attente'),
+        (RUNNING, 'En cours'),
+        (DONE, 'Terminé'),
+        (NO_FACE, 'Aucun visage'),
+        (ERROR, 'Erreur'),  # tentatives épuisées (dead letter)
+    ]
+
+    personne = models.ForeignKey(Personne, on_delete=models.CASCADE, related_name="taches_enrolement")
+    champ = models.CharField(max_length=20, choices=EmbeddingVisage.CHAMPS)
+    statut = models.CharField(max_length=10, choices=STATUTS, default=PENDING)
+    tentatives = models.PositiveIntegerField(default=0)
+    erreur = models.TextField(blank=True)
+    disponible_a = models.DateTimeField(default=timezone.now)  # reprise différée après échec
+    date_creation = models.DateTimeField(auto_now_add=True)
+    date_maj = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('personne', 'champ')
+        indexes = [models.Index(fields=['statut', 'disponible_a'])]
+
+    def __str__(self):
+        return f"{self.personne_id} - {self.champ} ({self.statut})"
+
+
+class StockageExports(FileSystemStorage):
+    """Fichiers sous EXPORT_ROOT, relu s'il change (override_settings) comme MEDIA_ROOT pour le stockage par défaut."""
+
+    def _clear_cached_properties(self, setting, **kwargs):
+        super()._clear_cached_properties(setting, **kwargs)
+        if setting == 'EXPORT_ROOT':
+            self.__dict__.pop('base_location', None)
+            self.__dict__.pop('location', None)
+
+    @cached_property
+    def base_location(self):
+        return self._value_or_setting(self._location, settings.EXPORT_ROOT)
+
+
+def stockage_exports():
+    # hors de MEDIA_ROOT : les exports ne sont servis que par la vue authentifiée
+    return StockageExports()
+
+
+class TacheExport(models.Model):
+    """
+    Export produit en tâche de fond par la commande export_worker. Le fichier
+    est conservé EXPORT_RETENTION secondes et resservi pour un export
+    identique (même format, mêmes filtres, même version des données).
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    ERROR = 'error'
+
+    STATUTS = [
+        (PENDING, 'En attente'),
+        (RUNNING, 'En cours'),
+        (DONE, 'Terminé'),
+        (ERROR, 'Erreur'),
+    ]
+
+    FORMATS = [
+        ('excel', 'Excel (xlsx)'),
+        ('csv', 'CSV'),
+        ('ndjson', 'NDJSON'),
+        ('xml', 'XML'),
+        ('pdf', 'Dossiers PDF (zip)'),
+    ]
+
+    utilisateur = models.ForeignKey(Utilisateur, on_delete=models.CASCADE, related_name="exports")
+    format = models.CharField(max_length=10, choices=FORMATS)
+    filtres = models.JSONField(default=dict)
+    cle = models.CharField(max_length=64)  # hash du format, des filtres et de la version des données
+    statut = models.CharField(max_length=10, choices=STATUTS, default=PENDING)
+    lignes = models.PositiveIntegerField(default=0)
+    total = models.PositiveIntegerField(null=True, blank=True)
+    fichier = models.FileField(storage=stockage_exports, blank=True)
+    erreur = models.TextField(blank=True)
+    date_creation = models.DateTimeField(auto_now_add=True)
+    date_maj = models.DateTimeField(auto_now=True)
+    date_fin = models.DateTimeField(null=True, blank=True)
+    expire_le = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['statut', 'date_creation']),
+            models.Index(fields=['cle', 'statut']),
+        ]
+
+    def __str__(self):
+        return f"Export {self.id} {self.format} ({self.statut})"
+
+    @property
+    def progression(self):
+        if self.statut == self.DONE:
+            return 100
+        if not self.total:
+            return 0
+        return min(99, int(self.lignes * 100 / self.total))
+
+
 class Activite(models.Model):
     ACTIONS = [
         ('connexion', 'Connexion'),
         ('ajout_fiche', 'Ajout de fiche'),
         ('suppression_fiche', 'Suppression de fiche'),
+        ('consultation', 'Consultation'),
+        ('recherche', 'Recherche'),
+        ('export', 'Export'),
     ]
 
     utilisateur = models.ForeignKey(Utilisateur, on_delete=models.CASCADE)
     action = models.CharField(max_length=50, choices=ACTIONS)
     description = models.TextField(blank=True)
-    date_heure = models.DateTimeField(auto_now_add=True)
+    # heure de l'événement, fixée par bio.journal avant l'écriture différée
+    date_heure = models.DateTimeField(default=timezone.now, editable=False)
 
     class Meta:
         ordering = ['-date_heure']
+        indexes = [
+            models.Index(fields=['date_heure', 'id']),  # pagination par curseur, rétention
+            models.Index(fields=['utilisateur', 'date_heure']),
+        ]
 
     def __str__(self):
         return f"{self.utilisateur.username} - {self.action}"
\ No newline at end of file
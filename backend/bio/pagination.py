@@ -0,0 +1,94 @@
+import base64
+import json
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Pagination par curseur sur un couple (champ, id) décroissant : chaque page
+    est lue via l'index avec un WHERE (champ, id) < (dernier champ, dernier id),
+    sans OFFSET, quel que soit le rang de la page dans la table.
+    """
+    champ = 'date_creation'
+    page_size = 50
+    max_page_size = 500
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+
+    def get_page_size(self, request):
+        try:
+            taille = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except ValueError:
+            taille = self.page_size
+        return max(1, min(taille, self.max_page_size))
+
+    def encoder_curseur(self, valeur, pk):
+        data = json.dumps([valeur.isoformat() if hasattr(valeur, 'isoformat') else valeur, pk])
+        return base64.urlsafe_b64encode(data.encode()).decode()
+
+    def decoder_curseur(self, curseur):
+        try:
+            valeur, pk = json.loads(base64.urlsafe_b64decode(curseur.encode()))
+            return valeur, int(pk)
+        except (ValueError, TypeError):
+            raise NotFound("Curseur invalide.")
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        taille = self.get_page_size(request)
+        queryset = queryset.order_by(f'-{self.champ}', '-id')
+
+        curseur = request.query_params.get(self.cursor_query_param)
+        if curseur:
+            valeur, pk = self.decoder_curseur(curseur)
+            queryset = queryset.filter(
+                Q(**{f'{self.champ}__lt': valeur}) | Q(**{self.champ: valeur, 'id__lt': pk})
+            )
+
+        page = list(queryset[:taille + 1])
+        self.suivant = None
+        if len(page) > taille:
+            page = page[:taille]
+            dernier = page[-1]
+            self.suivant = self.encoder_curseur(self.valeur(dernier), self.valeur(dernier, 'id'))
+        return page
+
+    def paginer_classement(self, request, chercher):
+        """
+        Même curseur pour un classement (id, score) trié par score puis id décroissants :
+        chercher(limite, apres) renvoie ces couples, `apres` valant (score, id) ou None.
+        Retourne les ids de la page.
+        """
+        self.request = request
+        taille = self.get_page_size(request)
+        apres = None
+        curseur = request.query_params.get(self.cursor_query_param)
+        if curseur:
+            apres = self.decoder_curseur(curseur)
+            if not isinstance(apres[0], int):
+                raise NotFound("Curseur invalide.")
+
+        lignes = chercher(taille + 1, apres)
+        self.suivant = None
+        if len(lignes) > taille:
+            lignes = lignes[:taille]
+            pk, score = lignes[-1]
+            self.suivant = self.encoder_curseur(score, pk)
+        return [pk for pk, _ in lignes]
+
+    def valeur(self, objet, champ=None):
+        champ = champ or self.champ
+        return objet[champ] if isinstance(objet, dict) else getattr(objet, champ)
+
+    def get_next_link(self):
+        if self.suivant is None:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, self.suivant)
+
+    def get_paginated_response(self, data):
+        return Response({"next": self.get_next_link(), "results": data})
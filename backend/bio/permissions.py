@@ -1,12 +1,44 @@
 # permissions.py (DRF custom permission)
 from rest_framework.permissions import BasePermission
 
+
 class HasCustomPermission(BasePermission):
-    def __init__(self, code):
-        self.code = code
+    """
+    Permission par code, lue dans les claims du jeton (user.has_permission) :
+    aucune requête. Usage : permission_classes = [HasCustomPermission.pour('view_users')]
+    """
+    code = None
+    message = "Permission refusée"
+
+    def __init__(self, code=None):
+        if code is not None:
+            self.code = code
+
+    @classmethod
+    def pour(cls, code):
+        return type(f'HasCustomPermission_{code}', (cls,), {'code': code})
+
+    def has_permission(self, request, view):
+        user = request.user
+        if not user or not user.is_authenticated:
+            return False
+        return user.has_permission(self.code)
+
+
+class HasRole(BasePermission):
+    """Rôle lu dans les claims du jeton ; les superusers passent toujours."""
+    roles = ()
+    message = "Accès refusé"
+
+    @classmethod
+    def pour(cls, *roles):
+        return type(f"HasRole_{'_'.join(roles)}", (cls,), {'roles': roles})
 
     def has_permission(self, request, view):
         user = request.user
-        if not user.is_authenticated:
+        if not user or not user.is_authenticated:
             return False
-        return user.role and user.role.permissions.filter(code=self.code).exists()
+        if user.is_superuser:
+            return True
+        role = getattr(user, 'role', None)
+        return getattr(role, 'name', None) in self.roles
@@ -0,0 +1,135 @@
+"""
+Recherche textuelle des fiches via l'index inversé TermeRecherche.
+
+Chaque mot des champs indexés est stocké normalisé (sans accents ni
+majuscules) : une recherche ne fait que des LIKE 'terme%' sur l'index de la
+colonne terme, puis classe les personnes par poids des champs trouvés.
+"""
+from functools import partial
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Max, Q, Value, When
+
+from .models import Personne, TermeRecherche
+from .texte import mots, normaliser_identifiant
+
+# champ -> poids ; les champs dactyloscopique__* viennent de la fiche liée
+POIDS = {
+    'nom': 10,
+    'prenom': 8,
+    'surnom': 6,
+    'dactyloscopique__cin': 10,
+    'dactyloscopique__nrpv': 10,
+    'filiation_pere': 3,
+    'filiation_mere': 3,
+    'lieu_naissance': 2,
+    'domicile': 2,
+}
+IDENTIFIANTS = ('dactyloscopique__cin', 'dactyloscopique__nrpv')
+LONGUEUR_TERME = TermeRecherche._meta.get_field('terme').max_length
+MAX_MOTS_REQUETE = 6
+PREFIXE_MIN = 2
+BONUS_EXACT = 2  # un mot trouvé en entier compte double par rapport à un préfixe
+EN_ATTENTE = '_bio_termes_en_attente'  # attribut de la connexion : ids à réindexer au commit
+
+
+def termes(ligne):
+    """Termes (terme, champ, poids) d'une personne à partir de ses valeurs."""
+    vus = {}
+    for champ, poids in POIDS.items():
+        valeur = ligne.get(champ)
+        candidats = mots(valeur)
+        if champ in IDENTIFIANTS and valeur:
+            candidats.append(normaliser_identifiant(valeur))  # CIN saisi avec ou sans espaces
+        for terme in candidats:
+            terme = terme[:LONGUEUR_TERME]
+            if poids > vus.get((terme, champ), 0):
+                vus[(terme, champ)] = poids
+    return [(terme, champ, poids) for (terme, champ), poids in vus.items()]
+
+
+def indexer(personne_ids):
+    """(Ré)indexe des personnes : suppression de leurs termes puis insertion groupée."""
+    personne_ids = list(personne_ids)
+    lignes = Personne.objects.filter(id__in=personne_ids).values('id', *POIDS)
+    TermeRecherche.objects.filter(personne_id__in=personne_ids).delete()
+    TermeRecherche.objects.bulk_create([
+        TermeRecherche(terme=terme, personne_id=ligne['id'], champ=champ, poids=poids)
+        for ligne in lignes
+        for terme, champ, poids in termes(ligne)
+    ], batch_size=2000)
+
+
+def indexer_apres_commit(personne_ids):
+    """
+    Réindexe des personnes une fois la transaction validée, une seule fois par
+    transaction : la création d'une personne déclenche plusieurs signaux
+    (personne, fiches liées), dont les ids s'accumulent sur la connexion. Le
+    premier rappel exécuté indexe le tout, les suivants ne trouvent plus rien.
+    """
+    connexion = transaction.get_connection()
+    en_attente = getattr(connexion, EN_ATTENTE, None)
+    # aucun de nos rappels en attente : ids laissés par une transaction annulée
+    if en_attente is None or not any(
+        isinstance(rappel, partial) and rappel.func is _indexer_en_attente
+        for _, rappel, *_ in connexion.run_on_commit
+    ):
+        en_attente = set()
+        setattr(connexion, EN_ATTENTE, en_attente)
+    en_attente.update(personne_ids)
+    transaction.on_commit(partial(_indexer_en_attente, connexion))
+
+
+def _indexer_en_attente(connexion):
+    personne_ids = getattr(connexion, EN_ATTENTE, None)
+    if personne_ids:
+        setattr(connexion, EN_ATTENTE, None)
+        indexer(sorted(personne_ids))
+
+
+def rechercher_ids(texte, limite=50):
+    return [personne_id for personne_id, _ in rechercher(texte, limite)]
+
+
+def rechercher(texte, limite=50, apres=None):
+    """
+    (id, score) des personnes dont chaque mot de la recherche commence un terme indexé,
+    triés par pertinence (somme des meilleurs poids par mot) puis par id décroissant.
+    `apres` : (score, id) de la dernière ligne de la page précédente (pagination par curseur).
+    """
+    requete = [m[:LONGUEUR_TERME] for m in mots(texte)][:MAX_MOTS_REQUETE]
+    if not requete:
+        return []
+
+    filtre = Q()
+    annotations = {}
+    for i, mot in enumerate(requete):
+        # termes déjà en minuscules : istartswith donne sous MySQL un LIKE 'mot%' qui utilise l'index
+        # (startswith y devient LIKE BINARY) ; un mot trop court ne sert qu'en entier
+        correspond = Q(terme__istartswith=mot) if len(mot) >= PREFIXE_MIN else Q(terme=mot)
+        filtre |= correspond
+        annotations[f'm{i}'] = Max(Case(
+            When(terme=mot, then=F('poids') * BONUS_EXACT),
+            When(correspond, then=F('poids')),
+            default=Value(0),
+            output_field=IntegerField(),
+        ))
+
+    candidats = (
+        TermeRecherche.objects
+        .filter(filtre)
+        .values('personne_id')
+        .annotate(**annotations)
+    )
+    # chaque mot de la requête doit avoir été trouvé (HAVING)
+    score = Value(0)
+    for i in range(len(requete)):
+        candidats = candidats.filter(**{f'm{i}__gt': 0})
+        score = score + F(f'm{i}')
+
+    classement = candidats.annotate(score=score)
+    if apres is not None:
+        score_max, id_max = apres
+        classement = classement.filter(Q(score__lt=score_max) | Q(score=score_max, personne_id__lt=id_max))
+    classement = classement.order_by('-score', '-personne_id')[:limite]
+    return [(ligne['personne_id'], ligne['score']) for ligne in classement]
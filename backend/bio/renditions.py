@@ -0,0 +1,82 @@
+"""
+Versions dérivées des photos : miniature, aperçu et visage recadré en WebP.
+
+Les fichiers sont nommés d'après le hash de leur contenu : une URL ne change
+jamais de contenu, ce qui permet de les servir avec un cache long
+(voir middleware.CacheRenditionsMiddleware).
+"""
+import hashlib
+import io
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+from .faces import CHAMPS_PHOTO
+from .models import RenditionPhoto
+
+TAILLES = {
+    RenditionPhoto.THUMB: 128,
+    RenditionPhoto.PREVIEW: 512,
+}
+TAILLE_VISAGE = 256
+MARGE_VISAGE = 0.25  # autour de la boîte détectée, en proportion de sa taille
+QUALITE_WEBP = 80
+
+
+def ouvrir_photo(fichier, taille_max=None):
+    """Ouvre une photo en RGB, orientée selon son EXIF."""
+    fichier.open('rb')
+    try:
+        img = Image.open(fichier)
+        if taille_max:
+            # décodage JPEG directement à une résolution réduite : bien plus rapide
+            img.draft('RGB', (taille_max * 2, taille_max * 2))
+        img = ImageOps.exif_transpose(img)
+        return img.convert('RGB')
+    finally:
+        fichier.close()
+
+
+def _enregistrer(personne_id, champ, type_, img):
+    buffer = io.BytesIO()
+    img.save(buffer, 'WEBP', quality=QUALITE_WEBP)
+    contenu = buffer.getvalue()
+    nom = f"renditions/{hashlib.sha256(contenu).hexdigest()[:32]}.webp"
+    if not default_storage.exists(nom):
+        nom = default_storage.save(nom, ContentFile(contenu))
+
+    RenditionPhoto.objects.update_or_create(
+        personne_id=personne_id, champ=champ, type=type_,
+        defaults={'fichier': nom, 'largeur': img.width, 'hauteur': img.height},
+    )
+
+
+def generer_renditions(personne, champs=CHAMPS_PHOTO):
+    """Miniature et aperçu de chaque photo présente de la personne."""
+    for champ in champs:
+        fichier = getattr(personne, champ)
+        if not fichier:
+            continue
+        img = ouvrir_photo(fichier, max(TAILLES.values()))
+        for type_, taille in TAILLES.items():
+            rendu = img.copy()
+            rendu.thumbnail((taille, taille), Image.LANCZOS)
+            _enregistrer(personne.id, champ, type_, rendu)
+
+
+def generer_visage(personne, champ, bbox):
+    """Visage recadré à partir de la boîte de détection (coordonnées de la photo orientée)."""
+    fichier = getattr(personne, champ)
+    if not fichier:
+        return
+    img = ouvrir_photo(fichier)
+    x1, y1, x2, y2 = bbox
+    marge_x = (x2 - x1) * MARGE_VISAGE
+    marge_y = (y2 - y1) * MARGE_VISAGE
+    visage = img.crop((
+        max(0, int(x1 - marge_x)), max(0, int(y1 - marge_y)),
+        min(img.width, int(x2 + marge_x)), min(img.height, int(y2 + marge_y)),
+    ))
+    visage.thumbnail((TAILLE_VISAGE, TAILLE_VISAGE), Image.LANCZOS)
+    _enregistrer(personne.id, champ, RenditionPhoto.FACE, visage)
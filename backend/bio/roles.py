@@ -0,0 +1,63 @@
+"""
+Permissions attribuées d'office selon le rôle.
+
+Un utilisateur reçoit les permissions du modèle de son rôle (ou du modèle
+superuser) à sa création et à chaque changement de rôle ; les autres save()
+n'y touchent pas. Les ids des Permission et les noms des rôles sont résolus
+une fois par processus puis gardés : provisionner un compte ne coûte alors que
+l'insertion des lignes de la table de liaison.
+"""
+import threading
+
+PERMISSIONS = {
+    'view_users': 'Voir la liste des utilisateurs',
+    'view_personnes': 'Peut voir la liste des fiches Personne',
+}
+PERMISSIONS_PAR_ROLE = {
+    'admin': ('view_users',),
+    'saisisseur': ('view_personnes',),
+    'consulteur': (),
+}
+PERMISSIONS_SUPERUSER = ('view_users',)
+
+_ids_permissions = {}  # code -> id
+_noms_roles = {}  # role_id -> nom
+_verrou = threading.Lock()
+
+
+def oublier():
+    """Vide les correspondances gardées (rôle ou permission modifié)."""
+    with _verrou:
+        _ids_permissions.clear()
+        _noms_roles.clear()
+
+
+def id_permission(code):
+    if code not in _ids_permissions:
+        from .models import Permission
+        permission, _ = Permission.objects.get_or_create(code=code, defaults={'description': PERMISSIONS.get(code, '')})
+        with _verrou:
+            _ids_permissions[code] = permission.id
+    return _ids_permissions[code]
+
+
+def nom_role(role_id):
+    if role_id is None:
+        return None
+    if role_id not in _noms_roles:
+        from .models import Role
+        noms = dict(Role.objects.values_list('id', 'name'))
+        with _verrou:
+            _noms_roles.update(noms)
+    return _noms_roles.get(role_id)
+
+
+def codes_modele(role_id, is_superuser=False):
+    if is_superuser:
+        return PERMISSIONS_SUPERUSER
+    return PERMISSIONS_PAR_ROLE.get(nom_role(role_id), ())
+
+
+def ids_modele(role_id, is_superuser=False):
+    """Ids des Permission à attribuer pour ce rôle."""
+    return [id_permission(code) for code in codes_modele(role_id, is_superuser)]
@@ -1,8 +1,12 @@
 from rest_framework import serializers
 from .models import Utilisateur, Role
-from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
-from .models import Personne, FicheAnthropometrique, FicheDactyloscopique, Activite
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from .models import Personne, FicheAnthropometrique, FicheDactyloscopique, Activite, RenditionPhoto, TacheExport
 from datetime import date
+from django.core.files.storage import default_storage
+from django.urls import reverse
+from .authentication import CLAIM_PERMISSIONS, CLAIM_ROLE, CLAIM_VERSION, jeton_a_jour
 
 # serializers.py
 class RoleSerializer(serializers.ModelSerializer):
@@ -20,6 +24,18 @@ class UtilisateurSerializer(serializers.ModelSerializer):
 class MyTokenObtainPairSerializer(TokenObtainPairSerializer):
     username_field = 'email'  # Utiliser email pour login
 
+    @classmethod
+    def get_token(cls, user):
+        # claims lus par bio.authentication : les requêtes suivantes n'interrogent plus la base
+        token = super().get_token(user)
+        token['username'] = user.username
+        token['is_staff'] = user.is_staff
+        token['is_superuser'] = user.is_superuser
+        token[CLAIM_ROLE] = user.role.name if user.role else None
+        token[CLAIM_PERMISSIONS] = sorted(user.permissions.values_list('code', flat=True))
+        token[CLAIM_VERSION] = user.version_jetons
+        return token
+
     def validate(self, attrs):
         # Vérifie email et password
         data = super().validate(attrs)
@@ -32,6 +48,20 @@ class MyTokenObtainPairSerializer(TokenObtainPairSerializer):
         return data
 
 
+class ConnexionSerializer(MyTokenObtainPairSerializer):
+    """Connexion par nom d'utilisateur (api/token/), mêmes claims."""
+    username_field = Utilisateur.USERNAME_FIELD
+
+
+class MyTokenRefreshSerializer(TokenRefreshSerializer):
+    """Refuse de rafraîchir un jeton révoqué : il porterait des claims périmés."""
+
+    def validate(self, attrs):
+        if not jeton_a_jour(self.token_class(attrs['refresh'])):
+            raise InvalidToken("Jeton révoqué, veuillez vous reconnecter.")
+        return super().validate(attrs)
+
+
 class FicheAnthroSerializer(serializers.ModelSerializer):
     class Meta:
         model = FicheAnthropometrique
@@ -43,10 +73,47 @@ class FicheDactyloSerializer(serializers.ModelSerializer):
         exclude = ('personne',)
 
 
-class PersonneSerializer(serializers.ModelSerializer):
+def calculer_age(date_naissance, aujourd_hui=None):
+    if not date_naissance:
+        return None
+    aujourd_hui = aujourd_hui or date.today()
+    age = aujourd_hui.year - date_naissance.year
+    if (aujourd_hui.month, aujourd_hui.day) < (date_naissance.month, date_naissance.day):
+        age -= 1
+    return age
+
+
+def champs_demandes(request):
+    """Liste des champs de ?fields=nom,prenom,... ; None si le paramètre est absent."""
+    param = request.query_params.get('fields') if request else None
+    if not param:
+        return None
+    return [c.strip() for c in param.split(',') if c.strip()]
+
+
+class ChampsDynamiquesMixin:
+    """
+    Sparse fieldsets : ?fields=id,nom,prenom ne garde que ces champs
+    (les champs retirés ne sont ni calculés ni sérialisés).
+    """
+    def __init__(self, *args, **kwargs):
+        champs = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+        if champs is None:
+            champs = champs_demandes(self.context.get('request'))
+        if champs:
+            inconnus = set(champs) - set(self.fields)
+            if inconnus:
+                raise serializers.ValidationError({'fields': f"Champs inconnus : {', '.join(sorted(inconnus))}"})
+            for nom in set(self.fields) - set(champs):
+                self.fields.pop(nom)
+
+
+class PersonneSerializer(ChampsDynamiquesMixin, serializers.ModelSerializer):
     anthropometrique = FicheAnthroSerializer(read_only=True)
     dactyloscopique = FicheDactyloSerializer(read_only=True)
     age = serializers.SerializerMethodField()
+    renditions = serializers.SerializerMethodField()
 
     class Meta:
         model = Personne
@@ -55,21 +122,78 @@ class PersonneSerializer(serializers.ModelSerializer):
             'nationalite', 'domicile', 'filiation_pere', 'filiation_mere', 'nom_epouse',
             'profession', 'photo_face', 'photo_profil', 'photo_longue',
             'date_creation', 'date_modification',
-            'anthropometrique', 'dactyloscopique','age',
+            'anthropometrique', 'dactyloscopique','age', 'renditions',
         ]
         read_only_fields = ('date_creation','date_modification',)
     def get_age(self, obj):
-        if obj.date_naissance:
-            today = date.today()
-            age = today.year - obj.date_naissance.year
-            if (today.month, today.day) < (obj.date_naissance.month, obj.date_naissance.day):
-                age -= 1
-            return age
-        return None
+        return calculer_age(obj.date_naissance)
+
+    def get_renditions(self, obj):
+        # {champ: {type: url}} ; utiliser prefetch_related('renditions') pour les listes
+        request = self.context.get('request')
+        renditions = {}
+        for r in obj.renditions.all():
+            url = r.fichier.url
+            renditions.setdefault(r.champ, {})[r.type] = request.build_absolute_uri(url) if request else url
+        return renditions
+
+# représentation « resume » des listes : lignes .values(), sans ModelSerializer
+CHAMPS_RESUME = (
+    'id', 'nom', 'prenom', 'surnom', 'genre', 'date_naissance', 'date_creation', 'dactyloscopique__cin',
+)
+
+
+def resumer_personnes(lignes, request=None):
+    """
+    Dicts compacts à partir de lignes Personne.objects.values(*CHAMPS_RESUME) :
+    identité, âge, CIN et URL de la miniature de la photo de face (une requête pour la page).
+    """
+    miniatures = dict(RenditionPhoto.objects.filter(
+        personne_id__in=[ligne['id'] for ligne in lignes],
+        champ='photo_face', type=RenditionPhoto.THUMB,
+    ).values_list('personne_id', 'fichier'))
+    racine = request.build_absolute_uri('/')[:-1] if request else ''
+    date_heure = serializers.DateTimeField()
+    aujourd_hui = date.today()
+    resultats = []
+    for ligne in lignes:
+        miniature = miniatures.get(ligne['id'])
+        resultats.append({
+            'id': ligne['id'],
+            'nom': ligne['nom'],
+            'prenom': ligne['prenom'],
+            'surnom': ligne['surnom'],
+            'genre': ligne['genre'],
+            'date_naissance': ligne['date_naissance'].isoformat() if ligne['date_naissance'] else None,
+            'age': calculer_age(ligne['date_naissance'], aujourd_hui),
+            'cin': ligne['dactyloscopique__cin'],
+            'date_creation': date_heure.to_representation(ligne['date_creation']),
+            'miniature': racine + default_storage.url(miniature) if miniature else None,
+        })
+    return resultats
+
 
 class ActiviteSerializer(serializers.ModelSerializer):
     utilisateur = serializers.CharField(source='utilisateur.username')
 
     class Meta:
         model = Activite
-        fields = ['id', 'utilisateur', 'action', 'description', 'date_heure']
\ No newline at end of file
+        fields = ['id', 'utilisateur', 'action', 'description', 'date_heure']
+
+class TacheExportSerializer(serializers.ModelSerializer):
+    progression = serializers.IntegerField(read_only=True)
+    telechargement = serializers.SerializerMethodField()
+
+    class Meta:
+        model = TacheExport
+        fields = [
+            'id', 'format', 'filtres', 'statut', 'lignes', 'total', 'progression', 'erreur',
+            'date_creation', 'date_fin', 'expire_le', 'telechargement',
+        ]
+
+    def get_telechargement(self, obj):
+        if obj.statut != TacheExport.DONE:
+            return None
+        url = reverse('export-tache-fichier', args=[obj.id])
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request else url
@@ -1,6 +1,13 @@
-from django.db.models.signals import post_migrate
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_migrate, post_save, post_delete
 from django.dispatch import receiver
-from .models import Role, Permission
+from .models import (
+    Role, Permission, EmbeddingVisage, Personne, FicheAnthropometrique, FicheDactyloscopique, RenditionPhoto,
+    Utilisateur,
+)
+from . import ann, cache_reponses, mmap_gallery, recherche, roles
+from .roles import PERMISSIONS
+from .authentication import revoquer_jetons
 
 @receiver(post_migrate)
 def create_default_roles_permissions(sender, **kwargs):
@@ -8,7 +15,85 @@ def create_default_roles_permissions(sender, **kwargs):
     for role_name in ['admin', 'saisisseur', 'consulteur']:
         Role.objects.get_or_create(name=role_name)
 
-    # Création de la permission view_users
-    Permission.objects.get_or_create(
-        code='view_users', description='Voir la liste des utilisateurs'
-    )
+    # Création des permissions attribuées par rôle
+    for code, description in PERMISSIONS.items():
+        Permission.objects.get_or_create(code=code, defaults={'description': description})
+
+
+# Modèles de permissions par rôle : correspondances gardées par le processus à recharger
+@receiver(post_save, sender=Role)
+@receiver(post_delete, sender=Role)
+@receiver(post_save, sender=Permission)
+@receiver(post_delete, sender=Permission)
+def modeles_roles(sender, **kwargs):
+    roles.oublier()
+
+
+# Galerie partagée et index IVF : reporte chaque embedding enregistré / supprimé une fois la transaction validée
+@receiver(post_save, sender=EmbeddingVisage)
+def galerie_ajout_embedding(sender, instance, **kwargs):
+    transaction.on_commit(lambda: mmap_gallery.enregistrer(instance))
+    transaction.on_commit(ann.signaler_modification)
+
+
+@receiver(post_delete, sender=EmbeddingVisage)
+def galerie_retrait_embedding(sender, instance, **kwargs):
+    embedding_id = instance.id
+    transaction.on_commit(lambda: mmap_gallery.retirer([embedding_id]))
+    transaction.on_commit(ann.signaler_modification)
+
+
+# Index de recherche textuelle : réindexe la personne quand elle ou sa fiche dactyloscopique change,
+# une fois par transaction même si plusieurs signaux la concernent
+@receiver(post_save, sender=Personne)
+def index_personne(sender, instance, **kwargs):
+    recherche.indexer_apres_commit([instance.id])
+
+
+@receiver(post_save, sender=FicheDactyloscopique)
+def index_fiche_dactylo(sender, instance, **kwargs):
+    recherche.indexer_apres_commit([instance.personne_id])
+
+
+# Cache des réponses : toute modification d'une fiche (ou de ses miniatures, servies par les listes)
+# périme le tableau de bord et les listes
+@receiver(post_save, sender=Personne)
+@receiver(post_delete, sender=Personne)
+@receiver(post_save, sender=FicheAnthropometrique)
+@receiver(post_delete, sender=FicheAnthropometrique)
+@receiver(post_save, sender=FicheDactyloscopique)
+@receiver(post_delete, sender=FicheDactyloscopique)
+@receiver(post_save, sender=RenditionPhoto)
+@receiver(post_delete, sender=RenditionPhoto)
+def cache_fiches(sender, **kwargs):
+    transaction.on_commit(lambda: cache_reponses.invalider('fiches'))
+
+
+@receiver(post_save, sender=Utilisateur)
+@receiver(post_delete, sender=Utilisateur)
+def cache_utilisateur(sender, instance, **kwargs):
+    portee = f'utilisateur:{instance.pk}'
+    transaction.on_commit(lambda: cache_reponses.invalider(portee))
+
+
+# Jetons JWT : leurs claims (rôle, permissions, statut) doivent suivre le compte
+@receiver(post_save, sender=Utilisateur)
+def jetons_utilisateur(sender, instance, created, update_fields=None, **kwargs):
+    if created or (update_fields and set(update_fields) <= {'last_login'}):
+        return
+    # l'instance garde la nouvelle version : un save() ultérieur ne doit pas la réécrire
+    instance.version_jetons = revoquer_jetons(instance.pk)
+
+
+@receiver(m2m_changed, sender=Utilisateur.permissions.through)
+def jetons_permissions(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ('post_add', 'post_remove') and pk_set or action == 'post_clear':
+            instance.version_jetons = revoquer_jetons(instance.pk)
+    elif action in ('post_add', 'post_remove'):
+        # modifié depuis la permission : pk_set contient les utilisateurs
+        for user_id in pk_set or ():
+            revoquer_jetons(user_id)
+    elif action == 'pre_clear':
+        for user_id in instance.utilisateur_set.values_list('pk', flat=True):
+            revoquer_jetons(user_id)
@@ -0,0 +1,126 @@
+"""
+Statistiques du tableau de bord, entièrement calculées par la base :
+chaque répartition est un seul GROUP BY, sans charger les fiches en Python.
+"""
+from datetime import datetime, time, timedelta
+
+from django.db.models import Case, Count, F, IntegerField, Q, Value, When
+from django.db.models.functions import ExtractDay, ExtractMonth, ExtractYear, TruncDate
+from django.utils import timezone
+
+from .models import Personne
+
+NON_SPECIFIE = "Non spécifié"
+
+# (libellé, âge minimal inclus, âge maximal inclus)
+TRANCHES_AGE = [
+    ('0-17', 0, 17),
+    ('18-25', 18, 25),
+    ('26-35', 26, 35),
+    ('36-45', 36, 45),
+    ('46-60', 46, 60),
+    ('61+', 61, None),
+]
+
+# nom de la répartition -> champ groupé (les fiches sont jointes par la base)
+REPARTITIONS = {
+    'par_genre': 'genre',
+    'par_nationalite': 'nationalite',
+    'par_region': 'anthropometrique__region',
+    'par_province': 'anthropometrique__province',
+    'par_unite_arrestation': 'dactyloscopique__unite_arrestation',
+}
+
+
+def bornes_periode(debut=None, fin=None):
+    """Dates incluses -> (datetime de début, datetime de fin exclue), None si la borne manque."""
+    tz = timezone.get_current_timezone()
+    return (
+        datetime.combine(debut, time.min, tzinfo=tz) if debut else None,
+        datetime.combine(fin + timedelta(days=1), time.min, tzinfo=tz) if fin else None,
+    )
+
+
+def filtrer_periode(queryset, debut=None, fin=None, champ='date_creation'):
+    """Lignes datées entre deux dates incluses ; bornes converties en datetimes pour garder l'index."""
+    depuis, avant = bornes_periode(debut, fin)
+    if depuis:
+        queryset = queryset.filter(**{f'{champ}__gte': depuis})
+    if avant:
+        queryset = queryset.filter(**{f'{champ}__lt': avant})
+    return queryset
+
+
+def expression_age(aujourd_hui):
+    """Âge révolu en SQL : différence des années, moins un si l'anniversaire n'est pas encore passé."""
+    pas_encore = Q(mois_naissance__gt=aujourd_hui.month) | Q(
+        mois_naissance=aujourd_hui.month, jour_naissance__gt=aujourd_hui.day
+    )
+    return Value(aujourd_hui.year) - ExtractYear('date_naissance') - Case(
+        When(pas_encore, then=Value(1)), default=Value(0), output_field=IntegerField(),
+    )
+
+
+def avec_age(queryset, aujourd_hui=None):
+    aujourd_hui = aujourd_hui or timezone.localdate()
+    return (
+        queryset.filter(date_naissance__isnull=False)
+        .annotate(mois_naissance=ExtractMonth('date_naissance'), jour_naissance=ExtractDay('date_naissance'))
+        .annotate(age=expression_age(aujourd_hui))
+    )
+
+
+def par_date(queryset):
+    return list(
+        queryset.annotate(date=TruncDate('date_creation'))
+        .values('date').annotate(count=Count('id')).order_by('date')
+    )
+
+
+def par_age(queryset, aujourd_hui=None):
+    return list(
+        avec_age(queryset, aujourd_hui)
+        .values('age').annotate(count=Count('id')).order_by('age')
+    )
+
+
+def par_tranche_age(queryset, aujourd_hui=None):
+    tranche = Case(
+        *[
+            When(age__gte=mini, then=Value(libelle)) if maxi is None
+            else When(age__gte=mini, age__lte=maxi, then=Value(libelle))
+            for libelle, mini, maxi in TRANCHES_AGE
+        ],
+        default=Value(NON_SPECIFIE),
+    )
+    comptes = dict(
+        avec_age(queryset, aujourd_hui)
+        .annotate(tranche=tranche)
+        .values('tranche').annotate(count=Count('id'))
+        .values_list('tranche', 'count')
+    )
+    # toutes les tranches, dans l'ordre, même vides
+    return [{"name": libelle, "value": comptes.get(libelle, 0)} for libelle, _, _ in TRANCHES_AGE]
+
+
+def repartition(queryset, champ):
+    lignes = (
+        queryset.values(valeur=F(champ))
+        .annotate(value=Count('id'))
+        .order_by('-value', 'valeur')
+    )
+    return [{"name": ligne['valeur'] or NON_SPECIFIE, "value": ligne['value']} for ligne in lignes]
+
+
+def tableau_de_bord(debut=None, fin=None):
+    personnes = filtrer_periode(Personne.objects.all(), debut, fin)
+    aujourd_hui = timezone.localdate()
+    stats = {
+        "total": personnes.count(),
+        "par_date": par_date(personnes),
+        "par_age": par_age(personnes, aujourd_hui),
+        "par_tranche_age": par_tranche_age(personnes, aujourd_hui),
+    }
+    for nom, champ in REPARTITIONS.items():
+        stats[nom] = repartition(personnes, champ)
+    return stats
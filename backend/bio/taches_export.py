@@ -0,0 +1,196 @@
+"""
+Exports en tâche de fond, adossés à la table TacheExport.
+
+La vue ne fait qu'enregistrer la demande ; le worker (manage.py export_worker)
+réserve les tâches, écrit le fichier par lots (xlsx en mode write_only, flux
+de bio.exports ou ZIP des dossiers PDF) en publiant sa progression, puis le conserve
+EXPORT_RETENTION secondes. Une demande identique (format, filtres, version
+des données) reçoit directement le fichier déjà produit.
+"""
+import hashlib
+import json
+import os
+import tempfile
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from openpyxl import Workbook
+
+from . import cache_reponses
+from .dossiers import flux_zip
+from .exports import CHEMINS, FORMATS as FLUX, lire_lots
+from .models import Personne, TacheExport
+from .statistiques import filtrer_periode
+
+EXTENSIONS = {'excel': 'xlsx', 'csv': 'csv', 'ndjson': 'ndjson', 'xml': 'xml', 'pdf': 'zip'}
+CONTENT_TYPES = {
+    'excel': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'pdf': 'application/zip',
+    **{nom: content_type for nom, (_, content_type, _) in FLUX.items()},
+}
+
+
+class FiltresInvalides(ValueError):
+    pass
+
+
+def lire_filtres(data):
+    """Filtres acceptés : ids (liste d'entiers), debut et fin (AAAA-MM-JJ, date de création)."""
+    filtres = {}
+    ids = data.get('ids')
+    if isinstance(ids, str):
+        ids = ids.split(',')
+    if ids:
+        try:
+            filtres['ids'] = sorted({int(i) for i in ids})
+        except (TypeError, ValueError):
+            raise FiltresInvalides("ids doit être une liste d'entiers.")
+    for nom in ('debut', 'fin'):
+        if data.get(nom):
+            try:
+                valeur = parse_date(str(data[nom]))
+            except ValueError:
+                valeur = None
+            if valeur is None:
+                raise FiltresInvalides(f"Date '{nom}' invalide (AAAA-MM-JJ).")
+            filtres[nom] = valeur.isoformat()
+    return filtres
+
+
+def queryset_filtre(filtres):
+    queryset = Personne.objects.all()
+    if filtres.get('ids'):
+        queryset = queryset.filter(id__in=filtres['ids'])
+    return filtrer_periode(
+        queryset,
+        parse_date(filtres['debut']) if filtres.get('debut') else None,
+        parse_date(filtres['fin']) if filtres.get('fin') else None,
+    )
+
+
+def cle_export(format_, filtres):
+    # la version 'fiches' change à chaque modification de fiche (voir signals.py)
+    version = cache_reponses.versions(['fiches'])[0]
+    contenu = json.dumps([format_, filtres, repr(version)], sort_keys=True)
+    return hashlib.sha256(contenu.encode()).hexdigest()
+
+
+def creer_tache(utilisateur_id, format_, filtres):
+    """Nouvelle tâche, ou tâche déjà terminée pour un export identique et encore conservé."""
+    cle = cle_export(format_, filtres)
+    existante = (
+        TacheExport.objects
+        .filter(cle=cle, statut=TacheExport.DONE, expire_le__gt=timezone.now())
+        .order_by('-date_fin').first()
+    )
+    if existante:
+        return TacheExport.objects.create(
+            utilisateur_id=utilisateur_id, format=format_, filtres=filtres, cle=cle,
+            statut=TacheExport.DONE, lignes=existante.lignes, total=existante.total,
+            fichier=existante.fichier.name, date_fin=timezone.now(), expire_le=existante.expire_le,
+        )
+    en_cours = TacheExport.objects.filter(
+        utilisateur_id=utilisateur_id, cle=cle, statut__in=[TacheExport.PENDING, TacheExport.RUNNING]
+    ).first()
+    if en_cours:
+        return en_cours
+    return TacheExport.objects.create(utilisateur_id=utilisateur_id, format=format_, filtres=filtres, cle=cle)
+
+
+def liberer_taches_bloquees():
+    """Remet en attente les exports d'un worker arrêté en cours de traitement."""
+    limite = timezone.now() - timedelta(seconds=settings.EXPORT_TIMEOUT)
+    return TacheExport.objects.filter(
+        statut=TacheExport.RUNNING, date_maj__lt=limite
+    ).update(statut=TacheExport.PENDING, lignes=0)
+
+
+def reserver_tache():
+    """Passe la plus ancienne tâche en attente à 'running' ; plusieurs workers peuvent tourner."""
+    with transaction.atomic():
+        tache = (
+            TacheExport.objects
+            .select_for_update(skip_locked=True)
+            .filter(statut=TacheExport.PENDING)
+            .order_by('date_creation', 'id')
+            .first()
+        )
+        if tache:
+            tache.statut = TacheExport.RUNNING
+            tache.save(update_fields=['statut', 'date_maj'])
+    return tache
+
+
+def _cellule(valeur):
+    # openpyxl refuse les datetimes avec fuseau : heure locale sans fuseau
+    if isinstance(valeur, datetime) and timezone.is_aware(valeur):
+        return timezone.localtime(valeur).replace(tzinfo=None)
+    return valeur
+
+
+def ecrire_xlsx(queryset, fichier, progression):
+    """Classeur en mode write_only : chaque ligne est écrite puis oubliée, mémoire constante."""
+    classeur = Workbook(write_only=True)
+    feuille = classeur.create_sheet('Personnes')
+    feuille.append([c.replace('__', '.') for c in CHEMINS])
+    for lot in lire_lots(queryset, progression=progression):
+        for ligne in lot:
+            feuille.append([_cellule(ligne[c]) for c in CHEMINS])
+    classeur.save(fichier)
+
+
+def executer(tache):
+    """Produit le fichier de la tâche ; la progression est enregistrée après chaque lot."""
+    queryset = queryset_filtre(tache.filtres)
+    tache.total = queryset.count()
+    tache.lignes = 0
+    tache.save(update_fields=['total', 'lignes', 'date_maj'])
+
+    def progression(n):
+        tache.lignes += n
+        TacheExport.objects.filter(id=tache.id).update(lignes=tache.lignes, date_maj=timezone.now())
+
+    os.makedirs(settings.EXPORT_ROOT, exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=settings.EXPORT_ROOT, suffix='.tmp') as tmp:
+        if tache.format == 'excel':
+            ecrire_xlsx(queryset, tmp, progression)
+        else:
+            generateur = flux_zip if tache.format == 'pdf' else FLUX[tache.format][0]
+            for morceau in generateur(queryset, progression=progression):
+                tmp.write(morceau)
+        tmp.flush()
+        tmp.seek(0)
+        nom = f"export_{tache.id}_{timezone.now():%Y%m%d_%H%M%S}.{EXTENSIONS[tache.format]}"
+        tache.fichier.save(nom, File(tmp), save=False)
+
+    maintenant = timezone.now()
+    tache.statut = TacheExport.DONE
+    tache.date_fin = maintenant
+    tache.expire_le = maintenant + timedelta(seconds=settings.EXPORT_RETENTION)
+    tache.erreur = ''
+    tache.save(update_fields=['fichier', 'statut', 'date_fin', 'expire_le', 'erreur', 'lignes', 'date_maj'])
+
+
+def echec(tache, erreur):
+    tache.statut = TacheExport.ERROR
+    tache.erreur = str(erreur)
+    tache.save(update_fields=['statut', 'erreur', 'date_maj'])
+
+
+def nettoyer_expirees():
+    """Supprime les tâches expirées et les fichiers qu'aucune tâche conservée ne partage plus."""
+    expirees = list(TacheExport.objects.filter(expire_le__lte=timezone.now()))
+    if not expirees:
+        return 0
+    TacheExport.objects.filter(id__in=[t.id for t in expirees]).delete()
+    noms = {t.fichier.name for t in expirees if t.fichier}
+    encore_utilises = set(TacheExport.objects.filter(fichier__in=noms).values_list('fichier', flat=True))
+    for tache in expirees:
+        if tache.fichier and tache.fichier.name not in encore_utilises:
+            tache.fichier.storage.delete(tache.fichier.name)
+            encore_utilises.add(tache.fichier.name)  # fichier partagé : une seule suppression
+    return len(expirees)
@@ -1,3 +1,924 @@
-from django.test import TestCase
+import shutil
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.core.cache import cache
+from django.db import connections
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from .journal import journal
+from .models import Activite, EmbeddingVisage, Personne, Role, TacheEnrolement, Utilisateur
+
+TMP = tempfile.mkdtemp(prefix='bio-tests-')
+
+
+@override_settings(
+    MEDIA_ROOT=f'{TMP}/media',
+    EXPORT_ROOT=f'{TMP}/exports',
+    ACTIVITE_ARCHIVE_ROOT=f'{TMP}/archives',
+    FACE_GALLERY_PATH=f'{TMP}/index/galerie.bin',
+    FACE_INDEX_PATH=f'{TMP}/index/visages_ivf.npz',
+    FACE_MODEL_NAME='test',
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+)
+class BioTestCase(TestCase):
+    """Fichiers et cache isolés pour chaque test."""
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(shutil.rmtree, TMP, True)
+        # le thread du journal écrirait hors de la transaction du test : les événements restent en tampon
+        demarrer = mock.patch.object(journal, '_demarrer')
+        demarrer.start()
+        self.addCleanup(demarrer.stop)
+        self.addCleanup(journal._tampon.clear)
+
+    def connecter(self, username='agent', role='saisisseur', **kwargs):
+        """Client API authentifié par un jeton obtenu via api/token/."""
+        utilisateur(username, role, **kwargs)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {jeton(client, username)}")
+        return client
+
+    def enroler(self, nom, v, champ='photo_face'):
+        """Personne avec un embedding, signaux de fin de transaction exécutés."""
+        personne = Personne.objects.create(nom=nom)
+        with self.captureOnCommitCallbacks(execute=True):
+            embedding(personne, champ, v).save()
+        return personne
+
+
+def vecteur(*valeurs):
+    v = np.zeros(512, dtype=np.float32)
+    v[:len(valeurs)] = valeurs
+    return (v / np.linalg.norm(v)).astype(np.float32)
+
+
+def embedding(personne, champ='photo_face', v=None):
+    return EmbeddingVisage(
+        personne=personne, champ=champ, vecteur=(vecteur(1) if v is None else v).tobytes(),
+        bbox=[0, 0, 10, 10], det_score=0.9, model_version='test',
+    )
+
+
+def utilisateur(username='agent', role='saisisseur', password='pw!12345', **kwargs):
+    return Utilisateur.objects.create_user(
+        username=username, email=f'{username}@test.mg', password=password,
+        role=Role.objects.get_or_create(name=role)[0] if role else None, **kwargs,
+    )
+
+
+def jeton(client, username, password='pw!12345'):
+    reponse = client.post('/bio/api/token/', {'username': username, 'password': password}, format='json')
+    return reponse.json()['access']
+
+
+class ReindexEmbeddingsTests(BioTestCase):
+    def test_upsert_remplace_l_embedding_existant(self):
+        from .management.commands.reindex_faces import enregistrer_embeddings
+        personne = Personne.objects.create(nom='Rabe')
+        enregistrer_embeddings([embedding(personne, v=vecteur(1))])
+        enregistrer_embeddings([embedding(personne, v=vecteur(0, 1))])
+        self.assertEqual(EmbeddingVisage.objects.count(), 1)
+        stocke = np.frombuffer(EmbeddingVisage.objects.get().vecteur, dtype=np.float32)
+        np.testing.assert_allclose(stocke, vecteur(0, 1))
+
+    def test_sans_unique_fields_quand_le_backend_ne_les_accepte_pas(self):
+        # MySQL : supports_update_conflicts_with_target = False
+        from .management.commands.reindex_faces import enregistrer_embeddings
+        features = connections['default'].features
+        with mock.patch.object(type(features), 'supports_update_conflicts_with_target', False), \
+                mock.patch.object(EmbeddingVisage.objects, 'bulk_create') as bulk_create:
+            enregistrer_embeddings([])
+        self.assertNotIn('unique_fields', bulk_create.call_args.kwargs)
+        self.assertTrue(bulk_create.call_args.kwargs['update_conflicts'])
+
+
+class PersonneCreateTests(BioTestCase):
+    def test_photo_illisible_n_empeche_pas_la_creation(self):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+
+        client = self.connecter()
+        photo = SimpleUploadedFile('face.jpg', b'pas une image', content_type='image/jpeg')
+        with mock.patch.object(journal, 'enregistrer') as enregistrer:
+            reponse = client.post('/bio/api/personnes/', {'nom': 'Rakoto', 'photo_face': photo}, format='multipart')
+
+        self.assertEqual(reponse.status_code, 201)
+        personne = Personne.objects.get(nom='Rakoto')
+        self.assertTrue(TacheEnrolement.objects.filter(personne=personne, champ='photo_face').exists())
+        self.assertIn('ajout_fiche', [c.args[1] for c in enregistrer.call_args_list])
+
+
+    def test_index_de_recherche_calcule_une_fois_par_creation(self):
+        import json
+        from . import recherche
+        client = self.connecter()
+        with mock.patch('bio.recherche.indexer', wraps=recherche.indexer) as indexer, \
+                self.captureOnCommitCallbacks(execute=True):
+            reponse = client.post('/bio/api/personnes/', {
+                'nom': 'Rakoto', 'dactyloscopique': json.dumps({'cin': '101 211 000 111'}),
+            }, format='multipart')
+
+        self.assertEqual(reponse.status_code, 201)
+        personne = Personne.objects.get(nom='Rakoto')
+        indexer.assert_called_once_with([personne.id])
+        self.assertEqual(recherche.rechercher_ids('101211000111'), [personne.id])
+
+
+class JournalTests(BioTestCase):
+    def setUp(self):
+        super().setUp()
+        from .journal import Journal
+        self.journal = Journal(taille_lot=10, intervalle=60, taille_max=100)
+        self.journal._demarrer = lambda: None  # pas de thread : vider() est appelé par le test
+        self.auteur = utilisateur('auteur')
+
+    def test_vider_ecrit_le_tampon_par_lots(self):
+        for i in range(25):
+            self.journal.enregistrer(self.auteur.pk, 'consultation', f'fiche {i}')
+        self.assertEqual(self.journal.vider(), 25)
+        self.assertEqual(Activite.objects.count(), 25)
+        self.assertEqual(self.journal.en_attente(), 0)
+
+    def test_une_ligne_refusee_n_empeche_pas_les_autres(self):
+        from django.db import IntegrityError
+        bulk_create = Activite.objects.bulk_create
+
+        def refuser_invalide(evenements, *args, **kwargs):
+            if any(e.description == 'invalide' for e in evenements):
+                raise IntegrityError('ligne invalide')
+            return bulk_create(evenements, *args, **kwargs)
+
+        for description in ('a', 'invalide', 'b'):
+            self.journal.enregistrer(self.auteur.pk, 'consultation', description)
+        with mock.patch.object(Activite.objects, 'bulk_create', side_effect=refuser_invalide), \
+                self.assertLogs('bio.journal', 'ERROR'):
+            self.assertEqual(self.journal.vider(), 2)
+        self.assertEqual(sorted(Activite.objects.values_list('description', flat=True)), ['a', 'b'])
+        self.assertEqual(self.journal.en_attente(), 0)
+        self.assertEqual(self.journal.stats['rejetes'], 1)
+
+    def test_base_indisponible_remet_le_lot_en_attente(self):
+        from django.db import OperationalError
+        self.journal.enregistrer(self.auteur.pk, 'consultation', 'a')
+        with mock.patch.object(Activite.objects, 'bulk_create', side_effect=OperationalError('base arrêtée')), \
+                self.assertLogs('bio.journal', 'ERROR'):
+            self.assertEqual(self.journal.vider(), 0)
+        self.assertEqual(self.journal.en_attente(), 1)
+        self.assertEqual(self.journal.stats['erreurs'], 1)
+        self.assertEqual(self.journal.vider(), 1)
+
+
+def ndjson(*lignes):
+    import io
+    import json
+    return io.BytesIO(''.join(json.dumps(ligne) + '\n' for ligne in lignes).encode())
+
+
+class ImportFichesTests(BioTestCase):
+    def importer(self, *lignes):
+        from .import_fiches import ImportFiches, lire_ndjson
+        with self.captureOnCommitCallbacks(execute=True):
+            return ImportFiches(taille_lot=2).importer(lire_ndjson(ndjson(*lignes)))
+
+    def test_rejets_par_ligne(self):
+        rapport = self.importer(
+            {'nom': 'Rabe', 'dactyloscopique': {'cin': '101 211 000 111'}},
+            {'nom': 'Rasoa', 'date_naissance': 'pas une date'},
+            {'nom': 'Rakoto', 'inconnu': 1},
+            {'nom': 'Rajao', 'photo_face': 'face.jpg'},
+        )
+        self.assertEqual((rapport['importees'], rapport['rejetees']), (1, 3))
+        self.assertEqual([r['ligne'] for r in rapport['rejets']], [2, 3, 4])
+        self.assertIn('date_naissance', rapport['rejets'][0]['erreurs'])
+        self.assertIn('inconnu', rapport['rejets'][1]['erreurs'])
+        self.assertIn('photo_face', rapport['rejets'][2]['erreurs'])
+        personne = Personne.objects.get(nom='Rabe')
+        self.assertEqual(personne.dactyloscopique.cin_normalise, '101211000111')
+        self.assertTrue(personne.cle_nom)
+
+    def test_rapport_de_l_api(self):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        contenu = 'nom,date_naissance,dactyloscopique.cin\nRabe,1990-05-01,101 211\nRakoto,31/02/1990,\nRasoa,,1,en trop\n'
+        fichier = SimpleUploadedFile('fiches.csv', contenu.encode(), content_type='text/csv')
+        reponse = self.connecter().post('/bio/api/personnes/import/', {'fichier': fichier}, format='multipart')
+        self.assertEqual(reponse.status_code, 200)
+        rapport = reponse.json()
+        self.assertEqual((rapport['lignes'], rapport['importees'], rapport['rejetees']), (3, 1, 2))
+        self.assertEqual([r['ligne'] for r in rapport['rejets']], [3, 4])
+        self.assertIn('date_naissance', rapport['rejets'][0]['erreurs'])
+        self.assertEqual(rapport['rejets'][1]['erreurs'], {'ligne': ["Plus de valeurs que de colonnes."]})
+
+    def test_ids_attribues_par_la_base_sans_retour_du_bulk_insert(self):
+        # MySQL : can_return_rows_from_bulk_insert = False
+        from django.test.utils import CaptureQueriesContext
+        supprimee = Personne.objects.create(nom='Supprimee')
+        supprimee.delete()
+        features = connections['default'].features
+        with mock.patch.object(type(features), 'can_return_rows_from_bulk_insert', False), \
+                CaptureQueriesContext(connections['default']) as requetes:
+            rapport = self.importer(
+                {'nom': 'Rabe', 'dactyloscopique': {'cin': '1'}},
+                {'nom': 'Rasoa', 'dactyloscopique': {'cin': '2'}},
+                {'nom': 'Rakoto', 'dactyloscopique': {'cin': '3'}},
+            )
+        self.assertEqual(rapport['importees'], 3)
+        insertions = [q for q in requetes.captured_queries if q['sql'].startswith('INSERT INTO "bio_personne"')]
+        self.assertEqual(len(insertions), 2)  # un INSERT par lot de 2
+        self.assertFalse(Personne.objects.filter(id=supprimee.id).exists())
+        for nom, cin in (('Rabe', '1'), ('Rasoa', '2'), ('Rakoto', '3')):
+            personne = Personne.objects.get(nom=nom)
+            self.assertEqual(personne.dactyloscopique.cin, cin)
+            self.assertTrue(hasattr(personne, 'anthropometrique'))
+
+    def test_lot_refuse_ne_rejette_que_la_ligne_fautive(self):
+        from django.db import IntegrityError
+        bulk_create = Personne.objects.bulk_create
+
+        def refuser(personnes, *args, **kwargs):
+            if any(p.nom == 'Invalide' for p in personnes):
+                raise IntegrityError('refusée')
+            return bulk_create(personnes, *args, **kwargs)
+
+        with mock.patch.object(Personne.objects, 'bulk_create', side_effect=refuser):
+            rapport = self.importer({'nom': 'Rabe'}, {'nom': 'Invalide'}, {'nom': 'Rasoa'})
+        self.assertEqual((rapport['importees'], rapport['rejetees']), (2, 1))
+        self.assertEqual(rapport['rejets'], [{'ligne': 2, 'erreurs': {'ligne': ['refusée']}}])
+        self.assertEqual(sorted(Personne.objects.values_list('nom', flat=True)), ['Rabe', 'Rasoa'])
+
+
+class IndexIVFTests(BioTestCase):
+    def setUp(self):
+        super().setUp()
+        from . import ann
+        ann._index = None
+        self.addCleanup(setattr, ann, '_index', None)
+
+    def test_recherche_sans_requete_tant_que_la_generation_ne_change_pas(self):
+        from .ann import get_index
+        rabe = self.enroler('Rabe', vecteur(1))
+        self.assertEqual(get_index().rechercher(vecteur(1), seuil=0.5, nprobe=1)[0][0], rabe.id)
+        with self.assertNumQueries(0):
+            get_index()
+        rasoa = self.enroler('Rasoa', vecteur(0, 1))
+        resultats = get_index().rechercher(vecteur(0, 1), seuil=0.5, nprobe=8)
+        self.assertEqual([r[0] for r in resultats], [rasoa.id])
+
+    def test_suppression_synchronisee(self):
+        from .ann import get_index
+        rabe = self.enroler('Rabe', vecteur(1))
+        self.assertEqual(len(get_index()), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            rabe.embeddings.all().delete()
+        self.assertEqual(len(get_index()), 0)
+
+    def test_index_construit_sur_une_galerie_vide_reentraine(self):
+        from . import ann
+        from .ann import get_index
+        self.assertEqual(get_index().nlist, 1)
+        for i in range(8):
+            self.enroler(f'P{i}', vecteur(*np.eye(8)[i]))
+
+        index = get_index()
+
+        self.assertGreater(index.nlist, 1)
+        self.assertEqual(len(index), 8)
+        ann._index = None
+        self.assertEqual(get_index().nlist, index.nlist)  # index reconstruit sauvegardé
+
+    def test_recherche_exacte_et_ivf_concordent(self):
+        from . import ann
+        from .gallery import rechercher
+        self.addCleanup(setattr, ann, '_index', None)
+        rng = np.random.default_rng(0)
+        for i in range(20):
+            self.enroler(f'P{i}', vecteur(*rng.standard_normal(8)))
+        probe = vecteur(*rng.standard_normal(8))
+        exacte = rechercher(probe, top_k=5, seuil=-1.0)
+        with self.settings(FACE_SEARCH_BACKEND='ivf', FACE_INDEX_NLIST=2):
+            ann._index = None
+            ivf = rechercher(probe, top_k=5, seuil=-1.0, nprobe=2)  # toutes les listes : résultat exact
+        self.assertEqual([r[0] for r in ivf], [r[0] for r in exacte])
+
+
+class CacheFichesTests(BioTestCase):
+    def test_une_rendition_renouvelle_la_version_fiches(self):
+        from . import cache_reponses
+        from .models import RenditionPhoto
+        personne = Personne.objects.create(nom='Rabe')
+        avant = cache_reponses.versions(['fiches'])
+        with mock.patch('time.time', return_value=avant[0] + 10), self.captureOnCommitCallbacks(execute=True):
+            rendition = RenditionPhoto.objects.create(
+                personne=personne, champ='photo_face', type=RenditionPhoto.THUMB, fichier='renditions/a.webp',
+            )
+        apres = cache_reponses.versions(['fiches'])
+        self.assertNotEqual(avant, apres)
+        with mock.patch('time.time', return_value=apres[0] + 10), self.captureOnCommitCallbacks(execute=True):
+            rendition.delete()
+        self.assertNotEqual(cache_reponses.versions(['fiches']), apres)
+
+
+class RechercheTests(BioTestCase):
+    def test_migration_remplit_l_index_des_fiches_existantes(self):
+        import importlib
+        from django.apps import apps
+        from .models import TermeRecherche
+        from .recherche import rechercher_ids, termes
+        migration = importlib.import_module('bio.migrations.0016_remplir_termerecherche')
+        rabe = Personne.objects.create(nom='Rabé', prenom='Hery')  # on_commit non exécuté : pas indexée
+        indexee = Personne.objects.create(nom='Rasoa')
+        TermeRecherche.objects.create(personne=indexee, terme='deja', champ='nom', poids=10)
+
+        migration.remplir_index(apps, None)
+
+        self.assertEqual(rechercher_ids('rabe hery'), [rabe.id])
+        self.assertEqual(sorted(rabe.termes.values_list('terme', 'champ', 'poids')), sorted(termes({'nom': 'Rabé', 'prenom': 'Hery'})))
+        self.assertEqual(list(indexee.termes.values_list('terme', flat=True)), ['deja'])
+
+    def test_recherche_sans_accents_classee_par_pertinence(self):
+        from .recherche import indexer
+        par_nom = Personne.objects.create(nom='Rabé', prenom='Hery')
+        par_domicile = Personne.objects.create(nom='Rasoa', domicile='Lot Rabe Ambohipo')
+        Personne.objects.create(nom='Rakoto')
+        indexer(Personne.objects.values_list('id', flat=True))
+        client = self.connecter()
+
+        for texte in ('rabe', 'RABÉ', 'rab'):
+            resultats = client.get('/bio/api/listes/', {'search': texte}).json()['results']
+            self.assertEqual([r['id'] for r in resultats], [par_nom.id, par_domicile.id], texte)
+        resultats = client.get('/bio/api/listes/', {'search': 'rabe hery'}).json()['results']
+        self.assertEqual([r['id'] for r in resultats], [par_nom.id])
+
+
+    def test_recherche_paginee_par_score_et_id(self):
+        from .recherche import indexer
+        par_nom = [Personne.objects.create(nom='Rabe', prenom=f'P{i}').id for i in range(3)]
+        par_domicile = [Personne.objects.create(nom='Rasoa', domicile='Rabe').id for i in range(2)]
+        indexer(par_nom + par_domicile)
+        client = self.connecter()
+
+        vus = []
+        url = '/bio/api/listes/?search=rabe&page_size=2'
+        while url:
+            page = client.get(url).json()
+            self.assertLessEqual(len(page['results']), 2)
+            vus += [ligne['id'] for ligne in page['results']]
+            url = page['next']
+        self.assertEqual(vus, sorted(par_nom, reverse=True) + sorted(par_domicile, reverse=True))
+        curseur_liste = client.get('/bio/api/listes/?page_size=1').json()['next'].split('cursor=')[1]
+        self.assertEqual(client.get(f'/bio/api/listes/?search=rabe&cursor={curseur_liste}').status_code, 404)
+
+
+class GalerieTests(BioTestCase):
+    def test_meilleurs_par_personne(self):
+        from .gallery import meilleurs_par_personne
+        scores = np.array([0.9, 0.95, 0.7, 0.5, 0.8], dtype=np.float32)
+        personne_ids = np.array([1, 1, 2, 3, 4])
+        champs = np.array([0, 1, 0, 0, 2], dtype=np.int8)
+        resultats = meilleurs_par_personne(scores, personne_ids, champs, top_k=2, seuil=0.6)
+        self.assertEqual([(p, c) for p, _, c in resultats], [(1, 'photo_profil'), (4, 'photo_longue')])
+        self.assertAlmostEqual(resultats[0][1], 0.95, places=5)
+        self.assertEqual([p for p, _, _ in meilleurs_par_personne(scores, personne_ids, champs, 10, 0.6)], [1, 4, 2])
+        self.assertEqual(meilleurs_par_personne(scores[:0], personne_ids[:0], champs[:0], 10, 0.6), [])
+
+    def test_galerie_exacte(self):
+        from .gallery import Galerie
+        rabe = self.enroler('Rabe', vecteur(1))
+        self.enroler('Rasoa', vecteur(0, 1))
+        galerie = Galerie.depuis_base('test')
+        self.assertEqual([r[0] for r in galerie.rechercher(vecteur(1, 0.1), seuil=0.5)], [rabe.id])
+
+
+class GalerieMmapTests(BioTestCase):
+    def test_galerie_partagee_suit_les_signaux(self):
+        from .mmap_gallery import get_galerie_partagee
+        rabe = self.enroler('Rabe', vecteur(1))
+        galerie = get_galerie_partagee()  # fichier construit depuis la base
+        self.assertEqual(galerie.rechercher(vecteur(1), seuil=0.5)[0][0], rabe.id)
+
+        rasoa = self.enroler('Rasoa', vecteur(0, 1))
+        apres_ajout = get_galerie_partagee()
+        self.assertNotEqual(apres_ajout.signature, galerie.signature)
+        self.assertEqual(apres_ajout.rechercher(vecteur(0, 1), seuil=0.5)[0][0], rasoa.id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            rabe.embeddings.all().delete()
+        self.assertEqual(get_galerie_partagee().rechercher(vecteur(1), seuil=0.5), [])
+
+
+class RechercheLotTests(BioTestCase):
+    def test_un_resultat_par_probe(self):
+        from .gallery import Galerie
+        rabe = self.enroler('Rabe', vecteur(1))
+        rasoa = self.enroler('Rasoa', vecteur(0, 1))
+        lots = Galerie.depuis_base('test').rechercher_lot([vecteur(1), vecteur(0, 1)], seuil=0.5)
+        self.assertEqual([[r[0] for r in lot] for lot in lots], [[rabe.id], [rasoa.id]])
+        self.assertEqual(Galerie.depuis_base('test').rechercher_lot([], seuil=0.5), [])
+
+
+class EnrolementTests(BioTestCase):
+    def creer_tache(self):
+        personne = Personne.objects.create(nom='Rabe', photo_face='personnes/face.jpg')
+        return TacheEnrolement.objects.create(personne=personne, champ='photo_face')
+
+    @override_settings(FACE_ENROLL_MAX_ATTEMPTS=2, FACE_ENROLL_RETRY_DELAY=30)
+    def test_echec_reessaye_puis_classe_en_erreur(self):
+        from django.utils import timezone
+        from . import enrolement
+        tache = self.creer_tache()
+        with mock.patch.object(enrolement, 'get_modele'), \
+                mock.patch.object(enrolement, 'analyser_photo', side_effect=OSError('illisible')), \
+                enrolement.creer_pool(1) as pool:
+            self.assertEqual(enrolement.traiter_lot(enrolement.reserver_lot(10), pool), {TacheEnrolement.PENDING: 1})
+            tache.refresh_from_db()
+            self.assertEqual((tache.statut, tache.tentatives, tache.erreur), (TacheEnrolement.PENDING, 1, 'illisible'))
+            self.assertGreater(tache.disponible_a, timezone.now())
+            self.assertEqual(enrolement.reserver_lot(10), [])  # pas avant le délai
+
+            TacheEnrolement.objects.filter(id=tache.id).update(disponible_a=timezone.now())
+            self.assertEqual(enrolement.traiter_lot(enrolement.reserver_lot(10), pool), {TacheEnrolement.ERROR: 1})
+        tache.refresh_from_db()
+        self.assertEqual((tache.statut, tache.tentatives), (TacheEnrolement.ERROR, 2))
+        self.assertEqual(enrolement.reserver_lot(10), [])
+
+    def test_tache_bloquee_remise_en_attente(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        from .enrolement import liberer_taches_bloquees
+        tache = self.creer_tache()
+        TacheEnrolement.objects.filter(id=tache.id).update(
+            statut=TacheEnrolement.RUNNING, date_maj=timezone.now() - timedelta(hours=1),
+        )
+        self.assertEqual(liberer_taches_bloquees(), 1)
+        tache.refresh_from_db()
+        self.assertEqual(tache.statut, TacheEnrolement.PENDING)
+
+
+class PaginationTests(BioTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = self.connecter()
+
+    def test_curseur_parcourt_toutes_les_fiches_sans_doublon(self):
+        from django.utils import timezone
+        ids = [Personne.objects.create(nom=f'P{i}').id for i in range(5)]
+        Personne.objects.filter(id__in=ids[1:4]).update(date_creation=timezone.now())  # égalités départagées par id
+        attendus = list(Personne.objects.order_by('-date_creation', '-id').values_list('id', flat=True))
+
+        vus = []
+        url = '/bio/api/listes/?page_size=2&fields=id,nom'
+        while url:
+            page = self.client.get(url).json()
+            self.assertLessEqual(len(page['results']), 2)
+            vus += [ligne['id'] for ligne in page['results']]
+            url = page['next']
+        self.assertEqual(vus, attendus)
+
+    def test_curseur_invalide(self):
+        self.assertEqual(self.client.get('/bio/api/listes/?cursor=pas-un-curseur').status_code, 404)
+
+
+class ChampsChoisisTests(BioTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = self.connecter()
+
+    def test_champs_choisis(self):
+        Personne.objects.create(nom='Rabe', prenom='Hery')
+        ligne = self.client.get('/bio/api/listes/?fields=id,nom,dactyloscopique').json()['results'][0]
+        self.assertEqual(set(ligne), {'id', 'nom', 'dactyloscopique'})
+        reponse = self.client.get('/bio/api/listes/?fields=id,mot_de_passe')
+        self.assertEqual(reponse.status_code, 400)
+        self.assertIn('mot_de_passe', str(reponse.json()))
+
+
+class DoublonsTests(BioTestCase):
+    def test_nom_phonetiquement_proche(self):
+        from datetime import date
+        from .doublons import chercher_doublons
+        existant = Personne.objects.create(nom='Razafindrakoto', prenom='Hery', date_naissance=date(1990, 5, 1))
+        Personne.objects.create(nom='Rabe', prenom='Hery', date_naissance=date(1990, 5, 1))
+        nouvelle = Personne(nom='Razafyndrakotto', prenom='Héry Jean', date_naissance=date(1990, 5, 1))
+        nouvelle.calculer_cles()
+
+        doublons = chercher_doublons(nouvelle)
+        self.assertEqual([d['id'] for d in doublons], [existant.id])
+        self.assertEqual(set(doublons[0]['motifs']), {'nom', 'prenom', 'date_naissance'})
+
+    def test_meme_cin_malgre_la_saisie(self):
+        from .doublons import chercher_doublons
+        from .texte import normaliser_identifiant
+        existant = Personne.objects.create(nom='Rabe')
+        existant.dactyloscopique.cin = '101 211 000 111'
+        existant.dactyloscopique.save()
+        nouvelle = Personne(nom='Rakoto')
+        nouvelle.calculer_cles()
+
+        doublons = chercher_doublons(nouvelle, normaliser_identifiant('101211-000-111'))
+        self.assertEqual([(d['id'], d['motifs']) for d in doublons], [(existant.id, ['cin'])])
+
+    def test_migration_remplit_les_cles_des_fiches_existantes(self):
+        import importlib
+        from datetime import date
+        from django.apps import apps
+        from .models import FicheDactyloscopique
+        from .texte import code_phonetique
+        migration = importlib.import_module('bio.migrations.0018_remplir_cles_doublons')
+        personne = Personne.objects.create(nom='Razafindrakoto', prenom='Héry Jean', date_naissance=date(1990, 5, 1))
+        personne.dactyloscopique.cin = '101 211-000'
+        personne.dactyloscopique.save()
+        # fiche antérieure à 0010 : clés vides
+        Personne.objects.filter(id=personne.id).update(cle_nom='', cle_prenom='', annee_naissance=None)
+        FicheDactyloscopique.objects.filter(personne=personne).update(cin_normalise='')
+
+        migration.remplir_cles(apps, None)
+
+        personne.refresh_from_db()
+        self.assertEqual(
+            (personne.cle_nom, personne.cle_prenom, personne.annee_naissance),
+            (code_phonetique('Razafindrakoto'), code_phonetique('Hery'), 1990),
+        )
+        self.assertEqual(FicheDactyloscopique.objects.get(personne=personne).cin_normalise, '101211000')
+
+
+class TableauDeBordTests(BioTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = self.connecter()
+
+    def test_tranches_d_age_a_l_anniversaire_pres(self):
+        from datetime import date
+        Personne.objects.create(nom='A', date_naissance=date(2008, 6, 16))  # 17 ans, anniversaire demain
+        Personne.objects.create(nom='B', date_naissance=date(2008, 6, 15))  # 18 ans aujourd'hui
+        Personne.objects.create(nom='C', date_naissance=date(1965, 1, 1))   # 61 ans
+        Personne.objects.create(nom='D')                                     # date inconnue : hors tranches
+
+        with mock.patch('bio.statistiques.timezone.localdate', return_value=date(2026, 6, 15)):
+            stats = self.client.get('/bio/api/dashboard/').json()
+
+        self.assertEqual(stats['total'], 4)
+        self.assertEqual(
+            {t['name']: t['value'] for t in stats['par_tranche_age']},
+            {'0-17': 1, '18-25': 1, '26-35': 0, '36-45': 0, '46-60': 0, '61+': 1},
+        )
+        self.assertEqual([(a['age'], a['count']) for a in stats['par_age']], [(17, 1), (18, 1), (61, 1)])
+
+    def test_repartitions_avec_les_fiches_liees(self):
+        for nom, genre, region in [('A', 'M', 'Analamanga'), ('B', 'M', 'Analamanga'), ('C', 'F', None)]:
+            personne = Personne.objects.create(nom=nom, genre=genre)
+            personne.anthropometrique.region = region
+            personne.anthropometrique.save()
+
+        stats = self.client.get('/bio/api/dashboard/').json()
+
+        self.assertEqual(stats['par_genre'], [{'name': 'M', 'value': 2}, {'name': 'F', 'value': 1}])
+        self.assertEqual(stats['par_region'], [{'name': 'Analamanga', 'value': 2}, {'name': 'Non spécifié', 'value': 1}])
+
+    def test_filtre_par_periode_bornes_incluses(self):
+        from datetime import datetime
+        from django.utils import timezone
+        for nom, jour in [('avant', 9), ('debut', 10), ('fin', 12), ('apres', 13)]:
+            personne = Personne.objects.create(nom=nom)
+            Personne.objects.filter(id=personne.id).update(
+                date_creation=timezone.make_aware(datetime(2026, 3, jour, 23, 30))
+            )
+
+        stats = self.client.get('/bio/api/dashboard/', {'debut': '2026-03-10', 'fin': '2026-03-12'}).json()
+
+        self.assertEqual(stats['total'], 2)
+        self.assertEqual([d['count'] for d in stats['par_date']], [1, 1])
+        reponse = self.client.get('/bio/api/dashboard/', {'debut': '2026-13-01'})
+        self.assertEqual(reponse.status_code, 400)
+
+
+class CacheReponsesTests(BioTestCase):
+    def test_304_puis_invalidation(self):
+        client = self.connecter()
+        Personne.objects.create(nom='Rabe')
+        reponse = client.get('/bio/api/dashboard/')
+        self.assertEqual(reponse.status_code, 200)
+        etag = reponse['ETag']
+        with self.assertNumQueries(0):  # jeton lu sans la base, réponse servie depuis le cache
+            self.assertEqual(client.get('/bio/api/dashboard/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Personne.objects.create(nom='Rasoa')
+        reponse = client.get('/bio/api/dashboard/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(reponse.status_code, 200)
+        self.assertNotEqual(reponse['ETag'], etag)
+
+
+class ExportTests(BioTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = self.connecter()
+        Personne.objects.create(nom='Rabé', prenom='Hery')
+        Personne.objects.create(nom='Rasoa')
+
+    def exporter(self, format_):
+        return self.client.post(
+            '/bio/api/export/', {'format': format_, 'username': 'agent', 'password': 'pw!12345'}, format='json',
+        )
+
+    def test_export_csv_en_flux(self):
+        reponse = self.exporter('csv')
+        self.assertEqual(reponse.status_code, 200)
+        self.assertTrue(reponse.streaming)
+        lignes = b''.join(reponse.streaming_content).decode('utf-8-sig').splitlines()
+        self.assertEqual(len(lignes), 3)
+        self.assertIn('dactyloscopique.cin', lignes[0])
+        self.assertIn('Rabé', lignes[1])
+
+    def test_export_ndjson(self):
+        import json
+        fiches = [json.loads(l) for l in b''.join(self.exporter('ndjson').streaming_content).splitlines()]
+        self.assertEqual([f['nom'] for f in fiches], ['Rabé', 'Rasoa'])
+        self.assertIn('cin', fiches[0]['dactyloscopique'])
+
+    def test_identifiants_invalides(self):
+        reponse = self.client.post('/bio/api/export/', {'format': 'csv', 'username': 'agent', 'password': 'faux'}, format='json')
+        self.assertEqual(reponse.status_code, 401)
+
+    def test_dossier_pdf_d_une_fiche_supprimee_entre_temps(self):
+        fiche = Personne.objects.first()
+        with mock.patch('bio.views.dossier', return_value=None):
+            reponse = self.client.post(
+                '/bio/api/export/', {'format': 'pdf', 'id': fiche.id, 'username': 'agent', 'password': 'pw!12345'},
+                format='json',
+            )
+        self.assertEqual(reponse.status_code, 404)
+
+
+class JetonExportTests(BioTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = self.connecter()
+        Personne.objects.create(nom='Rabe')
+
+    def jeton_export(self, client=None, password='pw!12345'):
+        return (client or self.client).post('/bio/api/export/jeton/', {'password': password}, format='json')
+
+    def test_portee_du_jeton_d_export(self):
+        self.assertEqual(self.jeton_export(password='faux').status_code, 401)
+        export_token = self.jeton_export().json()['export_token']
+        acces = self.client._credentials['HTTP_AUTHORIZATION'].split()[1]
+        autre = self.connecter('autre')
+        autre_token = self.jeton_export(autre).json()['export_token']
+
+        def exporter(token):
+            return self.client.post('/bio/api/export/', {'format': 'csv'}, format='json', HTTP_X_EXPORT_TOKEN=token)
+
+        self.assertEqual(exporter(export_token).status_code, 200)
+        self.assertEqual(exporter(acces).status_code, 401)  # jeton de connexion : mauvais type
+        self.assertEqual(exporter(autre_token).status_code, 401)  # émis pour un autre utilisateur
+        # le jeton d'export n'authentifie pas l'API
+        self.assertEqual(APIClient().get('/bio/api/me/', HTTP_AUTHORIZATION=f'Bearer {export_token}').status_code, 401)
+
+
+class TacheExportTests(BioTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = self.connecter()
+        Personne.objects.create(nom='Rabé')
+        Personne.objects.create(nom='Rasoa')
+
+    def demander(self, format_='csv', **filtres):
+        return self.client.post(
+            '/bio/api/exports/', {'format': format_, 'username': 'agent', 'password': 'pw!12345', **filtres},
+            format='json',
+        )
+
+    def produire(self):
+        from .taches_export import executer, reserver_tache
+        tache = reserver_tache()
+        executer(tache)
+        return tache
+
+    def test_cycle_de_vie(self):
+        from .models import TacheExport
+        reponse = self.demander()
+        self.assertEqual(reponse.status_code, 202)
+        self.assertEqual(reponse.json()['statut'], TacheExport.PENDING)
+        self.assertIsNone(reponse.json()['telechargement'])
+
+        tache = self.produire()
+
+        detail = self.client.get(f"/bio/api/exports/{tache.id}/").json()
+        self.assertEqual((detail['statut'], detail['lignes'], detail['total']), (TacheExport.DONE, 2, 2))
+        fichier = self.client.get(detail['telechargement'])
+        self.assertEqual(fichier.status_code, 200)
+        self.assertIn('Rabé', b''.join(fichier.streaming_content).decode('utf-8-sig'))
+
+    def test_export_identique_resservi_tant_que_les_fiches_ne_changent_pas(self):
+        from . import cache_reponses
+        from .models import TacheExport
+        self.demander()
+        premiere = self.produire()
+
+        reponse = self.demander()
+        self.assertEqual(reponse.status_code, 200)
+        self.assertEqual(TacheExport.objects.get(id=reponse.json()['id']).fichier.name, premiere.fichier.name)
+
+        version = cache_reponses.versions(['fiches'])[0]
+        with mock.patch('time.time', return_value=version + 10), self.captureOnCommitCallbacks(execute=True):
+            Personne.objects.create(nom='Rakoto')
+        reponse = self.demander()
+        self.assertEqual(reponse.status_code, 202)
+        self.assertEqual(reponse.json()['statut'], TacheExport.PENDING)
+
+    def test_expiration_supprime_le_fichier_partage_une_fois(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        from .models import TacheExport
+        from .taches_export import nettoyer_expirees
+        self.demander()
+        tache = self.produire()
+        copie = self.demander().json()['id']
+        stockage = tache.fichier.storage
+        self.assertTrue(stockage.exists(tache.fichier.name))
+
+        TacheExport.objects.update(expire_le=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(self.client.get(f"/bio/api/exports/{copie}/fichier/").status_code, 404)
+        self.assertEqual(nettoyer_expirees(), 2)
+
+        self.assertFalse(TacheExport.objects.exists())
+        self.assertFalse(stockage.exists(tache.fichier.name))
+
+
+class DossiersPdfTests(BioTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = self.connecter()
+
+    def photo(self):
+        import io
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from PIL import Image
+        buffer = io.BytesIO()
+        Image.new('RGB', (600, 800), 'grey').save(buffer, 'JPEG')
+        return SimpleUploadedFile('face.jpg', buffer.getvalue(), content_type='image/jpeg')
+
+    def test_dossier_d_une_fiche_avec_apercu_garde(self):
+        from .models import RenditionPhoto
+        personne = Personne.objects.create(nom='Rabé', prenom='Hery', photo_face=self.photo())
+
+        reponse = self.client.post(
+            '/bio/api/export/', {'format': 'pdf', 'id': personne.id, 'username': 'agent', 'password': 'pw!12345'},
+            format='json',
+        )
+
+        self.assertEqual(reponse.status_code, 200)
+        self.assertEqual(reponse['Content-Type'], 'application/pdf')
+        self.assertIn(f'dossier_{personne.id}.pdf', reponse['Content-Disposition'])
+        self.assertTrue(reponse.content.startswith(b'%PDF'))
+        self.assertTrue(RenditionPhoto.objects.filter(
+            personne=personne, champ='photo_face', type=RenditionPhoto.PREVIEW,
+        ).exists())
+
+    def test_zip_diffuse_termine_par_le_rapport(self):
+        import io
+        import json
+        import zipfile
+        from concurrent.futures import ThreadPoolExecutor
+        from django.conf import settings
+        from .dossiers import flux_zip
+        courte = Personne.objects.create(nom='Rasoa')
+        longue = Personne.objects.create(nom='Rakoto')
+        longue.anthropometrique.faits = 'Faits constatés.\n' * 400  # texte sur plusieurs pages
+        longue.anthropometrique.save()
+
+        # threads à la place du pool spawn : même interface map(), sans démarrer de processus
+        with ThreadPoolExecutor(1) as pool, mock.patch('bio.dossiers.get_pool', return_value=pool):
+            morceaux = list(flux_zip(Personne.objects.order_by('id')))
+
+        self.assertGreater(len(morceaux), 2)  # un morceau par dossier, puis la fin de l'archive
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(morceaux)))
+        self.assertEqual(
+            archive.namelist(), [f'dossier_{courte.id}.pdf', f'dossier_{longue.id}.pdf', 'rapport.json'],
+        )
+        rapport = json.loads(archive.read('rapport.json'))
+        self.assertEqual(rapport['dossiers'], 2)
+        self.assertGreater(rapport['pages'], 2)
+        self.assertEqual(rapport['processus'], settings.DOSSIER_PDF_PROCESSUS_WEB)
+
+
+class AuthentificationTests(BioTestCase):
+    def test_claims_et_requete_sans_base(self):
+        from rest_framework_simplejwt.tokens import AccessToken
+        utilisateur('chef', 'admin', is_staff=True)
+        client = APIClient()
+        token = AccessToken(jeton(client, 'chef'))
+        self.assertEqual((token['role'], token['perms'], token['is_staff']), ('admin', ['view_users'], True))
+
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        client.get('/bio/api/activites/?action=inconnue')  # version des jetons mise en cache
+        with self.assertNumQueries(0):
+            self.assertEqual(client.get('/bio/api/activites/?action=inconnue').status_code, 400)
+        self.assertEqual(self.connecter('simple').get('/bio/api/users/').status_code, 403)
+
+    def test_changement_de_role_revoque_les_jetons(self):
+        user = utilisateur('agent')
+        client = APIClient()
+        connexion = client.post('/bio/api/token/', {'username': 'agent', 'password': 'pw!12345'}, format='json').json()
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {connexion['access']}")
+        self.assertEqual(client.get('/bio/api/me/').status_code, 200)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            user.role = Role.objects.get_or_create(name='consulteur')[0]
+            user.save()
+        self.assertEqual(client.get('/bio/api/me/').status_code, 401)
+        refresh = APIClient().post('/bio/api/token/refresh/', {'refresh': connexion['refresh']}, format='json')
+        self.assertEqual(refresh.status_code, 401)
+
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {jeton(client, 'agent')}")
+        self.assertEqual(client.get('/bio/api/me/').json()['role']['name'], 'consulteur')
+
+    def test_connexion_seule_ne_revoque_pas(self):
+        client = self.connecter()
+        jeton(APIClient(), 'agent')  # met à jour last_login
+        self.assertEqual(client.get('/bio/api/me/').status_code, 200)
+
+    def test_changement_de_mot_de_passe_revoque_les_jetons(self):
+        client = self.connecter()
+        user = Utilisateur.objects.get(username='agent')
+        user.set_password('nouveau!123')
+        user.save()
+        self.assertEqual(client.get('/bio/api/me/').status_code, 401)
+
+
+class RolesTests(BioTestCase):
+    def codes(self, user):
+        return set(user.permissions.values_list('code', flat=True))
+
+    def test_permissions_du_role_a_la_creation_et_au_changement(self):
+        from . import roles
+        user = utilisateur('agent', 'admin')
+        self.assertEqual(self.codes(user), {'view_users'})
+        with mock.patch.object(roles, 'ids_modele', wraps=roles.ids_modele) as ids_modele:
+            user.email = 'nouveau@test.mg'
+            user.save()
+            ids_modele.assert_not_called()  # rôle inchangé : pas de provisionnement
+        user.role = Role.objects.get_or_create(name='saisisseur')[0]
+        user.save()
+        self.assertIn('view_personnes', self.codes(user))
+
+    def test_superuser(self):
+        user = Utilisateur.objects.create_superuser(username='root', email='root@test.mg', password='pw!12345')
+        self.assertEqual(self.codes(user), {'view_users'})
+
+    def test_creation_par_l_api(self):
+        client = self.connecter('chef', 'admin')
+        reponse = client.post('/bio/api/create-user/', {
+            'username': 'nouveau', 'email': 'nouveau@test.mg', 'password': 'pw!12345',
+            'confirm_password': 'pw!12345', 'role': 'saisisseur',
+        }, format='json')
+        self.assertEqual(reponse.status_code, 201)
+        self.assertEqual(self.codes(Utilisateur.objects.get(username='nouveau')), {'view_personnes'})
+
+
+class ActivitesTests(BioTestCase):
+    def setUp(self):
+        super().setUp()
+        from datetime import datetime, timezone as tz
+        self.client = self.connecter('chef', 'admin', is_staff=True)
+        self.auteur = utilisateur('auteur')
+        anciennes = [
+            (datetime(2024, 1, 10, tzinfo=tz.utc), 'export', 'Export csv : toutes les fiches.'),
+            (datetime(2024, 1, 20, tzinfo=tz.utc), 'consultation', 'Fiche 1'),
+            (datetime(2024, 2, 5, tzinfo=tz.utc), 'export', 'Export pdf : fiche 2.'),
+        ]
+        Activite.objects.bulk_create([
+            Activite(utilisateur=self.auteur, action=action, description=description, date_heure=date_heure)
+            for date_heure, action, description in anciennes
+        ])
+        Activite.objects.create(utilisateur=self.auteur, action='recherche', description='Recherche texte : rabe')
+
+    def test_filtres_de_la_liste(self):
+        resultats = self.client.get('/bio/api/activites/', {'utilisateur': 'auteur', 'action': 'export'}).json()['results']
+        self.assertEqual([r['description'] for r in resultats], ['Export pdf : fiche 2.', 'Export csv : toutes les fiches.'])
+        resultats = self.client.get('/bio/api/activites/', {'debut': '2024-01-15', 'fin': '2024-02-05'}).json()['results']
+        self.assertEqual(len(resultats), 2)
+        self.assertEqual(self.client.get('/bio/api/activites/', {'debut': '15/01/2024'}).status_code, 400)
+
+    def test_archives_mensuelles(self):
+        import os
+        from datetime import datetime, timezone as tz
+        from django.conf import settings
+        from .activites import archiver
+        archives = archiver(datetime(2024, 6, 1, tzinfo=tz.utc), taille_lot=2)
+        self.assertEqual(archives, {(2024, 1): 2, (2024, 2): 1})
+        self.assertEqual(sorted(os.listdir(settings.ACTIVITE_ARCHIVE_ROOT)),
+                         ['activites_2024-01.ndjson.gz', 'activites_2024-02.ndjson.gz'])
+        self.assertEqual(list(Activite.objects.values_list('action', flat=True)), ['recherche'])
+
+        reponse = self.client.get('/bio/api/activites/archives/', {'action': 'export', 'q': 'PDF'})
+        self.assertEqual([(r['utilisateur'], r['description']) for r in reponse.json()['results']],
+                         [('auteur', 'Export pdf : fiche 2.')])
+        reponse = self.client.get('/bio/api/activites/archives/', {'fin': '2024-01-31'})
+        self.assertEqual(len(reponse.json()['results']), 2)
+
+    def test_reservees_aux_administrateurs(self):
+        self.assertEqual(self.connecter().get('/bio/api/activites/').status_code, 403)
@@ -0,0 +1,66 @@
+"""
+Normalisation du texte pour la recherche : minuscules, sans accents,
+ponctuation remplacée par des espaces ("Héry-Jean" -> "hery jean").
+"""
+import re
+import unicodedata
+
+_NON_ALNUM = re.compile(r'[^a-z0-9]+')
+
+
+def normaliser_texte(valeur):
+    if not valeur:
+        return ''
+    decompose = unicodedata.normalize('NFKD', str(valeur))
+    sans_accents = ''.join(c for c in decompose if not unicodedata.combining(c))
+    return _NON_ALNUM.sub(' ', sans_accents.lower()).strip()
+
+
+def mots(valeur):
+    return normaliser_texte(valeur).split()
+
+
+def normaliser_identifiant(valeur):
+    """Identifiant (CIN, NRPV) réduit à ses lettres et chiffres : '101 211-123' -> '101211123'."""
+    return normaliser_texte(valeur).replace(' ', '')
+
+
+# Réécritures phonétiques appliquées dans l'ordre (orthographe française et malgache)
+_REGLES_PHONETIQUES = [
+    (re.compile(r'eau|au'), 'o'),
+    (re.compile(r'ou'), 'u'),
+    (re.compile(r'o'), 'u'),           # le o malgache se prononce ou
+    (re.compile(r'ai|ei|e'), 'e'),
+    (re.compile(r'y'), 'i'),
+    (re.compile(r'ph'), 'f'),
+    (re.compile(r'th'), 't'),
+    (re.compile(r'sch|ch|sh'), 'x'),
+    (re.compile(r'gn'), 'n'),
+    (re.compile(r'qu|q|ck'), 'k'),
+    (re.compile(r'c(?=[eiy])'), 's'),
+    (re.compile(r'c'), 'k'),
+    (re.compile(r'gu(?=[ei])'), 'g'),
+    (re.compile(r'g(?=[ei])'), 'j'),
+    (re.compile(r'(?<=[aeiu])s(?=[aeiu])'), 'z'),
+    (re.compile(r'w'), 'v'),
+    (re.compile(r'h'), ''),
+    (re.compile(r'(?<=.)[tdsxz]$'), ''),  # consonnes finales muettes
+]
+
+
+def code_phonetique(valeur):
+    """
+    Code phonétique d'un nom : « Razafindrakoto », « Razafindrakotou » et
+    « RAZAFINDRAKOTO » donnent le même code. Première lettre conservée, voyelles
+    suivantes supprimées, lettres répétées fusionnées.
+    """
+    texte = normaliser_texte(valeur).replace(' ', '')
+    if not texte:
+        return ''
+    texte = re.sub(r'(.)\1+', r'\1', texte)
+    for motif, remplacement in _REGLES_PHONETIQUES:
+        texte = motif.sub(remplacement, texte)
+    if not texte:
+        return ''
+    code = texte[0] + re.sub(r'[aeiu]', '', texte[1:])
+    return re.sub(r'(.)\1+', r'\1', code)[:16]
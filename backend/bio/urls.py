@@ -1,5 +1,6 @@
 from django.urls import path
-from .views import UsersListView, create_user, me, PersonneCreateView, PersonneListView, DashboardViewSet, RecherchePhotoView, ExportDataView, ActiviteListView
+from .views import UsersListView, create_user, me, PersonneCreateView, PersonneListView, DashboardViewSet, RecherchePhotoView, ExportDataView, ActiviteListView, SanteView, EnrolementStatutView, RecherchePhotoLotView
+from .views import ExportTacheView, ExportTacheDetailView, ExportTacheFichierView, ExportJetonView, PersonneDetailView, ActiviteArchiveView, PersonneImportView
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 from .views import CustomTokenObtainPairView
 
@@ -10,11 +11,21 @@ urlpatterns = [
     path('api/create-user/', create_user, name="create-user"),
     path('api/me/', me, name='api-me'),
     path('api/personnes/', PersonneCreateView.as_view(), name='personne-list-create'),
+    path('api/personnes/import/', PersonneImportView.as_view(), name='personne-import'),
+    path('api/personnes/<int:pk>/', PersonneDetailView.as_view(), name='personne-detail'),
+    path('api/personnes/<int:pk>/enrolement/', EnrolementStatutView.as_view(), name='personne-enrolement'),
     path('api/listes/', PersonneListView.as_view(), name='personne-list'),  
     path('api/dashboard/', DashboardViewSet.as_view({'get': 'list'}), name='dashboard'),
     path('api/recherche-photo/', RecherchePhotoView.as_view(), name='recherche-photo'),
+    path('api/recherche-photo/lot/', RecherchePhotoLotView.as_view(), name='recherche-photo-lot'),
     path('api/export/', ExportDataView.as_view(), name='export-data'),
+    path('api/export/jeton/', ExportJetonView.as_view(), name='export-jeton'),
+    path('api/exports/', ExportTacheView.as_view(), name='export-taches'),
+    path('api/exports/<int:pk>/', ExportTacheDetailView.as_view(), name='export-tache'),
+    path('api/exports/<int:pk>/fichier/', ExportTacheFichierView.as_view(), name='export-tache-fichier'),
     path('api/activites/', ActiviteListView.as_view()),
+    path('api/activites/archives/', ActiviteArchiveView.as_view(), name='activites-archives'),
+    path('api/sante/', SanteView.as_view(), name='sante'),
 
 ]
    
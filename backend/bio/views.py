@@ -1,7 +1,7 @@
 from django.shortcuts import render
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from django.http import HttpResponse
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
 from rest_framework.permissions import IsAuthenticated
 from .models import Utilisateur, Role
 from .serializers import UtilisateurSerializer
@@ -9,39 +9,66 @@ from rest_framework.decorators import api_view, permission_classes
 from django.contrib.auth import get_user_model
 from rest_framework import status , permissions, generics, viewsets
 import json
+import logging
 from rest_framework.parsers import MultiPartParser, FormParser
 from django.shortcuts import get_object_or_404
-from rest_framework.exceptions import PermissionDenied
+from rest_framework.exceptions import PermissionDenied, ValidationError
+from django.db import transaction
 from django.db.models import Count, Q
 from datetime import date
+from django.utils.dateparse import parse_date
+from django.utils import timezone
 from rest_framework.generics import ListAPIView
-from .models import Personne, FicheAnthropometrique, FicheDactyloscopique, Role, Activite
-from .serializers import PersonneSerializer, FicheAnthroSerializer, FicheDactyloSerializer, ActiviteSerializer
-import insightface
-from django.core.files.storage import default_storage
-import os
+from .models import Personne, FicheAnthropometrique, FicheDactyloscopique, Role, Activite, TacheEnrolement, TacheExport
+from .serializers import (
+    PersonneSerializer, FicheAnthroSerializer, FicheDactyloSerializer, ActiviteSerializer,
+    CHAMPS_RESUME, champs_demandes, resumer_personnes, TacheExportSerializer, ConnexionSerializer,
+)
+from .faces import (
+    stats_modele, normaliser, meilleur_visage, decoder_image, detecter_visages, ImageIllisible,
+    analyser_photo, sauver_embedding, CHAMPS_PHOTO,
+)
+from .renditions import generer_renditions, generer_visage
+from .enrolement import creer_taches, statuts as statuts_enrolement
+from .gallery import rechercher, rechercher_lot
+from .pagination import KeysetPagination
+from .permissions import HasCustomPermission, HasRole
+from .recherche import rechercher as rechercher_texte
+from .doublons import chercher_doublons
+from .statistiques import tableau_de_bord
+from .cache_reponses import reponse_en_cache, stats_cache
+from .journal import enregistrer as journaliser, stats_journal
+from .import_fiches import ArchivePhotos, FormatInvalide, ImportFiches, LECTEURS, compter_lignes, format_fichier
+from .activites import (
+    FiltresInvalides as FiltresActiviteInvalides, chercher_archives, filtrer as filtrer_activites,
+    lire_filtres as lire_filtres_activite,
+)
+from .exports import FORMATS as EXPORTS_FLUX
+from .dossiers import dossier, flux_zip
+from .jetons import JetonExport, jeton_requete, jeton_valide
+from .taches_export import (
+    CONTENT_TYPES as CONTENT_TYPES_EXPORT, EXTENSIONS as EXTENSIONS_EXPORT, FiltresInvalides, creer_tache, lire_filtres,
+)
 import cv2
 import numpy as np
 from django.conf import settings
 from django.contrib.auth import authenticate
 import pandas as pd
 import io
-from xml.etree.ElementTree import Element, SubElement, tostring
-from reportlab.lib.pagesizes import A4
-from reportlab.pdfgen import canvas
+import zipfile
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
 from rest_framework_simplejwt.views import TokenObtainPairView
 
+logger = logging.getLogger(__name__)
+
 
 class UsersListView(APIView):
-    permission_classes = [IsAuthenticated]
+    permission_classes = [IsAuthenticated, HasCustomPermission.pour('view_users')]
 
     def get(self, request):
-        user = request.user
-        if user.has_permission('view_users'):
-            users = Utilisateur.objects.all()
-            serializer = UtilisateurSerializer(users, many=True)
-            return Response(serializer.data)
-        return Response({"detail": "Permission refusée"}, status=403)
+        users = Utilisateur.objects.select_related('role')
+        serializer = UtilisateurSerializer(users, many=True)
+        return Response(serializer.data)
 
 
 
@@ -49,20 +76,16 @@ User = get_user_model()
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@reponse_en_cache('me', portees=('utilisateur:{user}',), par_utilisateur=True)
 def me(request):
-    user = request.user
+    user = Utilisateur.objects.select_related('role').get(pk=request.user.pk)
     serializer = UtilisateurSerializer(user)
     return Response(serializer.data)
 
     
 @api_view(['POST'])
-@permission_classes([IsAuthenticated])
+@permission_classes([IsAuthenticated, HasRole.pour('admin')])
 def create_user(request):
-    current_user = request.user
-
-    if not (current_user.is_superuser or (current_user.role and current_user.role.name == "admin")):
-        return Response({"detail": "Accès refusé"}, status=status.HTTP_403_FORBIDDEN)
-
     data = request.data
     if data["password"] != data["confirm_password"]:
         return Response({"detail": "Mots de passe différents"}, status=status.HTTP_400_BAD_REQUEST)
@@ -86,20 +109,15 @@ def create_user(request):
 
 
 
-class CanCreatePersonne(permissions.BasePermission):
+def _nom_complet(personne):
+    return ' '.join(filter(None, [personne.nom, personne.prenom])) or '-'
+
+
+class CanCreatePersonne(HasRole):
     """
     Seuls les users ayant role 'admin' ou 'saisisseur' ou les superusers peuvent créer.
     """
-    def has_permission(self, request, view):
-        user = request.user
-        if not user or not user.is_authenticated:
-            return False
-        if user.is_superuser:
-            return True
-        
-        role = getattr(user, 'role', None)
-        role_name = getattr(role, 'name', role) if role is not None else None
-        return role_name in ('admin','saisisseur')
+    roles = ('admin', 'saisisseur')
 
 class PersonneCreateView(APIView):
     permission_classes = [permissions.IsAuthenticated, CanCreatePersonne]
@@ -141,41 +159,185 @@ class PersonneCreateView(APIView):
         if 'photo_longue' in request.FILES:
             personne_fields['photo_longue'] = request.FILES['photo_longue']
 
-    # créer Personne en liant created_by
-        personne = Personne.objects.create(created_by=request.user, **personne_fields)
+    # créer Personne en liant created_by, puis ses fiches, en une transaction :
+    # l'index de recherche n'est recalculé qu'une fois, au commit
+        with transaction.atomic():
+            personne = Personne.objects.create(created_by_id=request.user.pk, **personne_fields)
 
-    # créer/mettre à jour fiches associées
-        FicheAnthropometrique.objects.update_or_create(
-            personne=personne,
-            defaults={k: v for k, v in anthropo_data.items()}
-        )
+            FicheAnthropometrique.objects.update_or_create(
+                personne=personne,
+                defaults={k: v for k, v in anthropo_data.items()}
+            )
 
-        FicheDactyloscopique.objects.update_or_create(
-            personne=personne,
-            defaults={k: v for k, v in dactylo_data.items()}
-        )
+            dactylo, _ = FicheDactyloscopique.objects.update_or_create(
+                personne=personne,
+                defaults={k: v for k, v in dactylo_data.items()}
+            )
+
+    # miniature et aperçu servis aux listes à la place des originaux ; une photo illisible
+    # n'empêche pas l'enregistrement (le worker d'enrôlement la marquera en erreur)
+        for champ in CHAMPS_PHOTO:
+            try:
+                generer_renditions(personne, [champ])
+            except (OSError, ValueError):
+                continue
+
+    # embeddings calculés en tâche de fond (manage.py enrollment_worker)
+        statuts = creer_taches(personne)
+
+    # doublons probables, confirmés par le visage seulement sur demande (calcul synchrone)
+        face = None
+        if personne.photo_face and str(data.get('verifier_visage', '')).lower() in ('1', 'true'):
+            face = self.visage_face(personne, statuts)
+        doublons = chercher_doublons(personne, dactylo.cin_normalise, face)
+
+        journaliser(request, 'ajout_fiche', f"Fiche {personne.id} ajoutée ({_nom_complet(personne)}).")
 
         serializer = PersonneSerializer(personne, context={'request': request})
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
+        data = serializer.data
+        data['enrolement'] = statuts
+        data['doublons'] = doublons
+        return Response(data, status=status.HTTP_201_CREATED)
+
+    def visage_face(self, personne, statuts):
+        """Embedding de la photo de face calculé tout de suite ; le worker n'a plus à le faire."""
+        try:
+            face = analyser_photo(personne.photo_face.path)
+        except ImageIllisible:
+            return None
+        statut = sauver_embedding(personne.id, 'photo_face', face)
+        if face is not None:
+            generer_visage(personne, 'photo_face', face.bbox)
+        TacheEnrolement.objects.filter(personne=personne, champ='photo_face').update(statut=statut)
+        statuts['photo_face'] = statut
+        return face
 
 
 
+class PersonneDetailView(APIView):
+    """Suppression d'une fiche (administrateurs) ; fiches liées, photos et embeddings suivent en cascade."""
+    permission_classes = [permissions.IsAuthenticated, HasRole.pour('admin')]
+
+    def delete(self, request, pk):
+        personne = get_object_or_404(Personne.objects.only('id', 'nom', 'prenom'), pk=pk)
+        description = f"Fiche {personne.id} supprimée ({_nom_complet(personne)})."
+        personne.delete()
+        journaliser(request, 'suppression_fiche', description)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class PersonneImportView(APIView):
+    """
+    Import en masse : 'fichier' (CSV ou NDJSON au format des exports), 'photos' (ZIP, facultatif),
+    'format' (facultatif, sinon d'après l'extension). Rapport : lignes importées, rejets par ligne,
+    lignes par seconde. Au-delà de IMPORT_API_MAX_LIGNES, utiliser manage.py import_fiches.
+    """
+    permission_classes = [permissions.IsAuthenticated, CanCreatePersonne]
+    parser_classes = [MultiPartParser, FormParser]
+
+    def post(self, request):
+        fichier = request.FILES.get('fichier')
+        if not fichier:
+            return Response({"error": "Aucun fichier envoyé."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            format_ = format_fichier(fichier.name, request.data.get('format'))
+        except FormatInvalide as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        total = compter_lignes(fichier.file, format_)
+        if total > settings.IMPORT_API_MAX_LIGNES:
+            return Response(
+                {"error": f"{total} lignes : {settings.IMPORT_API_MAX_LIGNES} au maximum par appel, "
+                          f"utiliser manage.py import_fiches."},
+                status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            )
+        photos = None
+        if 'photos' in request.FILES:
+            try:
+                photos = ArchivePhotos(request.FILES['photos'].file)
+            except zipfile.BadZipFile:
+                return Response({"error": "L'archive de photos n'est pas un ZIP valide."}, status=status.HTTP_400_BAD_REQUEST)
+
+        rapport = ImportFiches(utilisateur_id=request.user.pk, photos=photos).importer(LECTEURS[format_](fichier.file))
+        journaliser(request, 'ajout_fiche', f"Import de {rapport['importees']} fiche(s) ({rapport['rejetees']} rejet(s)).")
+        return Response(rapport)
+
+
+class EnrolementStatutView(APIView):
+    """
+    Statut du calcul des embeddings pour chaque photo d'une fiche.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, pk):
+        personne = get_object_or_404(Personne, pk=pk)
+        return Response({"id": personne.id, "enrolement": statuts_enrolement(personne.id)})
+
+
+CHAMPS_COLONNES = {f.name for f in Personne._meta.concrete_fields}
+
+
 class PersonneListView(generics.ListAPIView):
-    queryset = Personne.objects.all()
+    """
+    Liste des fiches, du plus récent au plus ancien.
+    ?fields=id,nom,prenom : champs choisis (jointures et photos chargées seulement si demandées) ;
+    ?vue=resume : représentation compacte lue directement en .values().
+    """
     serializer_class = PersonneSerializer
     permission_classes = [permissions.IsAuthenticated]  # tous les users connectés
+    pagination_class = KeysetPagination  # ?page_size=…&cursor=…, du plus récent au plus ancien
+
+    def vue_resume(self):
+        return self.request.query_params.get('vue') == 'resume'
 
     def get_queryset(self):
-        qs = super().get_queryset()
-        search = self.request.query_params.get('search', None)
-        if search:
-            qs = qs.filter(
-                Q(nom__icontains=search) |
-                Q(prenom__icontains=search) |
-                Q(lieu_naissance__icontains=search) |
-                Q(domicile__icontains=search)
+        if self.vue_resume():
+            return Personne.objects.values(*CHAMPS_RESUME)
+
+        champs = champs_demandes(self.request)
+        if champs is None:
+            return (
+                Personne.objects
+                .select_related('anthropometrique', 'dactyloscopique')
+                .prefetch_related('renditions')
             )
-        return qs
+        queryset = Personne.objects.all()
+        fiches = [f for f in ('anthropometrique', 'dactyloscopique') if f in champs]
+        if fiches:
+            queryset = queryset.select_related(*fiches)
+        if 'renditions' in champs:
+            queryset = queryset.prefetch_related('renditions')
+        # colonnes lues : champs demandés + clés de pagination
+        colonnes = {'id', 'date_creation'} | {'date_naissance' for c in champs if c == 'age'}
+        colonnes |= {c for c in champs if c in CHAMPS_COLONNES}
+        return queryset.only(*colonnes, *fiches)
+
+    def get(self, request, *args, **kwargs):
+        # avant le cache : une page servie depuis le cache est aussi une consultation
+        search = request.query_params.get('search')
+        if search:
+            journaliser(request, 'recherche', f"Recherche texte : {search}")
+        else:
+            journaliser(request, 'consultation', f"Liste des fiches {request.query_params.urlencode()}".rstrip())
+        return super().get(request, *args, **kwargs)
+
+    def serialiser(self, lignes):
+        if self.vue_resume():
+            return resumer_personnes(lignes, self.request)
+        return self.get_serializer(lignes, many=True).data
+
+    # seule la première page sans recherche est en cache : c'est celle que chaque utilisateur ouvre
+    @reponse_en_cache('liste', condition=lambda r: not r.query_params.get('cursor') and not r.query_params.get('search'))
+    def list(self, request, *args, **kwargs):
+        search = request.query_params.get('search', None)
+        if not search:
+            page = self.paginate_queryset(self.get_queryset())
+            return self.get_paginated_response(self.serialiser(page))
+
+        # recherche : index TermeRecherche, résultats classés par pertinence, curseur (score, id)
+        ids = self.paginator.paginer_classement(request, lambda limite, apres: rechercher_texte(search, limite, apres))
+        personnes = {self.paginator.valeur(p, 'id'): p for p in self.get_queryset().filter(id__in=ids)}
+        return self.get_paginated_response(self.serialiser([personnes[i] for i in ids if i in personnes]))
 
 
 class DashboardViewSet(viewsets.ViewSet):
@@ -185,49 +347,56 @@ class DashboardViewSet(viewsets.ViewSet):
     """
     permission_classes = [permissions.IsAuthenticated]  # tous les users connectés ont accès
 
+    @reponse_en_cache('dashboard')
     def list(self, request):
-        personnes = Personne.objects.all()
-
-        # --- Total fiches ---
-        total = personnes.count()
-
-        # --- Fiches par date ---
-        fiches_par_date = (
-            personnes
-            .extra(select={'date': "date(date_creation)"})
-            .values('date')
-            .annotate(count=Count('id'))
-            .order_by('date')
-        )
-
-        # --- Répartition par âge ---
-        fiches_par_age = []
-        for p in personnes:
-            if p.date_naissance:
-                age = date.today().year - p.date_naissance.year
-                fiches_par_age.append(age)
-
-        age_stats = {}
-        for a in fiches_par_age:
-            age_stats[a] = age_stats.get(a, 0) + 1
-        fiches_par_age = [{"age": k, "count": v} for k, v in age_stats.items()]
-
-        # --- Répartition par genre ---
-        fiches_par_genre = (
-            personnes.values('genre')
-            .annotate(value=Count('id'))
-        )
-        fiches_par_genre = [
-            {"name": f["genre"] or "Non spécifié", "value": f["value"]}
-            for f in fiches_par_genre
-        ]
+        # ?debut=AAAA-MM-JJ&fin=AAAA-MM-JJ : fiches créées dans la période (bornes incluses)
+        bornes = {}
+        for nom in ('debut', 'fin'):
+            valeur = request.query_params.get(nom)
+            if valeur:
+                try:
+                    bornes[nom] = parse_date(valeur)
+                except ValueError:
+                    bornes[nom] = None
+                if bornes[nom] is None:
+                    return Response({"detail": f"Date '{nom}' invalide (AAAA-MM-JJ)."}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(tableau_de_bord(**bornes))
+
+def _parametres_recherche(request):
+    """top_k, seuil et nprobe de la requête ; ValueError si invalides."""
+    try:
+        top_k = int(request.data.get('top_k', settings.FACE_SEARCH_TOP_K))
+        seuil = float(request.data.get('threshold', settings.FACE_MATCH_THRESHOLD))
+        nprobe = int(request.data['nprobe']) if request.data.get('nprobe') else None
+    except (TypeError, ValueError):
+        raise ValueError("Paramètres top_k/threshold/nprobe invalides.")
+    return max(1, min(top_k, settings.FACE_SEARCH_MAX_TOP_K)), seuil, nprobe
+
+
+def _resultats_recherche(request, correspondances_par_probe):
+    """Transforme les correspondances de plusieurs probes en résultats, avec une seule requête Personne."""
+    ids = {pid for correspondances in correspondances_par_probe for pid, _, _ in correspondances}
+    personnes = Personne.objects.in_bulk(ids)
+
+    resultats = []
+    for correspondances in correspondances_par_probe:
+        results = []
+        for personne_id, similarity, champ in correspondances:
+            personne = personnes.get(personne_id)
+            if personne is None:
+                continue  # supprimée depuis le chargement de la galerie
+            p = getattr(personne, champ)
+            results.append({
+                "id": personne.id,
+                "nom": personne.nom,
+                "prenom": personne.prenom,
+                "similarity": similarity,
+                "photo": request.build_absolute_uri(p.url) if p else None
+            })
+        resultats.append(results)
+    return resultats
 
-        return Response({
-            "total": total,
-            "par_date": list(fiches_par_date),
-            "par_age": fiches_par_age,
-            "par_genre": fiches_par_genre,
-        })
 
 class RecherchePhotoView(APIView):
     def post(self, request):
@@ -235,103 +404,153 @@ class RecherchePhotoView(APIView):
         if not photo_file:
             return Response({"error": "Aucune photo envoyée."}, status=400)
 
-        tmp_path = default_storage.save('tmp_search.jpg', photo_file)
-        tmp_full_path = os.path.join(settings.MEDIA_ROOT, tmp_path)
-
         try:
-            model = insightface.app.FaceAnalysis(providers=['CPUExecutionProvider'])
-            model.prepare(ctx_id=-1, det_size=(640, 640))
+            top_k, seuil, nprobe = _parametres_recherche(request)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
 
-            img = cv2.imread(tmp_full_path)
-            if img is None:
-                return Response({"error": "Impossible de lire la photo envoyée."}, status=400)
+        try:
+            # décodage en mémoire : rien n'est écrit dans MEDIA_ROOT
+            img, _ = decoder_image(photo_file, settings.FACE_PROBE_MAX_SIDE)
+        except ImageIllisible:
+            return Response({"error": "Impossible de lire la photo envoyée."}, status=400)
 
-            faces = model.get(img)
-            print("👤 Visages détectés dans la photo envoyée :", len(faces))
+        try:
+            faces = detecter_visages(img, settings.FACE_PROBE_DET_SIZES)
             if len(faces) == 0:
                 return Response({"results": [], "message": "Aucun visage détecté."})
 
-            target_embedding = faces[0].embedding
-            results = []
-
-            base_dir = os.path.join(settings.BASE_DIR, "backend", "photos")
-
-            for personne in Personne.objects.all():
-                photos_potentielles = [
-                    personne.photo_profil,
-                    personne.photo_face,
-                    personne.photo_longue
-                ]
-
-                for p in photos_potentielles:
-                    if not p:
-                        continue
+            target_embedding = normaliser(meilleur_visage(faces).embedding)
 
-                    photo_path = os.path.join(settings.BASE_DIR, 'photos', os.path.basename(str(p)))
+            # comparaison aux embeddings stockés à l'enrôlement (galerie exacte ou index IVF)
+            correspondances = rechercher(target_embedding, top_k=top_k, seuil=seuil, nprobe=nprobe)
+            results = _resultats_recherche(request, [correspondances])[0]
+            journaliser(request, 'recherche', f"Recherche photo : {len(results)} résultat(s).")
+            return Response({"results": results})
 
-                    print("🔍 Test photo:", photo_path)
+        except Exception as e:
+            logger.exception("Erreur pendant la recherche photo")
+            return Response({"error": str(e)}, status=500)
 
-                    if not os.path.exists(photo_path):
-                        continue
 
-                    db_img = cv2.imread(photo_path)
-                    if db_img is None:
-                        continue
+class RecherchePhotoLotView(APIView):
+    """
+    Recherche de plusieurs images en un appel (ex. série d'images de vidéosurveillance) :
+    chaque visage détecté devient un probe, tous les probes sont comparés à la galerie
+    en un seul produit matrice-matrice.
+    """
+    def post(self, request):
+        fichiers = request.FILES.getlist('photos')
+        if not fichiers:
+            return Response({"error": "Aucune photo envoyée."}, status=400)
+        if len(fichiers) > settings.FACE_BATCH_MAX_IMAGES:
+            return Response(
+                {"error": f"{settings.FACE_BATCH_MAX_IMAGES} photos au maximum par appel."}, status=400
+            )
 
-                    db_faces = model.get(db_img)
-                    print(f"📸 {photo_path} → {len(db_faces)} visage(s) détecté(s)")
-                    if len(db_faces) == 0:
-                        continue
+        try:
+            top_k, seuil, nprobe = _parametres_recherche(request)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+
+        images = []
+        probes = []
+        for i, fichier in enumerate(fichiers):
+            image = {"image": i, "nom_fichier": fichier.name, "visages": []}
+            images.append(image)
+            try:
+                img, echelle = decoder_image(fichier, settings.FACE_PROBE_MAX_SIDE)
+            except ImageIllisible:
+                image["error"] = "Impossible de lire la photo envoyée."
+                continue
+            for j, face in enumerate(detecter_visages(img, settings.FACE_PROBE_DET_SIZES)):
+                image["visages"].append({
+                    "visage": j,
+                    "bbox": [float(x) / echelle for x in face.bbox],
+                    "det_score": float(face.det_score),
+                })
+                probes.append(normaliser(face.embedding))
+
+        correspondances = rechercher_lot(np.array(probes), top_k=top_k, seuil=seuil, nprobe=nprobe)
+        resultats = iter(_resultats_recherche(request, correspondances))
+        for image in images:
+            for visage in image["visages"]:
+                visage["results"] = next(resultats)
+        journaliser(request, 'recherche', f"Recherche photo par lot : {len(fichiers)} image(s), {len(probes)} visage(s).")
+
+        return Response({"images": images, "nb_visages": len(probes)})
+
+class SanteView(APIView):
+    """
+    État du processus : chargement et mémoire du modèle de reconnaissance faciale.
+    """
+    permission_classes = [permissions.IsAdminUser]
 
-                    db_embedding = db_faces[0].embedding
-                    similarity = np.dot(target_embedding, db_embedding) / (
-                        np.linalg.norm(target_embedding) * np.linalg.norm(db_embedding)
-                    )
+    def get(self, request):
+        return Response({"modele_visage": stats_modele(), "cache_reponses": stats_cache(), "journal": stats_journal()})
 
-                    print(f"📏 Similarité avec {personne.nom} {personne.prenom}: {similarity:.2f}")
+def _confirmation_export(request):
+    """
+    Un export exige une confirmation : jeton d'export valide (voir ExportJetonView)
+    ou, à défaut, identifiants vérifiés à chaque appel. Retourne une Response d'erreur ou None.
+    """
+    if jeton_valide(request):
+        return None
+    if jeton_requete(request):
+        return Response({'error': "Jeton d'export invalide ou expiré"}, status=status.HTTP_401_UNAUTHORIZED)
+    user = authenticate(username=request.data.get('username'), password=request.data.get('password'))
+    if user is None:
+        return Response({'error': 'Identifiants invalides'}, status=status.HTTP_401_UNAUTHORIZED)
+    return None
 
-                    if similarity > 0.6:  # seuil
-                        results.append({
-                            "id": personne.id,
-                            "nom": personne.nom,
-                            "prenom": personne.prenom,
-                            "similarity": float(similarity),
-                            "photo": request.build_absolute_uri(p.url)
-                        })
-                        break  # on passe à la personne suivante dès qu’une correspondance est trouvée
 
-            results.sort(key=lambda x: x["similarity"], reverse=True)
-            return Response({"results": results})
+class ExportJetonView(APIView):
+    """
+    Confirme le mot de passe de l'utilisateur connecté une fois et délivre un jeton
+    d'export de courte durée, à présenter ensuite dans l'en-tête X-Export-Token.
+    """
+    permission_classes = [permissions.IsAuthenticated]
 
-        except Exception as e:
-            print("Erreur pendant la recherche photo :", e)
-            return Response({"error": str(e)}, status=500)
-        finally:
-            if default_storage.exists(tmp_path):
-                default_storage.delete(tmp_path)
+    def post(self, request):
+        utilisateur = Utilisateur.objects.get(pk=request.user.pk)
+        if not utilisateur.check_password(request.data.get('password') or ''):
+            return Response({'error': 'Mot de passe invalide'}, status=status.HTTP_401_UNAUTHORIZED)
+        jeton = JetonExport.for_user(utilisateur)
+        return Response({
+            'export_token': str(jeton),
+            'expire_dans': int(JetonExport.lifetime.total_seconds()),
+        })
 
 #export des données 
 class ExportDataView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def post(self, request, format=None):
-        username = request.data.get('username')
-        password = request.data.get('password')
         format_type = request.data.get('format')
         fiche_id = request.data.get('id')  # ✅ récupère l'ID s'il existe
 
-        # Vérification des identifiants
-        user = authenticate(username=username, password=password)
-        if user is None:
-            return Response({'error': 'Identifiants invalides'}, status=status.HTTP_401_UNAUTHORIZED)
+        # Confirmation : jeton d'export, ou à défaut identifiants
+        erreur = _confirmation_export(request)
+        if erreur:
+            return erreur
 
         # Si un ID est fourni → exporter une seule fiche
         if fiche_id:
-            personnes = Personne.objects.filter(id=fiche_id).values()
-            if not personnes.exists():
+            queryset = Personne.objects.filter(id=fiche_id)
+            if not queryset.exists():
                 return Response({'error': 'Fiche introuvable'}, status=status.HTTP_404_NOT_FOUND)
         else:
-            personnes = Personne.objects.all().values()
+            queryset = Personne.objects.all()
+        personnes = queryset.values()
+        if format_type in EXPORTS_FLUX or format_type in ('excel', 'pdf'):
+            journaliser(request, 'export', f"Export {format_type} : {f'fiche {fiche_id}' if fiche_id else 'toutes les fiches'}.")
+
+        # --- EXPORTS EN FLUX (CSV, NDJSON, XML) : fiches liées incluses, mémoire constante ---
+        if format_type in EXPORTS_FLUX:
+            generateur, content_type, extension = EXPORTS_FLUX[format_type]
+            response = StreamingHttpResponse(generateur(queryset), content_type=content_type)
+            response['Content-Disposition'] = f'attachment; filename="export.{extension}"'
+            return response
 
         # --- EXPORT EXCEL ---
         if format_type == 'excel':
@@ -343,61 +562,130 @@ class ExportDataView(APIView):
             response['Content-Disposition'] = 'attachment; filename="export.xlsx"'
             return response
 
-        # --- EXPORT XML ---
-        elif format_type == 'xml':
-            root = Element('Personnes')
-            for p in personnes:
-                person_el = SubElement(root, 'Personne')
-                for key, val in p.items():
-                    SubElement(person_el, key).text = str(val)
-            xml_data = tostring(root, encoding='utf-8')
-            response = HttpResponse(xml_data, content_type='application/xml')
-            response['Content-Disposition'] = 'attachment; filename="export.xml"'
-            return response
-
-        # --- EXPORT PDF ---
+        # --- EXPORT PDF : un dossier par personne ; plusieurs fiches -> ZIP diffusé au fil du rendu ---
         elif format_type == 'pdf':
-            buffer = io.BytesIO()
-            pdf = canvas.Canvas(buffer, pagesize=A4)
-            pdf.setFont("Helvetica", 10)
-            y = 800
-            for p in personnes:
-                text = ", ".join(f"{k}: {v}" for k, v in p.items())
-                pdf.drawString(50, y, text)
-                y -= 20
-                if y < 50:
-                    pdf.showPage()
-                    y = 800
-            pdf.save()
-            buffer.seek(0)
-            response = HttpResponse(buffer, content_type='application/pdf')
-            response['Content-Disposition'] = 'attachment; filename="export.pdf"'
+            if fiche_id:
+                rendu = dossier(fiche_id)
+                if rendu is None:
+                    return Response({'error': 'Fiche introuvable'}, status=status.HTTP_404_NOT_FOUND)
+                nom, octets, _ = rendu
+                response = HttpResponse(octets, content_type='application/pdf')
+                response['Content-Disposition'] = f'attachment; filename="{nom}"'
+                return response
+            response = StreamingHttpResponse(flux_zip(queryset), content_type='application/zip')
+            response['Content-Disposition'] = 'attachment; filename="dossiers.zip"'
             return response
 
         else:
             return Response({'error': 'Format invalide'}, status=status.HTTP_400_BAD_REQUEST)
 
+class ExportTacheView(APIView):
+    """
+    POST : demande un export en tâche de fond (format, filtres ids/debut/fin) ;
+    réponse immédiate avec l'id de la tâche, à suivre sur api/exports/<id>/.
+    GET : exports de l'utilisateur encore conservés.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        taches = TacheExport.objects.filter(utilisateur_id=request.user.pk).order_by('-date_creation')[:50]
+        return Response(TacheExportSerializer(taches, many=True, context={'request': request}).data)
+
+    def post(self, request):
+        erreur = _confirmation_export(request)
+        if erreur:
+            return erreur
+
+        format_type = request.data.get('format')
+        if format_type not in EXTENSIONS_EXPORT:
+            return Response({'error': 'Format invalide'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            filtres = lire_filtres(request.data)
+        except FiltresInvalides as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        tache = creer_tache(request.user.pk, format_type, filtres)
+        journaliser(request, 'export', f"Export {format_type} demandé (tâche {tache.id}, filtres {filtres}).")
+        code = status.HTTP_200_OK if tache.statut == TacheExport.DONE else status.HTTP_202_ACCEPTED
+        return Response(TacheExportSerializer(tache, context={'request': request}).data, status=code)
+
+
+class ExportTacheDetailView(APIView):
+    """Progression d'un export ; l'URL de téléchargement apparaît une fois terminé."""
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, pk):
+        tache = get_object_or_404(TacheExport, pk=pk, utilisateur_id=request.user.pk)
+        return Response(TacheExportSerializer(tache, context={'request': request}).data)
+
+
+class ExportTacheFichierView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, pk):
+        tache = get_object_or_404(
+            TacheExport, pk=pk, utilisateur_id=request.user.pk,
+            statut=TacheExport.DONE, expire_le__gt=timezone.now(),
+        )
+        nom = f"export_{tache.id}.{EXTENSIONS_EXPORT[tache.format]}"
+        journaliser(request, 'export', f"Téléchargement de l'export {tache.id} ({tache.format}).")
+        return FileResponse(
+            tache.fichier.open('rb'), as_attachment=True, filename=nom,
+            content_type=CONTENT_TYPES_EXPORT[tache.format],
+        )
+
 class CustomTokenObtainPairView(TokenObtainPairView):
     """
     Personnalisation du login JWT pour enregistrer une activité.
     """
+    serializer_class = ConnexionSerializer
+
     def post(self, request, *args, **kwargs):
-        response = super().post(request, *args, **kwargs)
-        if response.status_code == 200:
-            username = request.data.get("username")
-            from django.contrib.auth.models import User
-            try:
-                user = Utilisateur.objects.get(username=username)
-                Activite.objects.create(
-                    utilisateur=user,
-                    action="connexion",
-                    description=f"{user.username} s'est connecté."
-                )
-            except Utilisateur.DoesNotExist:
-                pass
-        return response
+        # comme TokenObtainPairView.post, en gardant l'utilisateur authentifié par le serializer
+        serializer = self.get_serializer(data=request.data)
+        try:
+            serializer.is_valid(raise_exception=True)
+        except TokenError as e:
+            raise InvalidToken(e.args[0])
+        user = serializer.user
+        journaliser(user.pk, 'connexion', f"{user.username} s'est connecté.")
+        return Response(serializer.validated_data, status=status.HTTP_200_OK)
+
+class ActivitePagination(KeysetPagination):
+    champ = 'date_heure'
+
 
 class ActiviteListView(generics.ListAPIView):
-    queryset = Activite.objects.all()
+    """
+    Journal d'activité, du plus récent au plus ancien, par curseur.
+    Filtres : ?utilisateur=<id ou username>&action=…&debut=AAAA-MM-JJ&fin=AAAA-MM-JJ.
+    """
     serializer_class = ActiviteSerializer
-    permission_classes = [permissions.IsAdminUser]
\ No newline at end of file
+    permission_classes = [permissions.IsAdminUser]
+    pagination_class = ActivitePagination
+
+    def get_queryset(self):
+        try:
+            filtres = lire_filtres_activite(self.request.query_params)
+        except FiltresActiviteInvalides as e:
+            raise ValidationError({'detail': str(e)})
+        return filtrer_activites(Activite.objects.select_related('utilisateur'), filtres)
+
+
+class ActiviteArchiveView(APIView):
+    """
+    Recherche dans les archives mensuelles du journal (manage.py archive_activity) :
+    mêmes filtres que api/activites/, plus ?q= (texte de la description) et ?limite=.
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        try:
+            filtres = lire_filtres_activite(request.query_params)
+            limite = max(1, min(int(request.query_params.get('limite', 500)), 5000))
+        except FiltresActiviteInvalides as e:
+            return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except ValueError:
+            return Response({'detail': "limite doit être un entier."}, status=status.HTTP_400_BAD_REQUEST)
+        lignes = chercher_archives(filtres, texte=request.query_params.get('q'), limite=limite)
+        return Response({"results": lignes})
\ No newline at end of file